@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, make_response, g
 from app.services.auth_service import AuthService
-from app.core.security import token_required
+from app.core.metrics import metrics_token_required
+from app.core.security import token_required, auth_cache_stats
 
 auth_bp = Blueprint('auth_bp', __name__)
 
@@ -57,4 +58,10 @@ def get_current_user():
         'username': g.current_user.username,
         'subscription_status': g.current_user.subscription_status,
         'trial_ends_at': g.current_user.trial_ends_at.isoformat() + 'Z' if g.current_user.trial_ends_at else None
-    }), 200
\ No newline at end of file
+    }), 200
+
+@auth_bp.route('/cache-stats', methods=['GET'])
+@metrics_token_required
+def get_auth_cache_stats():
+    # Hit/miss counters of this worker's principal and token caches
+    return jsonify(auth_cache_stats()), 200
\ No newline at end of file
@@ -1,23 +1,79 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, Response, current_app, make_response, request, jsonify, g, stream_with_context
 from marshmallow import ValidationError
 from app.core.security import token_required
+from app.core.admission import admission_control
 from app.services.note_service import NoteService
-from app.schemas.note import note_schema
+from app.services.export_service import ExportService
+from app.services.import_service import ImportService
+from app.schemas.note import note_schema, note_update_schema
+from app.models.note import SUMMARY_FIELDS
+from app.core.exceptions import APIException
+from app.core.http_cache import immutable, make_etag, not_modified, with_validators
+from app.core.http_compression import accepts_gzip
+from app.services.change_log import ChangeLog
+from app.services.change_stream import ChangeStream
+from app.services.scene_files import SceneFiles
 
 notes_bp = Blueprint('notes_bp', __name__)
 
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson', ExportService.ndjson_chunks),
+    'json': ('application/json', 'json', ExportService.json_chunks),
+    'zip': ('application/zip', 'zip', ExportService.zip_chunks),
+}
+
+# Columns a listing may project with ?fields=
+LISTABLE_FIELDS = set(SUMMARY_FIELDS) | {'content'}
+
+def _requested_fields():
+    """Parses ?view=summary / ?fields=a,b into a column tuple (None = full notes)."""
+    fields = request.args.get('fields', '', type=str)
+    if fields:
+        requested = tuple(dict.fromkeys(f.strip() for f in fields.split(',') if f.strip()))
+        unknown = set(requested) - LISTABLE_FIELDS
+        if unknown:
+            raise APIException(f"Unknown fields: {', '.join(sorted(unknown))}", 400)
+        return ('id',) + tuple(f for f in requested if f != 'id')
+
+    if request.args.get('view', 'full', type=str) == 'summary':
+        return SUMMARY_FIELDS
+    return None
+
 @notes_bp.route('/', methods=['GET'])
 @token_required
 def get_all_notes():
     # Grab query parameters, setting safe defaults
-    page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    after = request.args.get('after', None, type=str)
     search = request.args.get('search', '', type=str)
-    
-    return jsonify(NoteService.get_all(g.current_user.id, page, per_page, search)), 200
+    # Ranked search pages by number: `after` (its next_cursor) or, for older clients, `page`
+    page = request.args.get('page', 1, type=int)
+    # Counting is a full scan of the user's notes; only do it when asked
+    include_total = request.args.get('include_total', 'false').lower() in ('1', 'true')
+    fields = _requested_fields()
+
+    # Every write bumps the user's change sequence, so (user, sequence, query) identifies
+    # the listing: an unchanged poll costs one primary-key lookup and no body.
+    etag = make_etag('list', g.current_user.id, ChangeLog.current(g.current_user.id), sorted(request.args.items(multi=True)))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    response = jsonify(NoteService.get_all(
+        g.current_user.id,
+        per_page=per_page,
+        after=after,
+        search_term=search,
+        page=page,
+        include_total=include_total,
+        # view=summary never reads the (possibly multi-MB) content column
+        fields=fields
+    ))
+    return with_validators(response, etag), 200
 
 @notes_bp.route('/', methods=['POST'])
 @token_required
+@admission_control('NOTE_MAX_BYTES')
 def create_note():
     json_data = request.get_json() or {}
     
@@ -30,48 +86,126 @@ def create_note():
 
     return jsonify(NoteService.create(g.current_user.id, valid_data)), 201
 
-@notes_bp.route('/<int:note_id>', methods=['GET'])
+@notes_bp.route('/changes', methods=['GET'])
+@token_required
+def watch_changes():
+    # Blocks until the user's notes change instead of having clients poll /sync.
+    # EventSource clients get an SSE stream; anything else a single long-poll answer.
+    since = request.args.get('since', None) or request.headers.get('Last-Event-ID') or None
+    since = ChangeLog.parse_cursor(since) if since is not None else None
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        return Response(
+            stream_with_context(ChangeStream.events(g.current_user.id, since)),
+            mimetype='text/event-stream',
+            # X-Accel-Buffering: nginx must pass events through as they are written
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    if since is None:
+        return jsonify({'cursor': ChangeLog.current(g.current_user.id), 'changed': False}), 200
+    timeout = request.args.get('timeout', current_app.config['CHANGE_FEED_TIMEOUT'], type=int)
+    timeout = min(max(timeout, 0), current_app.config['CHANGE_FEED_MAX_TIMEOUT'])
+    return jsonify(ChangeStream.wait(g.current_user.id, since, timeout)), 200
+
+@notes_bp.route('/files/<file_hash>', methods=['GET'])
+@token_required
+def get_file(file_hash):
+    # Content-addressed: the bytes behind a hash never change, so neither revalidate nor refetch
+    if request.if_none_match.contains_weak(file_hash):
+        return immutable(make_response('', 304), file_hash)
+    note_file = SceneFiles.get(g.current_user.id, file_hash)
+    response = immutable(Response(note_file.data, mimetype=note_file.mime_type), file_hash)
+    # Uploaded SVGs may carry script; never let them run on this origin
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+    return response
+
+@notes_bp.route('/<note_id>', methods=['GET'])
 @token_required
 def get_note(note_id):
+    # Check the validators with an indexed lookup before reading the body
+    updated_at, change_seq = NoteService.get_version(g.current_user.id, note_id)
+    etag = make_etag('note', note_id, change_seq, updated_at.isoformat() if updated_at else '')
+    cached = not_modified(etag, updated_at)
+    if cached:
+        return cached
+
     note = NoteService.get_by_id(g.current_user.id, note_id)
-    return jsonify(note.to_dict()), 200
+    return with_validators(jsonify(note.to_dict()), etag, updated_at), 200
 
-@notes_bp.route('/<int:note_id>', methods=['PUT'])
+@notes_bp.route('/<note_id>', methods=['PUT'])
 @token_required
+@admission_control('NOTE_MAX_BYTES')
 def update_note(note_id):
     json_data = request.get_json() or {}
     
     try:
         # partial=True means the frontend can send JUST the title to update it, 
         # without having to send the entire content and type all over again.
-        valid_data = note_schema.load(json_data, partial=True)
+        valid_data = note_update_schema.load(json_data, partial=True)
     except ValidationError as err:
         return jsonify({"message": "Validation failed", "errors": err.messages}), 400
 
-    return jsonify(NoteService.update(g.current_user.id, note_id, valid_data)), 200
+    note = NoteService.update(g.current_user.id, note_id, valid_data)
+    if 'patch' in valid_data:
+        # The client already has the body; echo only what it needs for the next patch
+        return jsonify({key: note[key] for key in ('id', 'title', 'type', 'updated_at', 'content_hash')}), 200
+    return jsonify(note), 200
 
-@notes_bp.route('/<int:note_id>', methods=['DELETE'])
+@notes_bp.route('/<note_id>', methods=['DELETE'])
 @token_required
+@admission_control()
 def delete_note(note_id):
     return jsonify(NoteService.delete(g.current_user.id, note_id)), 200
 
 @notes_bp.route('/export', methods=['GET'])
 @token_required
 def export_notes():
-    notes = NoteService.get_all(g.current_user.id)
-    export_data = [{'title': n['title'], 'content': n['content'], 'type': n['type']} for n in notes]
-    return jsonify(export_data), 200
+    # ndjson (default), json (array, re-importable) or zip (.md / .excalidraw files)
+    export_format = request.args.get('format', 'ndjson', type=str)
+    if export_format not in EXPORT_FORMATS:
+        raise APIException(f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}", 400)
+    # Resume an interrupted download right after the last note id received
+    after = request.args.get('after', None, type=str)
+    compress = request.args.get('gzip', 'false').lower() in ('1', 'true') and export_format != 'zip'
+    # Scene images as data URLs (self-contained, default) or as /files references
+    inline_files = request.args.get('files', 'inline', type=str) != 'reference'
+
+    mimetype, extension, chunker = EXPORT_FORMATS[export_format]
+    chunks = chunker(ExportService.iter_notes(g.current_user.id, after, inline_files))
+    filename = f'fastnote-export.{extension}'
+    if compress:
+        chunks = ExportService.gzip_chunks(chunks)
+        mimetype, filename = 'application/gzip', filename + '.gz'
+
+    # stream_with_context keeps the request (and its DB session) alive while the generator runs
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @notes_bp.route('/import', methods=['POST'])
 @token_required
+# Spooling the upload doesn't touch the database; IMPORT_MAX_BYTES caps it as it streams
+@admission_control(write_slot=False)
+@accepts_gzip('IMPORT_MAX_BYTES')
 def import_notes():
-    data = request.get_json() or []
-    # Note: For production, you would also want to loop through and validate 
-    # 'data' against note_schema(many=True) before importing!
-    return jsonify(NoteService.import_notes(g.current_user.id, data)), 201
+    # Accepts a JSON array or NDJSON body. The body is spooled to disk and imported
+    # in the background; every record is validated against note_schema.
+    job = ImportService.start(g.current_user.id, request.stream)
+    return jsonify(job), 202
+
+@notes_bp.route('/import/<job_id>', methods=['GET'])
+@token_required
+def import_status(job_id):
+    return jsonify(ImportService.get(g.current_user.id, job_id)), 200
 
 @notes_bp.route('/sync', methods=['POST'])
 @token_required
+@admission_control('SYNC_MAX_BYTES')
+@accepts_gzip('SYNC_MAX_BYTES')
 def sync_notes():
     # We can keep this API-layer check for a fast, early return, 
     # but the service layer is now protected too.
@@ -1,19 +1,33 @@
 import os
-import traceback 
+import threading
 from flask import Blueprint, request, jsonify, g, current_app
+from app.core.metrics import metrics_token_required
 from app.core.security import token_required
-from app.extensions import db
-from app.models.user import User
-from dodopayments import DodoPayments
-
-try:
-    from dodopayments.environments import DodoPaymentsEnvironment
-except ImportError:
-    DodoPaymentsEnvironment = None
+from app.services.webhook_inbox import WebhookInbox
 
 payments_bp = Blueprint('payments_bp', __name__)
 
+_dodo_client = None
+_dodo_client_lock = threading.Lock()
+
 def get_dodo_client():
+    """Returns the process-wide SDK client (its HTTP connection pool is reused across requests)."""
+    global _dodo_client
+    if _dodo_client is None:
+        with _dodo_client_lock:
+            if _dodo_client is None:
+                _dodo_client = _build_dodo_client()
+    return _dodo_client
+
+def _build_dodo_client():
+    # Imported on first use: the SDK and its HTTP stack take longer to load than the
+    # rest of the app, and most workers never serve a payments request
+    from dodopayments import DodoPayments
+    try:
+        from dodopayments.environments import DodoPaymentsEnvironment
+    except ImportError:
+        DodoPaymentsEnvironment = None
+
     api_key = os.environ.get("DODO_PAYMENTS_API_KEY")
     client_kwargs = {"bearer_token": api_key}
     
@@ -32,7 +46,7 @@ def get_dodo_client():
         client_kwargs["environment"] = env_request
 
     # BETTER LOGGING: Verify exactly what is being passed to the SDK
-    current_app.logger.info(f"Dodo SDK Initialized -> Environment: {client_kwargs.get('environment')}")
+    current_app.logger.info('Dodo SDK Initialized -> Environment: %s', client_kwargs.get('environment'))
             
     return DodoPayments(**client_kwargs)
 
@@ -49,20 +63,17 @@ def create_checkout():
         )
         return jsonify({"checkout_url": session.checkout_url}), 200
         
-    except Exception as e:
-        # --- NEW BETTER LOGGING ---
-        error_trace = traceback.format_exc()
-        current_app.logger.error("=== DODO API CRASH REPORT ===")
-        current_app.logger.error(error_trace)
-        
-        # Check if environment variables are actually loading into Python
+    except Exception:
+        # One record with the traceback and whether the environment actually reached Python
         api_key = os.environ.get("DODO_PAYMENTS_API_KEY", "MISSING")
         masked_key = f"{api_key[:8]}..." if len(api_key) > 8 else "MISSING_OR_TOO_SHORT"
-        
-        current_app.logger.error(f"DEBUG ENV: KEY={masked_key}")
-        current_app.logger.error(f"DEBUG ENV: ENVIRONMENT={os.environ.get('DODO_PAYMENTS_ENVIRONMENT', 'MISSING')}")
-        current_app.logger.error(f"DEBUG ENV: PRODUCT_ID={os.environ.get('DODO_PRODUCT_ID', 'MISSING')}")
-        current_app.logger.error("=============================")
+        current_app.logger.error(
+            "Dodo checkout failed (KEY=%s, ENVIRONMENT=%s, PRODUCT_ID=%s)",
+            masked_key,
+            os.environ.get('DODO_PAYMENTS_ENVIRONMENT', 'MISSING'),
+            os.environ.get('DODO_PRODUCT_ID', 'MISSING'),
+            exc_info=True,
+        )
         
         return jsonify({"message": "Internal Server Error"}), 500
 
@@ -80,8 +91,8 @@ def webhook_handler():
         return jsonify({"message": "Internal Server Error"}), 500
     
     try:
-        # The SDK automatically verifies the cryptographic signature
-        event = client.webhooks.unwrap(
+        # The SDK verifies the cryptographic signature; the inbox parses the payload itself
+        client.webhooks.unwrap(
             payload,
             headers={
                 "webhook-id": request.headers.get("webhook-id"),
@@ -91,39 +102,20 @@ def webhook_handler():
             
         )
     except Exception as e:
-        current_app.logger.error(f"Webhook Signature Verification Failed: {e}")
+        current_app.logger.error('Webhook Signature Verification Failed: %s', e)
         return jsonify({"message": "Invalid signature"}), 400
 
-    # Process the event data
-    event_data = event.data
-    metadata = event_data.metadata or {}
-    user_id = metadata.get('user_id')
-
-    if not user_id:
-        return jsonify({"received": True}), 200 # Ignore events without our metadata
-
-    user = db.session.get(User, int(user_id))
-    if not user:
-        return jsonify({"received": True}), 200
-
-    # Standard MoR Subscription Event Handling
-    if event.type == 'subscription.trial_started':
-        user.subscription_status = 'trialing'
-        user.subscription_id = event_data.get('subscription_id')
-        user.dodo_customer_id = event_data.get('customer_id')
-        # Dodo provides the end date, or calculate it locally
-        db.session.commit()
-        
-    elif event.type == 'subscription.active':
-        user.subscription_status = 'active'
-        db.session.commit()
-        
-    elif event.type == 'subscription.trial_expired' or event.type == 'subscription.past_due':
-        user.subscription_status = 'expired'
-        db.session.commit()
-        
-    elif event.type == 'subscription.canceled':
-        user.subscription_status = 'canceled'
-        db.session.commit()
+    # Persist and acknowledge; the inbox worker applies the event in the background.
+    # Provider retries of an already stored webhook-id are acknowledged as no-ops.
+    stored = WebhookInbox.receive(
+        request.headers.get("webhook-id"),
+        payload.decode('utf-8'),
+        request.headers.get("webhook-timestamp")
+    )
+    return jsonify({"received": True, "duplicate": not stored}), 200
 
-    return jsonify({"received": True}), 200
\ No newline at end of file
+@payments_bp.route('/webhook-stats', methods=['GET'])
+@metrics_token_required
+def webhook_stats():
+    # Inbox queue depth and processing lag (counts every user's events: operators only)
+    return jsonify(WebhookInbox.stats()), 200
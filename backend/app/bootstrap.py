@@ -0,0 +1,30 @@
+"""
+Schema bootstrap without the rest of the app: `python -m app.bootstrap`.
+
+entrypoint.sh runs it before gunicorn starts: pending migrations (as `flask
+db upgrade` would), then any missing tables. It only loads the config, the
+models and the database setup -- no blueprints, payments SDK, metrics or
+background workers -- so booting a container no longer imports the whole
+app twice. (`flask init-db` does the same from a full app.)
+"""
+from flask import Flask
+from app.core.config import Config
+from app.core.logger import setup_logging
+from app.core.sharding import init_sharding
+from app.database import create_schema, init_db
+
+def create_bootstrap_app(config_class=Config):
+    """A bare app with only the database (and shards) configured: enough for create_schema()."""
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    init_db(app)
+    init_sharding(app)
+    return app
+
+def main(config_class=Config):
+    # Written synchronously (no log queue): the process exits right after
+    setup_logging(config_class.LOG_LEVEL, config_class.LOG_FORMAT, 0, config_class.LOG_SAMPLE_RATES)
+    create_schema(create_bootstrap_app(config_class))
+
+if __name__ == '__main__':
+    main()
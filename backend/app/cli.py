@@ -0,0 +1,189 @@
+import os
+import click
+
+def _each_shard():
+    """Yields every database holding notes, bound in turn (just the one when not sharded)."""
+    from app.core.sharding import shard_router
+    if not shard_router.enabled:
+        yield from shard_router.databases()
+        return
+    for shard in shard_router.databases():
+        with shard_router.use_shard(shard):
+            yield shard
+
+def _require_sharding():
+    from app.core.sharding import shard_router
+    if not shard_router.enabled:
+        raise click.ClickException("Sharding is off (set SHARDING_MODE to 'hash' or 'per_user').")
+
+def register_cli(app):
+    """Registers maintenance commands on the `flask` CLI."""
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        # `flask db ...` (Flask-Migrate); Alembic is never loaded by gunicorn workers
+        from flask_migrate import Migrate
+        from app.database import MIGRATIONS_DIR
+        from app.extensions import db
+        Migrate(app, db, directory=MIGRATIONS_DIR)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Applies pending migrations, then creates missing tables and the search index (run before workers start)."""
+        from app.database import create_schema
+        create_schema(app)
+        click.echo("Database schema is up to date.")
+
+    @app.cli.command('search-reindex')
+    def search_reindex():
+        """Rebuilds the full-text search index from the notes table."""
+        from app.services.search_service import SearchService
+        count = sum(SearchService.rebuild() for _ in _each_shard())
+        click.echo(f"Indexed {count} notes.")
+
+    @app.cli.command('notes-backfill-summaries')
+    def notes_backfill_summaries():
+        """Precomputes previews/sizes/hashes and compresses bodies of older notes."""
+        from app.services.note_service import NoteService
+        count = sum(NoteService.backfill_summaries() for _ in _each_shard())
+        click.echo(f"Summarized {count} notes.")
+
+    @app.cli.command('shards-status')
+    def shards_status():
+        """Lists the shards with their users and file sizes, and users being moved."""
+        from app.services.shard_service import ShardService, label
+        _require_sharding()
+        status = ShardService.status()
+        click.echo(f"Mode: {status['mode']}")
+        for shard in status['shards']:
+            size = 'n/a' if shard['bytes'] is None else f"{shard['bytes'] / 1024 / 1024:.1f} MB"
+            click.echo(f"  {label(shard['shard']):<16} {shard['users']:>8} users  {size:>12}")
+        for user_id, source, target in status['moving']:
+            click.echo(f"  user {user_id} is moving from {label(source)} to {label(target)}")
+
+    @app.cli.command('shards-rebalance')
+    @click.option('--dry-run', is_flag=True, help='Only list the moves.')
+    @click.option('--batch-size', default=50, show_default=True, help='Users marked unavailable at a time.')
+    @click.option('--grace', default=5.0, show_default=True, help='Extra seconds for in-flight requests to finish.')
+    @click.option('--limit', default=0, help='Stop after this many users (0 = all).')
+    def shards_rebalance(dry_run, batch_size, grace, limit):
+        """
+        Moves every unpinned user to the shard the placement policy gives them:
+        users still in the catalog database (migration to sharding), users whose
+        hash changed with SHARD_COUNT, and interrupted moves.
+        """
+        from app.services.shard_service import ShardService, label
+        _require_sharding()
+        moves = ShardService.plan()
+        if limit:
+            moves = moves[:limit]
+        if dry_run:
+            for user_id, source, target, _ in moves:
+                click.echo(f"user {user_id}: {label(source)} -> {label(target)}")
+            click.echo(f"{len(moves)} users to move.")
+            return
+
+        def report(user_id, source, target, copied):
+            click.echo(f"user {user_id}: {label(source)} -> {label(target)} ({copied} rows)")
+
+        for start in range(0, len(moves), max(batch_size, 1)):
+            ShardService.move(moves[start:start + max(batch_size, 1)], grace, on_moved=report)
+        click.echo(f"Moved {len(moves)} users.")
+
+    @app.cli.command('shards-move')
+    @click.argument('user_id', type=int)
+    @click.argument('shard', required=False)
+    @click.option('--grace', default=5.0, show_default=True, help='Extra seconds for in-flight requests to finish.')
+    def shards_move(user_id, shard, grace):
+        """
+        Moves one user to SHARD ('catalog' for the catalog database) and pins them
+        there. Without SHARD, moves them back to their placement and unpins them.
+        """
+        from app.core.sharding import CATALOG, SHARD_NAME_RE, shard_router
+        from app.services.shard_service import ShardService, label
+        _require_sharding()
+        target = CATALOG if shard == 'catalog' else shard or shard_router.placement(user_id)
+        if target != CATALOG and not SHARD_NAME_RE.match(target):
+            raise click.BadParameter('Use lowercase letters, digits, - and _.', param_hint='SHARD')
+        from app.core.exceptions import APIException
+        from app.extensions import db
+        from app.models.user import User
+        if db.session.get(User, user_id) is None:
+            raise click.ClickException(f"No user {user_id}.")
+        try:
+            directory_shard = shard_router.shard_for(user_id)
+        except APIException:
+            raise click.ClickException(f"User {user_id} is being moved; run shards-rebalance to finish that first.")
+        if directory_shard == target:
+            shard_router.set_directory(user_id, pinned=shard is not None)
+            click.echo(f"User {user_id} is already on {label(target)}.")
+        else:
+            ShardService.move([(user_id, directory_shard, target, True)], grace, pin=shard is not None)
+            click.echo(f"Moved user {user_id} from {label(directory_shard)} to {label(target)}.")
+
+
+    @app.cli.command('webhooks-process')
+    def webhooks_process():
+        """Applies all due payment webhooks from the inbox (when the in-process worker is disabled)."""
+        from app.services.webhook_inbox import WebhookInbox
+        batch_size = app.config.get('WEBHOOK_BATCH_SIZE', 50)
+        total = 0
+        while True:
+            handled = WebhookInbox.process_pending(batch_size)
+            total += handled
+            if handled < batch_size:
+                break
+        click.echo(f"Processed {total} webhook events.")
+
+    @app.cli.command('maintenance-run')
+    @click.argument('jobs', nargs=-1, type=click.Choice(['checkpoint', 'vacuum', 'optimize', 'orphans']))
+    @click.option('--loop', is_flag=True, help='Keep running jobs as they fall due (with MAINTENANCE_WORKER_ENABLED=false).')
+    def maintenance_run(jobs, loop):
+        """
+        Runs database maintenance on every database: the named JOBS right away
+        (whatever the schedule and load), or else the jobs that are due.
+        """
+        from app.services.maintenance import maintenance
+        from app.services.shard_service import label
+        if loop:
+            click.echo("Running database maintenance; stop with Ctrl+C.")
+            maintenance.serve(app)
+        if not maintenance.acquire_leadership():
+            raise click.ClickException("Another process is running maintenance (it holds MAINTENANCE_LOCK_PATH).")
+
+        def report(job, database, result):
+            click.echo(f"{job} on {label(database)}: {result.status}, {result.reclaimed} bytes reclaimed ({result.detail})")
+
+        ran = maintenance.run_pending(jobs=jobs, force=bool(jobs), on_run=report)
+        if ran is None:
+            raise click.ClickException("The host is busy; try later, or name the jobs to run them anyway.")
+        if not ran:
+            click.echo("Nothing is due.")
+
+    @app.cli.command('maintenance-status')
+    def maintenance_status():
+        """Shows the last run of each maintenance job per database."""
+        from app.services.maintenance import MaintenanceService
+        from app.services.shard_service import label
+        history = MaintenanceService.history()
+        if not history:
+            click.echo("No maintenance has run yet.")
+        for run in history:
+            click.echo(
+                f"{label(run['database']):<16} {run['job']:<12} {run['status']:<8} {run['started_at']} "
+                f"{run['duration_ms']:>7} ms {run['bytes_reclaimed']:>12} B  "
+                f"({run['runs']} runs, {run['total_reclaimed']} B in all) {run['detail'] or ''}"
+            )
+
+    @app.cli.command('maintenance-vacuum')
+    @click.confirmation_option(prompt='VACUUM blocks writes to each database while it runs. Continue?')
+    def maintenance_vacuum():
+        """
+        Rewrites every database file with VACUUM, which switches files created
+        before incremental auto-vacuum over to it. Needs free disk space for a
+        copy of the largest file; run it in a quiet period.
+        """
+        from app.core.sharding import shard_router
+        from app.services.maintenance import maintenance
+        from app.services.shard_service import label
+        for database in shard_router.databases():
+            result = maintenance.run('full_vacuum', database, budget=0, force=True)
+            click.echo(f"{label(database)}: {result.status}, {result.reclaimed} bytes reclaimed ({result.detail})")
@@ -0,0 +1,216 @@
+import io
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, request
+from app.core.exceptions import APIException
+
+# Remove idle buckets every this many admissions
+PRUNE_EVERY = 1000
+
+
+def _parse_costs(value):
+    """Parses 'endpoint=cost,endpoint=cost' (RATE_LIMIT_COSTS) into a dict."""
+    costs = {}
+    for item in (value or '').split(','):
+        name, _, cost = item.partition('=')
+        if name.strip() and cost.strip():
+            costs[name.strip()] = float(cost)
+    return costs
+
+
+class MemoryBucketStore:
+    """Token buckets of this worker only (each worker enforces the limit separately)."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._admissions = 0
+
+    def take(self, key, cost, rate, burst):
+        """Takes `cost` tokens. Returns 0 on success, else the seconds until they are available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            self._admissions += 1
+            if self._admissions % PRUNE_EVERY == 0:
+                self._prune(now, burst / rate)
+            if tokens < cost:
+                self._buckets[key] = (tokens, now)
+                return (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost, now)
+            return 0
+
+    def _prune(self, now, refill_seconds):
+        # A bucket untouched for a full refill is indistinguishable from a new one
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated > refill_seconds]
+        for key in idle:
+            del self._buckets[key]
+
+
+class SqliteBucketStore:
+    """
+    Token buckets in a small SQLite file shared by all workers on the host, so
+    their combined traffic is held to one limit. Each admission is one short
+    IMMEDIATE transaction; the file is separate from the main database so it
+    never competes for the notes write lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._admissions = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF') # Losing buckets in a crash is harmless
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def take(self, key, cost, rate, burst):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(now - updated, 0) * rate)
+            wait = (cost - tokens) / rate if tokens < cost else 0
+            connection.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, tokens if wait else tokens - cost, now),
+            )
+            self._admissions += 1
+            if self._admissions % PRUNE_EVERY == 0:
+                connection.execute('DELETE FROM buckets WHERE updated < ?', (now - burst / rate,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+class _CappedStream(io.RawIOBase):
+    """Passes a body without Content-Length through, refusing to read more than `max_bytes`."""
+
+    def __init__(self, raw, max_bytes):
+        self._raw = raw
+        self._max_bytes = max_bytes
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # One byte past the limit is enough to tell an oversized body from one that fits exactly
+        data = self._raw.read(min(len(buffer), self._max_bytes + 1 - self._read))
+        self._read += len(data)
+        if self._read > self._max_bytes:
+            raise APIException(f'Request body too large. The limit is {self._max_bytes} bytes.', 413)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class AdmissionController:
+    """
+    Decides whether a write request may run now:
+
+    1. a per-user token bucket (each endpoint costs RATE_LIMIT_COSTS tokens,
+       refilled at RATE_LIMIT_RATE per second up to RATE_LIMIT_BURST) -> 429
+    2. a request body cap per endpoint -> 413
+    3. a per-worker semaphore of in-flight writes, so queued writers wait a
+       bounded time for the database instead of piling up -> 503
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.rate = 1.0
+        self.burst = 1.0
+        self.costs = {}
+        self.write_wait_seconds = 0
+        self.store = MemoryBucketStore()
+        self._write_slots = None
+
+    def configure(self, config):
+        self.enabled = config.get('RATE_LIMIT_ENABLED', True)
+        self.rate = float(config.get('RATE_LIMIT_RATE', 2))
+        self.burst = float(config.get('RATE_LIMIT_BURST', 60))
+        self.costs = _parse_costs(config.get('RATE_LIMIT_COSTS', ''))
+        if config.get('RATE_LIMIT_BACKEND', 'memory') == 'sqlite':
+            self.store = SqliteBucketStore(config['RATE_LIMIT_SQLITE_PATH'])
+        else:
+            self.store = MemoryBucketStore()
+        slots = config.get('MAX_CONCURRENT_WRITES', 8)
+        self._write_slots = threading.BoundedSemaphore(slots) if slots else None
+        self.write_wait_seconds = config.get('WRITE_QUEUE_TIMEOUT', 2)
+
+    def check_rate(self, user_id, endpoint):
+        cost = self.costs.get(endpoint, 1)
+        if not self.enabled or cost <= 0:
+            return
+        # A request costing more than the whole bucket could never be admitted
+        wait = self.store.take(f'user:{user_id}', min(cost, self.burst), self.rate, self.burst)
+        if wait:
+            retry_after = max(1, math.ceil(wait))
+            raise APIException(
+                f'Too many requests. Retry in {retry_after} seconds.', 429,
+                headers={'Retry-After': str(retry_after)}
+            )
+
+    def acquire_write_slot(self):
+        if self._write_slots is None:
+            return False
+        if not self._write_slots.acquire(timeout=self.write_wait_seconds):
+            raise APIException('Server is busy. Please retry shortly.', 503, headers={'Retry-After': '1'})
+        return True
+
+    def release_write_slot(self):
+        self._write_slots.release()
+
+
+# Process-wide controller (the memory store and write semaphore are per worker)
+admission = AdmissionController()
+
+
+def init_admission(app):
+    """Applies the RATE_LIMIT_* / MAX_CONCURRENT_WRITES settings."""
+    admission.configure(app.config)
+
+
+def admission_control(max_bytes_setting=None, write_slot=True):
+    """
+    Wraps a write endpoint (after @token_required) in admission control.
+    `max_bytes_setting` names the config key capping its request body;
+    `write_slot=False` is for endpoints that don't write inside the request.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            admission.check_rate(g.current_user.id, request.endpoint)
+
+            if max_bytes_setting:
+                max_bytes = current_app.config[max_bytes_setting]
+                if request.content_length is None:
+                    # Chunked body: the size is only known once read, so cap the stream instead
+                    request.__dict__['stream'] = _CappedStream(request.stream, max_bytes)
+                elif request.content_length > max_bytes:
+                    raise APIException(f'Request body too large. The limit is {max_bytes} bytes.', 413)
+
+            acquired = write_slot and admission.acquire_write_slot()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                if acquired:
+                    admission.release_write_slot()
+        return decorated
+    return decorator
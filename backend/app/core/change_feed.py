@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_BYTES = 64
+
+
+class ChangeFeed:
+    """
+    Wakes up requests waiting for a user's notes to change.
+
+    Within a process, waiters block on a per-user condition. To reach requests
+    held by other gunicorn workers, every process binds a Unix datagram socket
+    in a shared directory and `publish` sends the user id to each of them.
+    Notifications carry no data: a woken waiter re-reads the user's change
+    sequence from the database, so a lost datagram only delays a client until
+    its next timeout.
+    """
+
+    def __init__(self):
+        self.socket_dir = os.path.join(tempfile.gettempdir(), 'fastnote-feed')
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        # user id -> [condition, listener count, version]
+        self._users = {}
+        self._socket = None
+        self._sender = None
+        self._path = None
+
+    def _ensure_started(self):
+        """Binds this process's socket on first use (and again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._reset()
+            self._pid = os.getpid()
+            try:
+                os.makedirs(self.socket_dir, exist_ok=True)
+                path = os.path.join(self.socket_dir, f'{self._pid}.sock')
+                if os.path.exists(path):
+                    os.unlink(path)
+                listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                listener.bind(path)
+                sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                sender.setblocking(False)
+            except (OSError, AttributeError) as err:
+                # No Unix sockets (or no writable directory): changes only reach this process
+                logger.warning('Change feed notifier unavailable, falling back to in-process only: %s', err)
+                return
+
+            self._socket, self._sender, self._path = listener, sender, path
+            atexit.register(self._cleanup, path)
+            threading.Thread(target=self._listen, args=(listener,), name='change-feed', daemon=True).start()
+
+    @staticmethod
+    def _cleanup(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _listen(self, listener):
+        while True:
+            try:
+                message = listener.recv(MAX_MESSAGE_BYTES)
+            except OSError:
+                return
+            try:
+                user_id = int(message)
+            except ValueError:
+                continue
+            self._notify_local(user_id)
+
+    def _notify_local(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry:
+                entry[2] += 1
+                entry[0].notify_all()
+
+    def publish(self, user_id):
+        """Signals every worker that the user's notes changed. Call after committing."""
+        self._ensure_started()
+        self._notify_local(user_id)
+        if self._sender is None:
+            return
+
+        message = str(user_id).encode()
+        for name in os.listdir(self.socket_dir):
+            path = os.path.join(self.socket_dir, name)
+            if path == self._path or not name.endswith('.sock'):
+                continue
+            try:
+                self._sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that died without cleaning up
+                self._cleanup(path)
+            except OSError:
+                # Receiver's buffer is full; it will catch up on its next timeout
+                pass
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """
+        Registers interest in a user's changes for the duration of the block.
+
+        Subscribe *before* reading the current state: anything committed after
+        that point either shows up in the read or wakes `wait`.
+        """
+        self._ensure_started()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = [threading.Condition(self._lock), 0, 0]
+            entry[1] += 1
+        subscription = _Subscription(self, entry)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._users.pop(user_id, None)
+
+    def listener_count(self):
+        with self._lock:
+            return sum(entry[1] for entry in self._users.values())
+
+
+class _Subscription:
+    def __init__(self, feed, entry):
+        self._feed = feed
+        self._entry = entry
+        self._seen = entry[2]
+
+    def wait(self, timeout):
+        """Blocks until a change was published since the last call, or `timeout` seconds pass."""
+        condition = self._entry[0]
+        with self._feed._lock:
+            changed = condition.wait_for(lambda: self._entry[2] != self._seen, timeout)
+            self._seen = self._entry[2]
+        return changed
+
+
+# Process-wide feed (each gunicorn worker gets its own socket after the fork)
+change_feed = ChangeFeed()
+
+
+def init_change_feed(app):
+    """Applies CHANGE_FEED_SOCKET_DIR; the socket itself is bound lazily in each worker."""
+    change_feed.socket_dir = app.config.get('CHANGE_FEED_SOCKET_DIR', change_feed.socket_dir)
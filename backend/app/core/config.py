@@ -1,4 +1,26 @@
 import os
+import tempfile
+
+def _database_url():
+    url = os.environ.get('DATABASE_URL', '')
+    # Many hosting providers still hand out the pre-SQLAlchemy-1.4 scheme
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def _engine_options(uri):
+    """SQLAlchemy create_engine() options for the configured database."""
+    if uri.startswith('sqlite'):
+        # Per-connection PRAGMAs are applied in app.database; a small pool is
+        # enough because SQLite serializes writers anyway.
+        return {'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)), 'pool_pre_ping': False}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_pre_ping': True,
+    }
 
 class Config:
     """Base Configuration via Environment Variables (12-Factor App)"""
@@ -6,11 +28,142 @@ class Config:
     
     # Security
     SECRET_KEY = os.environ.get('SECRET_KEY', 'change-this-in-production')
+
+    # Password hashing: werkzeug method spec (e.g. 'scrypt:32768:8:1', 'pbkdf2:sha256:600000'),
+    # OS threads per worker (0 = hash inline), max queued hashes and seconds to wait for a slot.
+    # Users whose stored hash uses other parameters are rehashed on their next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+    PASSWORD_HASH_WAIT_SECONDS = int(os.environ.get('PASSWORD_HASH_WAIT_SECONDS', 5))
+
+    # Per-worker cache of authenticated users (seconds a subscription change may take to show up).
+    # invalidate_principal only clears the calling worker's copy: the other gunicorn workers
+    # keep serving a revoked user or an old subscription status for up to AUTH_CACHE_TTL.
+    AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 30))
     
     # Database (Default to /app/data inside Docker)
     DEFAULT_DB_PATH = os.path.join(BASE_DIR, 'data', 'fastnote.db')
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', f'sqlite:///{DEFAULT_DB_PATH}')
+    SQLALCHEMY_DATABASE_URI = _database_url() or f'sqlite:///{DEFAULT_DB_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+
+    # SQLite PRAGMAs applied to every new connection (see app.database)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper() # NORMAL is durable in WAL mode except on power loss
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+    # Sharding (see app.core.sharding): 'none', 'hash' (users spread over SHARD_COUNT SQLite
+    # files) or 'per_user' (one file each) under SHARD_DIR; users stay in the catalog database.
+    # SHARD_MAX_ENGINES caps the shard files a worker keeps open, SHARD_DIRECTORY_TTL is how
+    # long a worker trusts its cached copy of a user's placement (seconds).
+    SHARDING_MODE = os.environ.get('SHARDING_MODE', 'none').lower()
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 8))
+    SHARD_DIR = os.environ.get('SHARD_DIR', os.path.join(BASE_DIR, 'data', 'shards'))
+    SHARD_MAX_ENGINES = int(os.environ.get('SHARD_MAX_ENGINES', 64))
+    SHARD_DIRECTORY_TTL = int(os.environ.get('SHARD_DIRECTORY_TTL', 30))
+    SHARD_ENGINE_OPTIONS = _engine_options('sqlite')
+
+    # Group commit: note writes of concurrent requests share one transaction per worker,
+    # collected for up to GROUP_COMMIT_WINDOW_MS or GROUP_COMMIT_MAX_BATCH writes
+    # (at most MAX_CONCURRENT_WRITES requests write at once, so raise that alongside)
+    GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT_ENABLED', 'false').lower() in ('1', 'true')
+    GROUP_COMMIT_WINDOW_MS = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 2))
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 32))
+
+    # Store images embedded in Excalidraw scenes once, apart from the note body
+    # (served by GET /api/notes/files/<sha256>; see app/services/scene_files.py)
+    EXTRACT_SCENE_FILES = os.environ.get('EXTRACT_SCENE_FILES', 'true').lower() in ('1', 'true')
+
+    # Sync (max ids per IN query / rows per bulk upsert statement)
+    SYNC_BATCH_SIZE = int(os.environ.get('SYNC_BATCH_SIZE', 500))
+    # Max changes returned by one delta pull (clients loop while has_more)
+    SYNC_PULL_LIMIT = int(os.environ.get('SYNC_PULL_LIMIT', 500))
+
+    # Change feed (GET /api/notes/changes): long-poll timeout, SSE heartbeat interval and
+    # stream lifetime in seconds, and the directory of the per-worker notifier sockets
+    CHANGE_FEED_TIMEOUT = int(os.environ.get('CHANGE_FEED_TIMEOUT', 25))
+    CHANGE_FEED_MAX_TIMEOUT = int(os.environ.get('CHANGE_FEED_MAX_TIMEOUT', 60))
+    CHANGE_FEED_HEARTBEAT = int(os.environ.get('CHANGE_FEED_HEARTBEAT', 15))
+    CHANGE_FEED_STREAM_SECONDS = int(os.environ.get('CHANGE_FEED_STREAM_SECONDS', 300))
+    CHANGE_FEED_SOCKET_DIR = os.environ.get('CHANGE_FEED_SOCKET_DIR', os.path.join(tempfile.gettempdir(), 'fastnote-feed'))
+
+    # Admission control for writes (see app.core.admission). Each user has a token bucket
+    # refilled at RATE_LIMIT_RATE/s up to RATE_LIMIT_BURST; RATE_LIMIT_COSTS prices endpoints
+    # (others cost 1). 'sqlite' shares the buckets between all workers on the host.
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true')
+    RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', 2))
+    RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 60))
+    RATE_LIMIT_COSTS = os.environ.get('RATE_LIMIT_COSTS', 'notes_bp.sync_notes=5,notes_bp.import_notes=30')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_SQLITE_PATH = os.environ.get('RATE_LIMIT_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'fastnote-ratelimit.db'))
+    # Writes running at once per worker; extra writers wait this many seconds, then get a 503
+    MAX_CONCURRENT_WRITES = int(os.environ.get('MAX_CONCURRENT_WRITES', 8))
+    WRITE_QUEUE_TIMEOUT = int(os.environ.get('WRITE_QUEUE_TIMEOUT', 2))
+    # Request size caps (bytes / items)
+    NOTE_MAX_BYTES = int(os.environ.get('NOTE_MAX_BYTES', 20 * 1024 * 1024))
+    SYNC_MAX_BYTES = int(os.environ.get('SYNC_MAX_BYTES', 50 * 1024 * 1024))
+    SYNC_MAX_ITEMS = int(os.environ.get('SYNC_MAX_ITEMS', 5000))
+
+    # Note body storage: 'zstd' (falls back to zlib if not installed), 'zlib' or 'none'
+    NOTE_COMPRESSION = os.environ.get('NOTE_COMPRESSION', 'zstd')
+    NOTE_COMPRESSION_MIN_BYTES = int(os.environ.get('NOTE_COMPRESSION_MIN_BYTES', 1024))
+    NOTE_COMPRESSION_LEVEL = int(os.environ.get('NOTE_COMPRESSION_LEVEL', 3))
+
+    # Import (records per committed chunk, upload cap, size of the error report)
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 200))
+    IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', 100 * 1024 * 1024))
+    IMPORT_MAX_ITEMS = int(os.environ.get('IMPORT_MAX_ITEMS', 100000))
+    IMPORT_MAX_REPORTED_ERRORS = 100
+
+    # JSON encoding of responses and request bodies: 'auto' (orjson when installed), 'orjson' or 'stdlib'
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto').lower()
+    # Response encodings offered, in order of preference ('' = never compress, e.g. behind a
+    # compressing proxy); bodies smaller than RESPONSE_COMPRESSION_MIN_BYTES are sent as is.
+    # Sync and import also accept 'Content-Encoding: gzip' bodies (inflated size capped as above).
+    RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', 'zstd,br,gzip')
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+
+    # Database maintenance (see app/services/maintenance.py): each job of MAINTENANCE_JOBS
+    # ('job=interval:budget', in seconds) runs per database in one worker per host, the one
+    # holding MAINTENANCE_LOCK_PATH. Jobs wait, backing off from MAINTENANCE_BACKOFF_SECONDS,
+    # while the load average per CPU exceeds MAINTENANCE_MAX_LOAD or the worker is serving more
+    # than MAINTENANCE_MAX_IN_FLIGHT requests. With the worker disabled, run
+    # `flask maintenance-run --loop` as a process of its own instead.
+    MAINTENANCE_WORKER_ENABLED = os.environ.get('MAINTENANCE_WORKER_ENABLED', 'true').lower() in ('1', 'true')
+    MAINTENANCE_JOBS = os.environ.get('MAINTENANCE_JOBS', 'checkpoint=300:2,vacuum=3600:10,optimize=86400:30,orphans=86400:60')
+    MAINTENANCE_LOCK_PATH = os.environ.get('MAINTENANCE_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'fastnote-maintenance.lock'))
+    MAINTENANCE_POLL_SECONDS = int(os.environ.get('MAINTENANCE_POLL_SECONDS', 30))
+    MAINTENANCE_MAX_LOAD = float(os.environ.get('MAINTENANCE_MAX_LOAD', 0.75))
+    MAINTENANCE_MAX_IN_FLIGHT = int(os.environ.get('MAINTENANCE_MAX_IN_FLIGHT', 4))
+    MAINTENANCE_BACKOFF_SECONDS = int(os.environ.get('MAINTENANCE_BACKOFF_SECONDS', 30))
+    # Unreferenced scene images are kept this long (a client may still send them back), run history as long
+    MAINTENANCE_ORPHAN_FILE_DAYS = int(os.environ.get('MAINTENANCE_ORPHAN_FILE_DAYS', 7))
+    MAINTENANCE_HISTORY_DAYS = int(os.environ.get('MAINTENANCE_HISTORY_DAYS', 30))
+
+    # Payment webhook inbox worker (poll interval for events received by other
+    # workers or due for retry, events per transaction batch, retry budget)
+    WEBHOOK_WORKER_ENABLED = os.environ.get('WEBHOOK_WORKER_ENABLED', 'true').lower() in ('1', 'true')
+    WEBHOOK_POLL_SECONDS = int(os.environ.get('WEBHOOK_POLL_SECONDS', 5))
+    WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 50))
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
     
     # Observability
-    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
\ No newline at end of file
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    # 'json' (one object per line with request id, user id, route) or 'text'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+    # Records buffered for the background log writer before new ones are dropped (0 = write synchronously)
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    # Fraction of DEBUG/INFO records kept per logger, e.g. 'app.services.sync_engine=0.01'
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'app.services.sync_engine=0.01')
+    # One record per request with status and duration (logger 'app.access')
+    LOG_ACCESS = os.environ.get('LOG_ACCESS', 'true').lower() in ('1', 'true')
+    # Prometheus exposition at /metrics (optionally behind "Authorization: Bearer <METRICS_TOKEN>").
+    # The operator statistics endpoints (/api/payments/webhook-stats, /api/auth/cache-stats) always need it.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Log statements slower than this; warn when one request repeats a statement this often (0 = off)
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 200))
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
\ No newline at end of file
@@ -0,0 +1,45 @@
+import hashlib
+from flask import request, make_response
+
+def make_etag(*parts):
+    """Builds a strong ETag value from the parts that determine a response body."""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+def not_modified(etag, last_modified=None):
+    """
+    Returns a bodiless 304 response when the request's validators still match,
+    otherwise None. If-Modified-Since is only consulted without If-None-Match (RFC 9110).
+    """
+    if request.if_none_match:
+        # Weak comparison (RFC 9110): a compressed response carries W/"<etag>"
+        fresh = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        # HTTP dates have one-second resolution
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+    return with_validators(make_response('', 304), etag, last_modified)
+
+def _per_user(response):
+    # The body depends on who is logged in (the access_token cookie): never shared
+    # by caches, and never reused for another user of the same browser
+    response.vary.add('Cookie')
+    return response
+
+def with_validators(response, etag, last_modified=None):
+    """Attaches ETag / Last-Modified and asks clients to revalidate before reusing the body."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return _per_user(response)
+
+def immutable(response, etag):
+    """Caching for content-addressed bodies: private, kept for a year, never revalidated."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return _per_user(response)
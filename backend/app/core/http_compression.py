@@ -0,0 +1,149 @@
+import io
+import zlib
+from functools import wraps
+from flask import current_app, request
+from app.core.exceptions import APIException
+
+try:
+    import brotli
+except ImportError:  # Optional: br is simply not offered without it
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional: zstd is simply not offered without it
+    zstandard = None
+
+# Cheap settings: response bodies are compressed on every request, not stored
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 5
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/')
+INFLATE_CHUNK = 64 * 1024
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _encoders():
+    encoders = {'gzip': _gzip}
+    if brotli is not None:
+        encoders['br'] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+    if zstandard is not None:
+        encoders['zstd'] = lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return encoders
+
+
+ENCODERS = _encoders()
+
+
+def negotiate(accept_encodings, preference):
+    """
+    Picks the response encoding: the client's highest-q encoding among
+    `preference` (server order breaks ties), or None for identity.
+    """
+    best, best_quality = None, 0
+    for encoding in preference:
+        quality = accept_encodings[encoding]
+        if encoding in ENCODERS and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compress_response(response):
+    preference = current_app.config.get('RESPONSE_COMPRESSION', ())
+    if (not preference or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_MIMETYPES)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < current_app.config.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024):
+        return response
+    encoding = negotiate(request.accept_encodings, preference)
+    if encoding is None:
+        return response
+
+    response.set_data(ENCODERS[encoding](data))
+    response.headers['Content-Encoding'] = encoding
+    # Another byte sequence of the same representation (see not_modified's weak comparison)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_response_compression(app):
+    """Compresses JSON/text responses with the best encoding the client accepts (RESPONSE_COMPRESSION)."""
+    preference = app.config.get('RESPONSE_COMPRESSION', 'zstd,br,gzip')
+    if isinstance(preference, str):
+        preference = tuple(name.strip() for name in preference.split(',') if name.strip())
+    unknown = set(preference) - {'zstd', 'br', 'gzip'}
+    if unknown:
+        raise ValueError(f"Unknown RESPONSE_COMPRESSION encodings: {', '.join(sorted(unknown))}")
+    app.config['RESPONSE_COMPRESSION'] = preference
+    app.after_request(_compress_response)
+
+
+class _GzipStream(io.RawIOBase):
+    """Inflates a gzip request body as it is read, refusing to produce more than `max_bytes`."""
+
+    def __init__(self, raw, max_bytes):
+        self._raw = raw
+        self._max_bytes = max_bytes
+        self._inflater = zlib.decompressobj(31)
+        self._pending = b''
+        self._produced = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            compressed = self._inflater.unconsumed_tail or self._raw.read(INFLATE_CHUNK)
+            if not compressed:
+                if not self._inflater.eof:
+                    raise APIException('Truncated gzip request body.', 400)
+                self._eof = True
+                break
+            try:
+                # Bounded output per step, so a bomb never inflates in one go
+                self._pending = self._inflater.decompress(compressed, INFLATE_CHUNK)
+            except zlib.error:
+                raise APIException('Malformed gzip request body.', 400)
+            self._eof = self._inflater.eof
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self._produced += size
+        if self._produced > self._max_bytes:
+            raise APIException(f'Decompressed request body too large. The limit is {self._max_bytes} bytes.', 413)
+        return size
+
+
+def accepts_gzip(max_bytes_setting):
+    """
+    Lets an endpoint take a `Content-Encoding: gzip` body: request.stream (and
+    so get_json/get_data) yields the inflated bytes, capped at the config
+    value named by `max_bytes_setting` however small the upload was.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            encoding = request.headers.get('Content-Encoding', 'identity').strip().lower()
+            if encoding == 'gzip':
+                max_bytes = current_app.config[max_bytes_setting]
+                # Replaces werkzeug's cached request.stream before anything reads it
+                request.__dict__['stream'] = io.BufferedReader(_GzipStream(request.stream, max_bytes), INFLATE_CHUNK)
+            elif encoding not in ('', 'identity'):
+                raise APIException(f'Unsupported Content-Encoding: {encoding}. Send gzip or identity.', 415)
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
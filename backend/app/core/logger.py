@@ -1,23 +1,300 @@
+import atexit
+import copy
+import datetime
+import json
 import logging
+import os
+import random
+import re
 import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from _thread import allocate_lock, start_new_thread
+from flask import g, has_request_context, request
 
-def setup_logging(level="INFO"):
+try:
+    import gevent.monkey
+except ImportError:
+    gevent = None
+
+access_logger = logging.getLogger('app.access')
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def _real_threading():
+    """
+    A queue and a thread starter that stay real OS primitives under gevent.
+
+    Once gevent has patched threading, a QueueListener thread would be a
+    greenlet and its blocking stdout writes would stall the whole worker.
+    """
+    if gevent is None:
+        return SimpleQueue, start_new_thread, allocate_lock
+    return (
+        gevent.monkey.get_original('queue', 'SimpleQueue'),
+        gevent.monkey.get_original('_thread', 'start_new_thread'),
+        gevent.monkey.get_original('_thread', 'allocate_lock'),
+    )
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request context and extras."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records logged inside a request with its id, user and route."""
+
+    def filter(self, record):
+        if has_request_context():
+            user = g.get('current_user')
+            context = {
+                'request_id': g.get('request_id'),
+                'user_id': user.id if user is not None else None,
+                'method': request.method,
+                'route': request.url_rule.rule if request.url_rule else None,
+            }
+            for key, value in context.items():
+                # Values passed explicitly with extra={...} win
+                if getattr(record, key, None) is None:
+                    setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the DEBUG/INFO records of high-volume loggers,
+    e.g. {'app.services.sync_engine': 0.01}. Rates apply to a logger and its
+    children; warnings and errors are never sampled. Kept records carry their
+    `sample_rate` so counts can be scaled back up downstream.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._resolved = {}
+
+    def _rate(self, name):
+        rate = self._resolved.get(name, False)
+        if rate is False:
+            rate, prefix = None, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate is None or rate >= 1:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class _Listener(QueueListener):
+    """A QueueListener whose thread is a real OS thread, even under gevent."""
+
+    def start(self):
+        _, start_thread, allocate = _real_threading()
+        self._done = allocate()
+        self._done.acquire()
+        start_thread(self._run, ())
+
+    def _run(self):
+        try:
+            self._monitor()
+        finally:
+            self._done.release()
+
+    def stop(self, timeout=2):
+        self.enqueue_sentinel()
+        if self._done.acquire(timeout=timeout):
+            self._done.release()
+
+
+class NonBlockingHandler(QueueHandler):
+    """
+    Hands records to a queue drained by a background thread, which does the
+    formatting and the (possibly blocking) write to `target`. Requests only
+    pay for building the record. The queue is capped at `max_size` records;
+    beyond that records are dropped and counted, rather than buffered without
+    bound or blocking the caller.
+
+    The listener is started per process on first use, so gunicorn workers
+    forked from a --preload master each get their own.
+    """
+
+    def __init__(self, target, max_size=10000):
+        self.target = target
+        self.max_size = max_size
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._lock = threading.Lock()
+        super().__init__(None)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                queue_class, _, _ = _real_threading()
+                self.queue = queue_class()
+                self._listener = _Listener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Merge the arguments and render the traceback now: they may not outlive the call
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self.queue.put_nowait(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'Log queue full: dropped %d records', 'args': (dropped,),
+            }))
+        self.queue.put_nowait(record)
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def flush(self):
+        """Waits (briefly) for the listener to write everything queued so far."""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + 2
+        while self.queue.qsize() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.target.flush()
+
+    def close(self):
+        if self._pid == os.getpid() and self._listener is not None:
+            self._listener.stop()
+            self._pid = None
+        super().close()
+
+
+def parse_sample_rates(value):
+    """Parses 'logger=rate,logger=rate' (LOG_SAMPLE_RATES) into a dict."""
+    rates = {}
+    for item in (value or '').split(','):
+        name, _, rate = item.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(level="INFO", fmt="json", queue_size=10000, sample_rates=""):
     """Configures centralized structured logging for the app."""
     logger = logging.getLogger()
     logger.setLevel(level)
 
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(level)
-    
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    handler.setFormatter(formatter)
-    
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setLevel(level)
+
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+    stream.setFormatter(formatter)
+
+    # Log I/O happens on the listener thread, off the request path
+    handler = NonBlockingHandler(stream, queue_size) if queue_size else stream
+    handler.addFilter(SamplingFilter(parse_sample_rates(sample_rates)))
+    handler.addFilter(RequestContextFilter())
+
     if logger.hasHandlers():
+        for old in logger.handlers:
+            old.close()
         logger.handlers.clear()
-        
+
     logger.addHandler(handler)
-    
+
     # Suppress noisy external library logs
-    logging.getLogger("werkzeug").setLevel(logging.WARNING)
\ No newline at end of file
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+
+@atexit.register
+def _flush_on_exit():
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, NonBlockingHandler):
+            handler.close()
+
+
+def _request_id():
+    incoming = request.headers.get('X-Request-ID', '')
+    return incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+
+
+def _before_request():
+    g.request_id = _request_id()
+    g.log_started = time.perf_counter()
+
+
+def _after_request(response):
+    response.headers['X-Request-ID'] = g.request_id
+    g.log_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    # After a streamed body has been sent, so the duration covers the whole response
+    started = g.pop('log_started', None)
+    if started is None or not access_logger.isEnabledFor(logging.INFO):
+        return
+    status = g.pop('log_status', 500 if exc else 200)
+    access_logger.info(
+        '%s %s %s', request.method, request.path, status,
+        extra={'status': status, 'duration_ms': round((time.perf_counter() - started) * 1000, 2)}
+    )
+
+
+def init_request_logging(app):
+    """Assigns every request an id (X-Request-ID in and out) and writes one access record per request."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if app.config.get('LOG_ACCESS', True):
+        app.teardown_request(_teardown_request)
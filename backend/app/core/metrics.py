@@ -0,0 +1,201 @@
+import hmac
+import logging
+import os
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, current_app, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.core.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+# With PROMETHEUS_MULTIPROC_DIR set (see entrypoint.sh) every gunicorn worker
+# writes its samples to mmap'd files there and /metrics sums them all up.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUEST_LATENCY = Histogram(
+    'fastnote_http_request_duration_seconds', 'Request latency by route',
+    ['method', 'endpoint', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'fastnote_http_requests_in_flight', 'Requests being served', ['endpoint'], multiprocess_mode='livesum'
+)
+DB_STATEMENTS = Histogram(
+    'fastnote_db_statements_per_request', 'SQL statements executed per request', ['endpoint'], buckets=COUNT_BUCKETS
+)
+DB_TIME = Histogram(
+    'fastnote_db_seconds_per_request', 'Time spent in SQL per request', ['endpoint'], buckets=LATENCY_BUCKETS
+)
+DB_STATEMENTS_TOTAL = Counter('fastnote_db_statements', 'SQL statements executed (including background work)')
+SLOW_QUERIES = Counter('fastnote_db_slow_queries', 'SQL statements slower than SLOW_QUERY_MS')
+SYNC_ITEMS = Counter('fastnote_sync_items', 'Notes handled by /sync', ['result'])
+GROUP_COMMIT_UNITS = Histogram(
+    'fastnote_group_commit_units', 'Write units committed per transaction (GROUP_COMMIT_ENABLED)', buckets=COUNT_BUCKETS
+)
+MAINTENANCE_DURATION = Histogram(
+    'fastnote_maintenance_duration_seconds', 'Database maintenance job runs', ['job', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+MAINTENANCE_RECLAIMED = Counter(
+    'fastnote_maintenance_reclaimed_bytes', 'Bytes reclaimed by database maintenance jobs', ['job']
+)
+WEBHOOK_QUEUE_DEPTH = Gauge(
+    'fastnote_webhook_queue_depth', 'Payment webhooks waiting to be applied', multiprocess_mode='mostrecent'
+)
+WEBHOOK_OLDEST_PENDING = Gauge(
+    'fastnote_webhook_oldest_pending_seconds', 'Age of the oldest pending payment webhook',
+    multiprocess_mode='mostrecent'
+)
+
+
+def _endpoint():
+    # The route's endpoint name (never the raw path) keeps label cardinality bounded
+    return request.endpoint or 'unmatched'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_endpoint = _endpoint()
+    g.db_statements = 0
+    g.db_seconds = 0.0
+    g.db_statement_texts = _Tally()
+    REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    # Runs once a streamed response has been fully sent, so exports are timed end to end
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    endpoint = g.metrics_endpoint
+    status = g.pop('metrics_status', 500 if exc else 200)
+    REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+    REQUEST_LATENCY.labels(request.method, endpoint, str(status)).observe(time.perf_counter() - started)
+    DB_STATEMENTS.labels(endpoint).observe(g.db_statements)
+    DB_TIME.labels(endpoint).observe(g.db_seconds)
+
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', 10)
+    if threshold and g.db_statement_texts:
+        statement, count = g.db_statement_texts.most_common(1)[0]
+        if count >= threshold:
+            logger.warning(
+                'Possible N+1 in %s: the same statement ran %d times (%d statements in total): %.200s',
+                endpoint, count, g.db_statements, ' '.join(statement.split())
+            )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - getattr(context, '_metrics_started', time.perf_counter())
+    DB_STATEMENTS_TOTAL.inc()
+
+    slow_ms = current_app.config.get('SLOW_QUERY_MS', 200) if current_app else 0
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        SLOW_QUERIES.inc()
+        logger.warning('Slow query (%.0f ms): %.500s', elapsed * 1000, ' '.join(statement.split()))
+
+    if has_request_context() and 'db_statements' in g and not g.get('db_untracked'):
+        g.db_statements += 1
+        g.db_seconds += elapsed
+        g.db_statement_texts[statement] += 1
+
+
+def record_sync(result):
+    """Counts the items of one /sync push by outcome."""
+    for outcome in ('upserted', 'skipped', 'deleted'):
+        if result.get(outcome):
+            SYNC_ITEMS.labels(outcome).inc(result[outcome])
+    if result.get('conflicts'):
+        SYNC_ITEMS.labels('conflict').inc(len(result['conflicts']))
+
+
+@contextmanager
+def untracked_statements():
+    """Leaves the SQL run inside out of the current request's counts (it is another request's work)."""
+    if not has_request_context():
+        yield
+        return
+    g.db_untracked = True
+    try:
+        yield
+    finally:
+        g.db_untracked = False
+
+
+def record_group_commit(units):
+    GROUP_COMMIT_UNITS.observe(units)
+
+
+def record_maintenance(job, status, seconds, reclaimed):
+    MAINTENANCE_DURATION.labels(job, status).observe(seconds)
+    if reclaimed:
+        MAINTENANCE_RECLAIMED.labels(job).inc(reclaimed)
+
+
+def _registry():
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def _has_metrics_token():
+    token = current_app.config.get('METRICS_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metrics_token_required(f):
+    """
+    Guards operator endpoints (worker and queue statistics) with
+    "Authorization: Bearer <METRICS_TOKEN>". Without a METRICS_TOKEN they are off.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not _has_metrics_token():
+            raise APIException('Unauthorized', 401)
+        return f(*args, **kwargs)
+    return decorated
+
+
+def metrics_view():
+    if current_app.config.get('METRICS_TOKEN') and not _has_metrics_token():
+        raise APIException('Unauthorized', 401)
+
+    # Sampled at scrape time, so the value is fresh whichever worker answers
+    from app.services.webhook_inbox import WebhookInbox
+    stats = WebhookInbox.stats()
+    WEBHOOK_QUEUE_DEPTH.set(stats['queue_depth'])
+    WEBHOOK_OLDEST_PENDING.set(stats['oldest_pending_age_seconds'])
+
+    return Response(generate_latest(_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """Instruments requests and SQL, and serves the Prometheus exposition at /metrics."""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,40 @@
+import base64
+import datetime
+import json
+from app.core.exceptions import APIException
+
+def _encode(value):
+    raw = json.dumps(value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode(token):
+    padded = token + '=' * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+def encode_cursor(updated_at, note_id):
+    """Builds the opaque `after` token for keyset pagination over (updated_at, id)."""
+    return _encode([updated_at.isoformat(), note_id])
+
+def decode_cursor(token):
+    """Reverses encode_cursor. Raises a 400 APIException on tampered or malformed tokens."""
+    try:
+        updated_at, note_id = _decode(token)
+        if not isinstance(updated_at, str) or not isinstance(note_id, str):
+            raise ValueError(token)
+        return datetime.datetime.fromisoformat(updated_at), note_id
+    except (ValueError, TypeError):
+        raise APIException('Invalid pagination cursor', 400)
+
+def encode_page_cursor(page):
+    """The `after` token of ranked search results, which are paged by number rather than by key."""
+    return _encode(['page', page])
+
+def decode_page_cursor(token):
+    """Reverses encode_page_cursor. Raises a 400 APIException on tampered or malformed tokens."""
+    try:
+        kind, page = _decode(token)
+        if kind != 'page' or not isinstance(page, int) or isinstance(page, bool) or page < 1:
+            raise ValueError(token)
+        return page
+    except (ValueError, TypeError):
+        raise APIException('Invalid pagination cursor', 400)
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+from app.core.exceptions import APIException
+
+try:
+    import gevent.monkey
+    import gevent.threadpool
+except ImportError:
+    gevent = None
+
+
+class PasswordHasher:
+    """
+    Runs password hashing (scrypt/pbkdf2: tens of ms of CPU each) on a small
+    pool of real OS threads.
+
+    Under gevent the calling greenlet yields while it waits, so one login
+    burst no longer stalls every other request on the worker; hashlib
+    releases the GIL, so the pool threads also run in parallel. At most
+    `max_pending` hashes may be queued; beyond that callers get a 503.
+    """
+
+    def __init__(self):
+        self.method = 'scrypt'
+        self._stored_method = None
+        self.workers = 0
+        self.max_pending = 0
+        self.wait_seconds = 0
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def configure(self, method='scrypt', workers=2, max_pending=32, wait_seconds=5):
+        self.method = method
+        self._stored_method = None
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait_seconds = wait_seconds
+        with self._lock:
+            self._pool = None # Built lazily so a --preload master never owns the threads
+            self._slots = threading.BoundedSemaphore(max_pending) if workers and max_pending else None
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if gevent is not None and gevent.monkey.is_module_patched('threading'):
+                        # concurrent.futures threads would be greenlets once threading is patched
+                        self._pool = gevent.threadpool.ThreadPool(self.workers)
+                    else:
+                        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        return self._pool
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if self._slots is not None and not self._slots.acquire(timeout=self.wait_seconds):
+            raise APIException('Too many sign-in attempts in progress. Please retry shortly.', 503)
+        try:
+            pool = self._executor()
+            if isinstance(pool, ThreadPoolExecutor):
+                return pool.submit(func, *args).result()
+            return pool.spawn(func, *args).get()
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different algorithm or cost than configured."""
+        if self._stored_method is None:
+            # How werkzeug spells the configured method in a hash (e.g. 'scrypt' ->
+            # 'scrypt:32768:8:1'); learned from one hash instead of a hard-coded default
+            self._stored_method = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._stored_method
+
+
+# Process-wide hasher (each gunicorn worker builds its own pool on first use)
+password_hasher = PasswordHasher()
+
+
+def init_password_hasher(app):
+    """Applies the PASSWORD_HASH_* settings to the process-wide hasher."""
+    password_hasher.configure(
+        method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 32),
+        wait_seconds=app.config.get('PASSWORD_HASH_WAIT_SECONDS', 5),
+    )
@@ -1,9 +1,61 @@
 import jwt
 import datetime
+import time
+from collections import namedtuple
 from functools import wraps
 from flask import request, current_app, g
 from app.models.user import User
+from app.core.cache import TTLCache
 from app.core.exceptions import APIException
+from app.core.sharding import shard_router
+
+# The subset of a User that request handlers actually read (g.current_user)
+Principal = namedtuple('Principal', ['id', 'username', 'subscription_status', 'trial_ends_at'])
+
+# Process-local caches: authenticated principals by user id, and verified
+# token payloads by token string (each kept for the token's remaining lifetime).
+principal_cache = TTLCache()
+token_cache = TTLCache()
+
+def init_auth_cache(app):
+    """Applies the AUTH_CACHE_* settings to the process-local auth caches."""
+    principal_cache.maxsize = app.config.get('AUTH_CACHE_SIZE', 10000)
+    principal_cache.ttl = app.config.get('AUTH_CACHE_TTL', 30)
+    token_cache.maxsize = app.config.get('AUTH_CACHE_SIZE', 10000)
+
+def invalidate_principal(user_id):
+    """
+    Drops a cached principal, e.g. after its subscription_status changed. Only in
+    this worker: the others see the change once their copy expires (AUTH_CACHE_TTL).
+    """
+    principal_cache.invalidate(user_id)
+
+def auth_cache_stats():
+    return {'principals': principal_cache.stats(), 'tokens': token_cache.stats()}
+
+def _decode_token(token):
+    payload = token_cache.get(token)
+    if payload is not None:
+        # A cached signature is still subject to expiry
+        if payload['exp'] <= time.time():
+            token_cache.invalidate(token)
+            raise jwt.ExpiredSignatureError('Signature has expired')
+        return payload
+
+    payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+    token_cache.set(token, payload, ttl=max(payload['exp'] - time.time(), 0))
+    return payload
+
+def _load_principal(user_id):
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        from app.extensions import db
+        user = db.session.get(User, user_id)
+        if not user:
+            return None
+        principal = Principal(user.id, user.username, user.subscription_status, user.trial_ends_at)
+        principal_cache.set(user_id, principal)
+    return principal
 
 def generate_token(user_id: int, username: str) -> str:
     """Generates a JWT valid for 24 hours."""
@@ -25,9 +77,9 @@ def token_required(f):
             raise APIException('Authentication token is missing', 401)
 
         try:
-            from app.extensions import db
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = db.session.get(User, data['user_id'])
+            data = _decode_token(token)
+            # Served from the principal cache on most requests (no user SELECT)
+            current_user = _load_principal(data['user_id'])
             if not current_user:
                 raise APIException('User associated with token no longer exists', 401)
             g.current_user = current_user
@@ -36,5 +88,7 @@ def token_required(f):
         except jwt.InvalidTokenError:
             raise APIException('Token is invalid', 401)
 
+        # Notes, files and jobs of this request live in the user's shard (when sharded)
+        shard_router.bind_tenant(current_user.id)
         return f(*args, **kwargs)
     return decorated
\ No newline at end of file
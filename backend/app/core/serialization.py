@@ -0,0 +1,73 @@
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib json module is used without it
+    orjson = None
+
+# Selected by configure_serialization() at app start
+_backend = 'orjson' if orjson else 'stdlib'
+
+
+def backend():
+    return _backend
+
+
+def dumps(obj):
+    """Compact JSON text (non-ASCII kept as is) with the configured backend."""
+    if _backend == 'orjson':
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data):
+    """Parses JSON text or UTF-8 bytes with the configured backend."""
+    if _backend == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider (jsonify, request.get_json) on orjson.
+
+    Output matches DefaultJSONProvider: sorted keys, compact separators, and
+    datetimes/Decimals/UUIDs through the same `default` hook (orjson's own
+    datetime format is bypassed). Responses are built from bytes directly,
+    without an intermediate str.
+    """
+
+    def _dump_bytes(self, obj):
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self._dump_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dump_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+BACKENDS = ('auto', 'orjson', 'stdlib')
+
+
+def configure_serialization(app):
+    """Applies JSON_BACKEND to jsonify/get_json and to the services' dumps/loads."""
+    global _backend
+    name = app.config.get('JSON_BACKEND', 'auto')
+    if name not in BACKENDS:
+        raise ValueError(f"JSON_BACKEND must be one of {', '.join(BACKENDS)}")
+    if name == 'auto':
+        name = 'orjson' if orjson else 'stdlib'
+    elif name == 'orjson' and orjson is None:
+        raise ValueError("JSON_BACKEND is 'orjson' but the 'orjson' package is not installed")
+    _backend = name
+    if name == 'orjson':
+        app.json = OrjsonProvider(app)
@@ -0,0 +1,277 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect, insert, select, update
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.util import find_tables
+from app.core.cache import TTLCache
+from app.core.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+MODES = ('none', 'hash', 'per_user')
+# Tables holding one user's data. In sharded mode they live in the user's
+# shard; everything else (users, webhook events, the directory) stays in the
+# catalog database.
+TENANT_TABLES = frozenset({
+    'notes', 'note_tombstones', 'note_files', 'import_jobs', 'note_sequences', 'note_search_docs', 'notes_fts',
+})
+# Shard name of the catalog database itself: users whose notes predate
+# sharding are served from there until flask shards-rebalance moves them
+CATALOG = ''
+SHARD_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+# A user being moved is re-checked this often (seconds) instead of every SHARD_DIRECTORY_TTL
+MOVING_RECHECK_SECONDS = 1
+
+
+def _table_names(mapper, clause):
+    if mapper is not None:
+        return {inspect(mapper).local_table.name}
+    if clause is not None:
+        return {table.name for table in find_tables(clause, include_crud=True) if hasattr(table, 'name')}
+    return set()
+
+
+class ShardRouter:
+    """
+    Routes each user's notes to one of several SQLite files (SHARDING_MODE).
+
+    SQLite lets one writer at a time into a database file, so with a single
+    file every worker queues behind the same lock. Sharding splits the tenant
+    tables (TENANT_TABLES) across files by user: 'hash' spreads users over
+    SHARD_COUNT files, 'per_user' gives each user a file of their own. Writers
+    on different shards then commit in parallel, and group commit batches per
+    shard. The users table and the directory stay in the catalog database.
+
+    The catalog's tenant_shards table records where each user lives, so users
+    can be moved between shards (flask shards-move / shards-rebalance). A user
+    is placed on first access; one who already has notes in the catalog keeps
+    being served from there (CATALOG) until rebalanced.
+
+    A request binds its user's shard once (bind_tenant(), called by
+    token_required); RoutingSession then sends every statement touching a
+    tenant table -- or raw SQL, like the search index -- to that shard, and
+    everything else to the catalog. Background jobs and CLI commands bind a
+    tenant or a shard (use_shard()) themselves.
+    """
+
+    def __init__(self):
+        self.mode = 'none'
+        self.count = 1
+        self.directory = None
+        self.max_engines = 64
+        self.directory_cache = TTLCache()
+        self._app = None
+        self._engines = OrderedDict()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode != 'none'
+
+    def configure(self, app):
+        mode = app.config.get('SHARDING_MODE', 'none')
+        if mode not in MODES:
+            raise ValueError(f"SHARDING_MODE must be one of {', '.join(MODES)}")
+        if mode != 'none' and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite:///:memory:'):
+            raise ValueError('SHARDING_MODE needs a file-backed catalog database')
+        self.mode = mode
+        self.count = max(app.config.get('SHARD_COUNT', 8), 1)
+        self.directory = app.config.get('SHARD_DIR')
+        self.max_engines = max(app.config.get('SHARD_MAX_ENGINES', 64), 1)
+        self.directory_cache.maxsize = app.config.get('AUTH_CACHE_SIZE', 10000)
+        self.directory_cache.ttl = app.config.get('SHARD_DIRECTORY_TTL', 30)
+        self.directory_cache.clear()
+        self._app = app
+
+    # -- Placement ---------------------------------------------------------
+
+    def placement(self, user_id):
+        """The shard the placement policy assigns to a user."""
+        if self.mode == 'per_user':
+            return f'user-{user_id}'
+        return f'shard-{user_id % self.count:03d}'
+
+    def shard_for(self, user_id):
+        """The user's shard, placing them on first access. Raises a 503 while they are being moved."""
+        entry = self.directory_cache.get(user_id)
+        if entry is None:
+            from app.extensions import db
+            entry = self._lookup(user_id) or self._place(user_id)
+            # Commits a placement, and hands the catalog connection back rather than
+            # holding it while the request works on its shard
+            db.session.commit()
+            self.directory_cache.set(user_id, entry, ttl=None if entry[1] == 'active' else MOVING_RECHECK_SECONDS)
+        shard, state = entry
+        if state != 'active':
+            raise APIException('Your notes are being moved. Please retry in a few seconds.', 503,
+                               headers={'Retry-After': str(MOVING_RECHECK_SECONDS * 5)})
+        return shard
+
+    def _lookup(self, user_id):
+        # Through the request's session: it already holds a catalog connection (the principal
+        # lookup), and a second one per request could exhaust the pool under a login storm
+        from app.extensions import db
+        from app.models.tenant_shard import TenantShard
+        directory = TenantShard.__table__
+        row = db.session.execute(
+            select(directory.c.shard, directory.c.state).where(directory.c.user_id == user_id)
+        ).first()
+        return (row.shard, row.state) if row else None
+
+    def _place(self, user_id):
+        from app.extensions import db
+        from app.models.tenant_shard import TenantShard
+        from app.models.user import User
+        users = User.__table__
+        change_seq = db.session.execute(select(users.c.change_seq).where(users.c.id == user_id)).scalar()
+        # Someone who already wrote has notes in the catalog: serve them from there until rebalanced
+        shard = CATALOG if change_seq else self.placement(user_id)
+        if shard != CATALOG:
+            self.ensure_sequence(shard, user_id)
+        try:
+            db.session.execute(insert(TenantShard.__table__).values(user_id=user_id, shard=shard, state='active'))
+        except IntegrityError:
+            # Another worker placed them first
+            db.session.rollback()
+            return self._lookup(user_id)
+        logger.info('Placed user %s on shard %s', user_id, shard or '(catalog)')
+        return shard, 'active'
+
+    def ensure_sequence(self, shard, user_id, change_seq=0):
+        """Creates the user's change sequence row in a shard (kept if it exists)."""
+        from app.models.note_sequence import NoteSequence
+        with self.engine(shard).begin() as connection:
+            connection.execute(
+                sqlite.insert(NoteSequence.__table__).values(user_id=user_id, change_seq=change_seq)
+                .on_conflict_do_nothing()
+            )
+
+    def set_directory(self, user_id, **values):
+        """Updates (or creates) a user's directory row in the catalog and forgets the cached copy."""
+        from app.extensions import db
+        from app.models.tenant_shard import TenantShard
+        directory = TenantShard.__table__
+        with db.engine.begin() as connection:
+            updated = connection.execute(update(directory).where(directory.c.user_id == user_id).values(**values))
+            if not updated.rowcount:
+                connection.execute(insert(directory).values(user_id=user_id, **values))
+        self.directory_cache.invalidate(user_id)
+
+    # -- Binding -----------------------------------------------------------
+
+    def current(self):
+        """The shard bound to this app context (None when nothing is bound)."""
+        return g.get('shard') if has_app_context() else None
+
+    def in_shard(self):
+        """True when tenant tables currently resolve to a shard file rather than the catalog."""
+        return self.enabled and self.current() not in (None, CATALOG)
+
+    def bind_tenant(self, user_id):
+        """Routes this app context's tenant statements to the user's shard."""
+        if self.enabled:
+            g.shard = self.shard_for(user_id)
+
+    @contextmanager
+    def use_shard(self, shard):
+        """Binds a shard (or CATALOG) by name for the duration of the block."""
+        previous = g.get('shard')
+        g.shard = shard
+        try:
+            yield
+        finally:
+            g.shard = previous
+
+    def route(self, mapper, clause):
+        """The engine for a statement, or None for the catalog."""
+        tables = _table_names(mapper, clause)
+        if tables and tables.isdisjoint(TENANT_TABLES):
+            return None
+        shard = self.current()
+        if shard is None:
+            if tables & TENANT_TABLES:
+                raise RuntimeError(f"Query on {', '.join(sorted(tables & TENANT_TABLES))} with no shard bound "
+                                   "(call shard_router.bind_tenant() or use_shard() first)")
+            return None
+        if shard == CATALOG:
+            return None
+        return self.engine(shard)
+
+    # -- Engines -----------------------------------------------------------
+
+    def path(self, shard):
+        return os.path.join(self.directory, f'{shard}.db')
+
+    def engine(self, shard):
+        """The shard's engine, opened (and its schema created) on first use in this process."""
+        if not SHARD_NAME_RE.match(shard):
+            raise ValueError(f'Invalid shard name: {shard!r}')
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: never reuse the parent's pooled connections
+                self._engines, self._pid = OrderedDict(), os.getpid()
+            engine = self._engines.get(shard)
+            if engine is not None:
+                self._engines.move_to_end(shard)
+                return engine
+
+            from app.database import create_shard_engine, create_shard_schema
+            engine = create_shard_engine(self._app, self.path(shard))
+            create_shard_schema(engine, TENANT_TABLES)
+            self._engines[shard] = engine
+            while len(self._engines) > self.max_engines:
+                # Checked-out connections stay usable; they are closed when returned
+                _, evicted = self._engines.popitem(last=False)
+                evicted.dispose()
+            return engine
+
+    def shards(self):
+        """Names of the shard files that exist (plus, in 'hash' mode, every configured shard)."""
+        names = set()
+        if self.mode == 'hash':
+            names.update(f'shard-{index:03d}' for index in range(self.count))
+        if self.directory and os.path.isdir(self.directory):
+            names.update(name[:-3] for name in os.listdir(self.directory)
+                         if name.endswith('.db') and SHARD_NAME_RE.match(name[:-3]))
+        return sorted(names)
+
+    def databases(self):
+        """Every database holding notes: the catalog, then (when sharding) each shard."""
+        return [CATALOG] + self.shards() if self.enabled else [CATALOG]
+
+    def engine_for(self, database):
+        """The engine of a database named as in databases()."""
+        if database == CATALOG:
+            from app.extensions import db
+            return db.engine
+        return self.engine(database)
+
+
+# Process-wide router (engines are per worker)
+shard_router = ShardRouter()
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy's session, with tenant tables routed by shard_router."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and shard_router.enabled:
+            engine = shard_router.route(mapper, clause)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_sharding(app):
+    """Applies the SHARDING_MODE / SHARD_* settings."""
+    shard_router.configure(app)
+    if shard_router.enabled:
+        logger.info('Sharding notes by user (%s) under %s', shard_router.mode, shard_router.directory)
@@ -1,27 +1,109 @@
+import logging
 import os
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+from app.extensions import db
 
-db = SQLAlchemy()
+logger = logging.getLogger(__name__)
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+# Alembic revisions (Flask-Migrate) of the catalog database
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+def _sqlite_pragmas(config, foreign_keys=True):
+    synchronous = config['SQLITE_SYNCHRONOUS']
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}")
+    return [
+        # busy_timeout first, so the switch to WAL waits for other writers instead of failing
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        # Lets the maintenance scheduler hand free pages back in small steps. Only takes
+        # effect on a new file; existing ones switch over with `flask maintenance-vacuum`.
+        "PRAGMA auto_vacuum = INCREMENTAL",
+        "PRAGMA journal_mode = WAL",
+        f"PRAGMA synchronous = {synchronous}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        "PRAGMA temp_store = MEMORY",
+        f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}",
+    ]
+
+def _register_sqlite_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
 
 def init_db(app):
     """
-    Initializes the database.
-    Crucially, it only creates tables if the database file does not exist.
+    Binds the shared SQLAlchemy instance to the app and tunes its engine(s):
+    pool options come from Config.SQLALCHEMY_ENGINE_OPTIONS, and every new
+    SQLite connection gets WAL mode, a busy timeout and cache/mmap PRAGMAs.
     """
-    db_path = os.path.join(app.instance_path, 'data')
-    os.makedirs(db_path, exist_ok=True)
-    
-    db_file = os.path.join(db_path, 'fastnote.db')
-    
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_file}"
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('sqlite:///'):
+        # Ensure the directory for the SQLite database exists
+        db_path = uri.replace('sqlite:///', '', 1)
+        if db_path and db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
 
     db.init_app(app)
 
-    # Check if the database file already exists.
-    # If it doesn't, create the tables within an app context.
-    if not os.path.exists(db_file):
-        with app.app_context():
-            print("Database file not found, creating all tables.")
-            db.create_all()
-            print("Tables created.")
\ No newline at end of file
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            _register_sqlite_pragmas(engine, _sqlite_pragmas(app.config))
+
+        # gunicorn --preload builds the app before forking; never share pooled
+        # connections with the parent (close=False leaves the parent's open).
+        os.register_at_fork(after_in_child=lambda engine=engine: engine.dispose(close=False))
+
+def upgrade_schema(app):
+    """
+    Applies the migrations in MIGRATIONS_DIR (`flask db upgrade`): create_all
+    adds missing tables but never the columns later added to existing ones.
+    """
+    from flask_migrate import Migrate, upgrade
+    Migrate(app, db, directory=MIGRATIONS_DIR)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+
+def create_schema(app):
+    """
+    Brings the database up to date: pending migrations first, then any missing
+    tables (and the search index). Safe to run on every boot.
+    """
+    upgrade_schema(app)
+    with app.app_context():
+        # Import every model so create_all sees the full metadata
+        from app import models  # noqa: F401
+        from app.services import search_service  # noqa: F401
+        db.create_all()
+        # Shard files are created on first use too; 'hash' mode knows them all up front
+        from app.core.sharding import shard_router
+        if shard_router.enabled:
+            for shard in shard_router.shards():
+                shard_router.engine(shard)
+        logger.info("Database schema is up to date.")
+
+def create_shard_engine(app, path):
+    """
+    An engine for one shard file (see app.core.sharding), tuned like the
+    catalog's. Foreign keys stay off: the users they point at live in the catalog.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    engine = create_engine(f'sqlite:///{path}', **app.config['SHARD_ENGINE_OPTIONS'])
+    _register_sqlite_pragmas(engine, _sqlite_pragmas(app.config, foreign_keys=False))
+    return engine
+
+def create_shard_schema(engine, table_names):
+    """Creates the given (tenant) tables and the search index in a shard. Safe to repeat."""
+    from app import models  # noqa: F401
+    from app.services import search_service  # noqa: F401
+    tables = [db.metadata.tables[name] for name in table_names if name in db.metadata.tables]
+    db.metadata.create_all(engine, tables=tables)
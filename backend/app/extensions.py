@@ -1,6 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from app.core.sharding import RoutingSession
 
 # Centralized extension registry to avoid circular imports
-db = SQLAlchemy()
-migrate = Migrate()
+# (the session routes per-user tables to their shard, see app.core.sharding)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
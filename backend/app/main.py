@@ -1,36 +1,57 @@
-import os
 from flask import Flask
 from app.core.config import Config
-from app.core.logger import setup_logging
+from app.core.logger import init_request_logging, setup_logging
 from app.core.exceptions import register_error_handlers
+from app.cli import register_cli
+from app.core.security import init_auth_cache
+from app.core.passwords import init_password_hasher
+from app.core.admission import init_admission
+from app.core.metrics import init_metrics
+from app.core.change_feed import init_change_feed
+from app.core.group_commit import init_write_coordinator
+from app.core.serialization import configure_serialization
+from app.core.http_compression import init_response_compression
 # REMOVED 'cors' from imports
-from app.extensions import db, migrate
-from app.api.payments import payments_bp
+from app.database import init_db
+from app.core.sharding import init_sharding
+from app.models.types import configure_compression
+from app.services.webhook_inbox import init_webhook_worker
+from app.services.maintenance import init_maintenance_worker
 
 def create_app(config_class=Config):
-    setup_logging(config_class.LOG_LEVEL)
+    setup_logging(
+        config_class.LOG_LEVEL, config_class.LOG_FORMAT, config_class.LOG_QUEUE_SIZE, config_class.LOG_SAMPLE_RATES
+    )
     app = Flask(__name__)
     app.config.from_object(config_class)
 
-    db.init_app(app)
-    migrate.init_app(app, db)
+    init_db(app)
+    init_sharding(app)
+    configure_compression(app)
+    configure_serialization(app)
     
     # REMOVED: cors.init_app(app, resources={r"/api/*": {"origins": "*"}})
 
     register_error_handlers(app)
+    init_response_compression(app)
+    init_request_logging(app)
+    init_metrics(app)
+    register_cli(app)
+    init_auth_cache(app)
+    init_password_hasher(app)
+    init_admission(app)
+    init_write_coordinator(app)
+    init_change_feed(app)
+    init_webhook_worker(app)
+    init_maintenance_worker(app)
 
     from app.api.auth import auth_bp
     from app.api.notes import notes_bp
+    from app.api.payments import payments_bp
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(notes_bp, url_prefix='/api/notes')
     app.register_blueprint(payments_bp, url_prefix='/api/payments')
 
-    # Ensure the directory for the SQLite database exists
-    db_uri = app.config['SQLALCHEMY_DATABASE_URI']
-    if db_uri.startswith('sqlite:///'):
-        db_path = db_uri.replace('sqlite:///', '')
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-
     return app
 
 app = create_app()
\ No newline at end of file
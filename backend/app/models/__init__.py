@@ -1,2 +1,9 @@
 from .user import User
-from .note import Note
\ No newline at end of file
+from .note import Note
+from .tombstone import NoteTombstone
+from .import_job import ImportJob
+from .webhook_event import WebhookEvent
+from .note_file import NoteFile
+from .note_sequence import NoteSequence
+from .tenant_shard import TenantShard
+from .maintenance_run import MaintenanceRun
\ No newline at end of file
@@ -0,0 +1,34 @@
+from app.extensions import db
+import datetime
+import json
+import uuid
+
+class ImportJob(db.Model):
+    """Progress and per-record error report of a bulk import (polled by the client)."""
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pending') # 'pending', 'running', 'completed', 'failed'
+    received_bytes = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=True) # JSON list, capped at IMPORT_MAX_REPORTED_ERRORS
+    message = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'received_bytes': self.received_bytes,
+            'processed': self.processed,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'message': self.message,
+            'created_at': self.created_at.isoformat() + 'Z' if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() + 'Z' if self.finished_at else None
+        }
@@ -0,0 +1,19 @@
+from app.extensions import db
+import datetime
+
+class MaintenanceRun(db.Model):
+    """One run of a database maintenance job (see app.services.maintenance), kept in the catalog database."""
+    __tablename__ = 'maintenance_runs'
+    __table_args__ = (
+        # Last run of each job per database (scheduling and `flask maintenance-status`)
+        db.Index('ix_maintenance_runs_job_database_started', 'job', 'database', 'started_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(20), nullable=False)
+    database = db.Column(db.String(64), nullable=False, default='') # Shard name; '' = the catalog database
+    status = db.Column(db.String(10), nullable=False) # 'ok', 'partial' (budget or load cut it short), 'skipped', 'failed'
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    duration_ms = db.Column(db.Integer, nullable=False, default=0)
+    bytes_reclaimed = db.Column(db.BigInteger, nullable=False, default=0)
+    detail = db.Column(db.String(255), nullable=True)
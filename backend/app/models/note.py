@@ -1,25 +1,57 @@
 from app.extensions import db
+from app.models.types import CompressedText
 import datetime
 import uuid
 
+# Columns served by the lightweight listing (`view=summary`)
+SUMMARY_FIELDS = ('id', 'title', 'type', 'updated_at', 'content_size', 'preview')
+
 class Note(db.Model):
     __tablename__ = 'notes'
+    __table_args__ = (
+        db.Index('ix_notes_user_change_seq', 'user_id', 'change_seq'),
+        # Keyset pagination for listings: WHERE user_id = ? AND (updated_at, id) < (?, ?)
+        db.Index('ix_notes_user_updated_id', 'user_id', 'updated_at', 'id'),
+        # Per-user lookups by id (sync IN batches, ordered export walk)
+        db.Index('ix_notes_user_id', 'user_id', 'id'),
+    )
     
     # CHANGED: Now uses UUIDs generated by the frontend (or backend fallback)
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     title = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=True) # Text or String depending on what you used
+    content = db.Column(CompressedText, nullable=True) # Compressed above NOTE_COMPRESSION_MIN_BYTES (see models/types.py)
     type = db.Column(db.String(50), nullable=False, default='markdown')
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     # NEW: Critical for Last-Write-Wins conflict resolution
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
+    # NEW: Per-user change sequence used by the delta-pull half of /sync
+    change_seq = db.Column(db.Integer, nullable=False, default=0)
+
+    # NEW: Precomputed on write so listings never have to read `content`
+    content_size = db.Column(db.Integer, nullable=True)
+    preview = db.Column(db.String(200), nullable=True)
+    # NEW: SHA-256 of content, so unchanged bodies are never rewritten
+    content_hash = db.Column(db.String(64), nullable=True)
+
     def to_dict(self):
         return {
             'id': self.id,
             'title': self.title,
             'content': self.content,
             'type': self.type,
-            'updated_at': self.updated_at.isoformat() + 'Z' if self.updated_at else None
-        }
\ No newline at end of file
+            'updated_at': self.updated_at.isoformat() + 'Z' if self.updated_at else None,
+            # NEW: Base version for incremental (patch) updates
+            'content_hash': self.content_hash
+        }
+
+    def to_summary_dict(self, fields=SUMMARY_FIELDS):
+        """Serializes only the requested columns (see NoteService.get_all `fields`)."""
+        data = {}
+        for field in fields:
+            value = getattr(self, field)
+            if field == 'updated_at':
+                value = value.isoformat() + 'Z' if value else None
+            data[field] = value
+        return data
\ No newline at end of file
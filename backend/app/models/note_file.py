@@ -0,0 +1,13 @@
+from app.extensions import db
+import datetime
+
+class NoteFile(db.Model):
+    """An image embedded in an Excalidraw scene, stored once per user under the SHA-256 of its bytes."""
+    __tablename__ = 'note_files'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    hash = db.Column(db.String(64), primary_key=True)
+    mime_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False) # Decoded bytes (images are already compressed)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
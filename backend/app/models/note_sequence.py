@@ -0,0 +1,8 @@
+from app.extensions import db
+
+class NoteSequence(db.Model):
+    """A user's change sequence high-water mark inside their shard (users.change_seq when unsharded)."""
+    __tablename__ = 'note_sequences'
+
+    user_id = db.Column(db.Integer, primary_key=True) # users.id in the catalog database
+    change_seq = db.Column(db.Integer, nullable=False, default=0)
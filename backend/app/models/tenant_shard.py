@@ -0,0 +1,15 @@
+from app.extensions import db
+import datetime
+
+class TenantShard(db.Model):
+    """Shard directory (catalog database): where a user's notes live. See app.core.sharding."""
+    __tablename__ = 'tenant_shards'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    shard = db.Column(db.String(64), nullable=False) # '' = the catalog database itself (not migrated yet)
+    state = db.Column(db.String(10), nullable=False, default='active') # 'active' or 'moving'
+    # Shard being moved away from while state is 'moving'
+    previous_shard = db.Column(db.String(64), nullable=True)
+    # Placed by hand (flask shards-move); shards-rebalance leaves it alone
+    pinned = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
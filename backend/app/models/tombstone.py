@@ -0,0 +1,14 @@
+from app.extensions import db
+import datetime
+
+class NoteTombstone(db.Model):
+    """Records a hard-deleted note so other devices can pull the deletion."""
+    __tablename__ = 'note_tombstones'
+    __table_args__ = (
+        db.Index('ix_note_tombstones_user_change_seq', 'user_id', 'change_seq'),
+    )
+
+    note_id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
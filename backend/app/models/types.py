@@ -0,0 +1,71 @@
+import zlib
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib is used when zstd isn't installed
+    zstandard = None
+
+# First byte of every stored body says how the rest is encoded. Rows written
+# before compression existed are plain TEXT and come back as `str`.
+CODEC_RAW = 0x00
+CODEC_ZLIB = 0x01
+CODEC_ZSTD = 0x02
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text column stored as `codec byte + payload`. Bodies of at least
+    `min_size` bytes are compressed with the configured codec; smaller ones are
+    stored raw. Reading accepts every codec plus legacy uncompressed text.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    # Set from Config by configure_compression() at app start
+    codec = CODEC_ZSTD if zstandard else CODEC_ZLIB
+    min_size = 1024
+    level = 3
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        raw = value.encode('utf-8')
+        codec = CompressedText.codec
+        if len(raw) < CompressedText.min_size or codec == CODEC_RAW:
+            return bytes([CODEC_RAW]) + raw
+        if codec == CODEC_ZSTD:
+            return bytes([CODEC_ZSTD]) + zstandard.ZstdCompressor(level=CompressedText.level).compress(raw)
+        return bytes([CODEC_ZLIB]) + zlib.compress(raw, CompressedText.level)
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        if not value:
+            return ''
+        codec, payload = value[0], value[1:]
+        if codec == CODEC_RAW:
+            return payload.decode('utf-8')
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(payload).decode('utf-8')
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Note body is zstd-compressed but the 'zstandard' package is not installed")
+            return zstandard.ZstdDecompressor().decompress(payload).decode('utf-8')
+        raise ValueError(f'Unknown note body codec: {codec}')
+
+
+CODECS = {'none': CODEC_RAW, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+
+def configure_compression(app):
+    """Applies NOTE_COMPRESSION / NOTE_COMPRESSION_MIN_BYTES / NOTE_COMPRESSION_LEVEL."""
+    name = app.config.get('NOTE_COMPRESSION', 'zstd')
+    if name not in CODECS:
+        raise ValueError(f"NOTE_COMPRESSION must be one of {', '.join(CODECS)}")
+    if name == 'zstd' and zstandard is None:
+        name = 'zlib'
+    CompressedText.codec = CODECS[name]
+    CompressedText.min_size = app.config.get('NOTE_COMPRESSION_MIN_BYTES', 1024)
+    CompressedText.level = app.config.get('NOTE_COMPRESSION_LEVEL', 3)
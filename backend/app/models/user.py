@@ -1,5 +1,5 @@
 from app.extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.core.passwords import password_hasher
 from sqlalchemy.orm import relationship
 import datetime
 
@@ -15,11 +15,20 @@ class User(db.Model):
     dodo_customer_id = db.Column(db.String(100), nullable=True)
     subscription_id = db.Column(db.String(100), nullable=True)
     trial_ends_at = db.Column(db.DateTime, nullable=True)
+    # NEW: Provider timestamp of the last applied subscription event (late retries of older ones are skipped)
+    subscription_event_at = db.Column(db.DateTime, nullable=True)
+
+    # NEW: High-water mark of this user's note change sequence (see ChangeLog)
+    change_seq = db.Column(db.Integer, nullable=False, default=0)
     
     notes = relationship('Note', backref='author', lazy=True, cascade="all, delete-orphan")
 
+    # Hashing runs on the password hasher's thread pool (see app.core.passwords)
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
\ No newline at end of file
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
\ No newline at end of file
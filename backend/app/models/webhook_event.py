@@ -0,0 +1,21 @@
+from app.extensions import db
+import datetime
+
+class WebhookEvent(db.Model):
+    """Inbox of verified payment-provider webhooks, keyed by their `webhook-id` header."""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        # The worker's queue scan: pending events, oldest first
+        db.Index('ix_webhook_events_status_event_at', 'status', 'event_at'),
+    )
+
+    webhook_id = db.Column(db.String(255), primary_key=True)
+    event_type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False) # Raw, signature-verified JSON body
+    status = db.Column(db.String(20), nullable=False, default='pending') # 'pending', 'processed', 'ignored', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    event_at = db.Column(db.DateTime, nullable=False) # When the provider says it happened (ordering key)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
@@ -1,4 +1,4 @@
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, validate, validates_schema
 
 class NoteSchema(Schema):
     # Strip whitespace, require a title, and limit length
@@ -19,4 +19,20 @@ class NoteSchema(Schema):
         )
     )
 
-note_schema = NoteSchema()
\ No newline at end of file
+class NoteUpdateSchema(NoteSchema):
+    # NEW: Incremental updates. Instead of `content`, the client may send a `patch`
+    # (see app.services.patching) computed against the body whose SHA-256 is `base_hash`.
+    patch = fields.Raw()
+    base_hash = fields.String(validate=validate.Length(equal=64, error="base_hash must be a SHA-256 hex digest."))
+
+    @validates_schema
+    def check_patch(self, data, **kwargs):
+        if 'patch' not in data:
+            return
+        if 'content' in data:
+            raise ValidationError("Send either 'content' or 'patch', not both.", 'patch')
+        if 'base_hash' not in data:
+            raise ValidationError("A patch requires the 'base_hash' it was computed against.", 'base_hash')
+
+note_schema = NoteSchema()
+note_update_schema = NoteUpdateSchema()
\ No newline at end of file
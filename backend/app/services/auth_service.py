@@ -23,7 +23,7 @@ class AuthService:
         db.session.add(user)
         db.session.commit()
         
-        logger.info(f"New user registered: {username}")
+        logger.info('New user registered: %s', username)
         return {'message': 'User created successfully'}
 
     @staticmethod
@@ -34,11 +34,17 @@ class AuthService:
         user = User.query.filter_by(username=username).first()
 
         if not user or not user.check_password(password):
-            logger.warning(f"Failed login attempt for: {username}")
+            logger.warning('Failed login attempt for: %s', username)
             raise APIException('Invalid username or password', 401)
 
+        # Upgrade hashes made with an older algorithm/cost while we have the plaintext
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+            logger.info('Rehashed password of user %s with the current parameters', user.id)
+
         token = generate_token(user.id, user.username)
-        logger.info(f"User logged in: {username}")
+        logger.info('User logged in: %s', username)
         
         return {
             'token': token,
@@ -0,0 +1,149 @@
+from sqlalchemy import delete, insert, select, update
+from app.models.note import Note
+from app.models.tombstone import NoteTombstone
+from app.models.user import User
+from app.models.note_sequence import NoteSequence
+from app.extensions import db
+from app.core.exceptions import APIException
+from app.core.sharding import shard_router
+
+
+class ChangeLog:
+    """
+    Per-user change sequence backing the delta-pull half of /sync.
+
+    Every write stamps the affected notes (or their tombstones) with a fresh
+    value from users.change_seq (note_sequences inside a shard, so a write
+    never touches the catalog). Clients keep the last value they saw as an
+    opaque cursor and only download rows stamped after it.
+    """
+
+    @staticmethod
+    def _sequence():
+        """The table holding the user's counter and its user id column."""
+        if shard_router.in_shard():
+            sequences = NoteSequence.__table__
+            return sequences, sequences.c.user_id
+        users = User.__table__
+        return users, users.c.id
+
+    @staticmethod
+    def allocate(user_id, count=1):
+        """
+        Reserves `count` sequence numbers for the user and returns the first one.
+
+        The UPDATE also takes the user's write lock for the rest of the
+        transaction, so concurrent writers of the same user are serialized and
+        a cursor can never skip over a row that commits later.
+        """
+        table, key = ChangeLog._sequence()
+        stmt = update(table).where(key == user_id).values(change_seq=table.c.change_seq + count)
+
+        if db.session.get_bind(clause=stmt).dialect.update_returning:
+            last = db.session.execute(stmt.returning(table.c.change_seq)).scalar_one()
+        else:
+            db.session.execute(stmt)
+            last = db.session.execute(select(table.c.change_seq).where(key == user_id)).scalar_one()
+        return last - count + 1
+
+    @staticmethod
+    def current(user_id):
+        """The user's latest change sequence number (0 if they never wrote)."""
+        table, key = ChangeLog._sequence()
+        return db.session.execute(select(table.c.change_seq).where(key == user_id)).scalar() or 0
+
+    @staticmethod
+    def lock(user_id):
+        """
+        Takes the user's write lock, as allocate() does, without advancing the
+        counter, and returns their current sequence number.
+        """
+        table, key = ChangeLog._sequence()
+        db.session.execute(update(table).where(key == user_id).values(change_seq=table.c.change_seq))
+        return ChangeLog.current(user_id)
+
+    @staticmethod
+    def restore(user_id, change_seq):
+        """Raises the user's counter to `change_seq` (their notes moved here from another shard)."""
+        table, key = ChangeLog._sequence()
+        db.session.execute(
+            update(table).where(key == user_id, table.c.change_seq < change_seq).values(change_seq=change_seq)
+        )
+
+    @staticmethod
+    def parse_cursor(value):
+        """Validates a client `since` cursor."""
+        if isinstance(value, bool):
+            raise APIException("Invalid sync cursor. 'since' must be a non-negative integer.", 400)
+        try:
+            cursor = int(value)
+        except (TypeError, ValueError):
+            raise APIException("Invalid sync cursor. 'since' must be a non-negative integer.", 400)
+        if cursor < 0:
+            raise APIException("Invalid sync cursor. 'since' must be a non-negative integer.", 400)
+        return cursor
+
+    @staticmethod
+    def record_deletes(user_id, note_ids, first_seq):
+        """Writes tombstones for hard-deleted notes, one sequence number each."""
+        if not note_ids:
+            return
+        tombstones = NoteTombstone.__table__
+        db.session.execute(delete(tombstones).where(tombstones.c.note_id.in_(note_ids)))
+        db.session.execute(insert(tombstones), [
+            {'note_id': note_id, 'user_id': user_id, 'change_seq': first_seq + offset}
+            for offset, note_id in enumerate(note_ids)
+        ])
+
+    @staticmethod
+    def clear_tombstones(user_id, note_ids):
+        """Drops tombstones of notes that were re-created (e.g. by a stale device)."""
+        if not note_ids:
+            return
+        tombstones = NoteTombstone.__table__
+        db.session.execute(
+            delete(tombstones).where(tombstones.c.user_id == user_id, tombstones.c.note_id.in_(note_ids))
+        )
+
+    @staticmethod
+    def changes_since(user_id, since, limit, exclude_ids=()):
+        """
+        Returns the notes and tombstones stamped after `since`, oldest first.
+
+        At most `limit` changes are returned; `cursor` is the sequence number of
+        the last one included so the client can resume with `has_more`.
+        Changes to notes in `exclude_ids` (just pushed by the caller) advance
+        the cursor but are not sent back.
+        """
+        notes = Note.query.filter(
+            Note.user_id == user_id, Note.change_seq > since
+        ).order_by(Note.change_seq).limit(limit + 1).all()
+
+        tombstones = db.session.execute(
+            select(NoteTombstone.note_id, NoteTombstone.change_seq)
+            .where(NoteTombstone.user_id == user_id, NoteTombstone.change_seq > since)
+            .order_by(NoteTombstone.change_seq)
+            .limit(limit + 1)
+        ).all()
+
+        merged = sorted(
+            [(note.change_seq, 'upsert', note) for note in notes]
+            + [(row.change_seq, 'delete', row.note_id) for row in tombstones],
+            key=lambda change: change[0],
+        )
+        has_more = len(merged) > limit
+        merged = merged[:limit]
+
+        upserts, deletes = [], []
+        for _, kind, value in merged:
+            if kind == 'delete':
+                if value not in exclude_ids:
+                    deletes.append(value)
+            elif value.id not in exclude_ids:
+                upserts.append(value.to_dict())
+
+        return {
+            'changes': {'upserts': upserts, 'deletes': deletes},
+            'cursor': merged[-1][0] if merged else since,
+            'has_more': has_more,
+        }
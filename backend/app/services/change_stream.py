@@ -0,0 +1,60 @@
+from flask import current_app
+from app.extensions import db
+from app.core.change_feed import change_feed
+from app.services.change_log import ChangeLog
+import json
+import time
+
+
+def _current(user_id):
+    """Reads the user's change sequence and hands the connection back to the pool."""
+    current = ChangeLog.current(user_id)
+    # Idle clients must not pin pooled connections (or an SQLite read snapshot) while they wait
+    db.session.close()
+    return current
+
+
+class ChangeStream:
+    """
+    Blocking change notifications for GET /api/notes/changes.
+
+    Both variants only report the user's latest change-sequence cursor; the
+    client then fetches the actual changes with /sync and `since`.
+    """
+
+    @staticmethod
+    def wait(user_id, since, timeout):
+        """Long-poll: returns as soon as the user's cursor passes `since`, or after `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        with change_feed.subscribe(user_id) as subscription:
+            while True:
+                current = _current(user_id)
+                remaining = deadline - time.monotonic()
+                if current > since or remaining <= 0:
+                    return {'cursor': current, 'changed': current > since}
+                subscription.wait(remaining)
+
+    @staticmethod
+    def events(user_id, since):
+        """
+        Server-Sent Events: a `change` event whenever the cursor moves, comment
+        heartbeats in between (keeping proxies from closing the connection),
+        and a clean end after CHANGE_FEED_STREAM_SECONDS so the browser
+        reconnects with Last-Event-ID.
+        """
+        heartbeat = current_app.config.get('CHANGE_FEED_HEARTBEAT', 15)
+        deadline = time.monotonic() + current_app.config.get('CHANGE_FEED_STREAM_SECONDS', 300)
+
+        yield 'retry: 3000\n\n'
+        with change_feed.subscribe(user_id) as subscription:
+            while True:
+                current = _current(user_id)
+                if since is None or current > since:
+                    since = current
+                    yield f"id: {current}\nevent: change\ndata: {json.dumps({'cursor': current})}\n\n"
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if not subscription.wait(min(heartbeat, remaining)):
+                    yield ': keepalive\n\n'
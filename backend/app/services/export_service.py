@@ -0,0 +1,130 @@
+from app.models.note import Note
+from app.extensions import db
+from app.services.scene_files import SceneFiles
+from app.core import serialization
+from collections import namedtuple
+import io
+import re
+import zipfile
+import zlib
+
+# Rows fetched per round-trip from the server-side cursor
+EXPORT_BATCH_SIZE = 200
+# Flush the output buffer to the client once it holds this many bytes
+FLUSH_BYTES = 64 * 1024
+FILE_EXTENSIONS = {'markdown': 'md', 'excalidraw': 'excalidraw'}
+UNSAFE_FILENAME_RE = re.compile(r'[^\w\- ]+', re.UNICODE)
+ExportRow = namedtuple('ExportRow', ['id', 'title', 'content', 'type', 'updated_at'])
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, non-seekable buffer that ZipFile streams into and the generator drains."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def __len__(self):
+        return len(self._buffer)
+
+
+def _record(row):
+    return {
+        'id': row.id,
+        'title': row.title,
+        'content': row.content,
+        'type': row.type,
+        'updated_at': row.updated_at.isoformat() + 'Z' if row.updated_at else None
+    }
+
+
+def _buffered(pieces):
+    """Joins small text pieces into ~FLUSH_BYTES encoded chunks."""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _filename(row):
+    title = UNSAFE_FILENAME_RE.sub('', row.title or '').strip()[:80] or 'Untitled'
+    # The id suffix keeps names unique and lets a client resume with ?after=<id>
+    return f"{title} ({row.id}).{FILE_EXTENSIONS.get(row.type, 'txt')}"
+
+
+class ExportService:
+    """Streams a user's whole library with flat memory use, whatever its size."""
+
+    @staticmethod
+    def iter_notes(user_id, after=None, inline_files=True):
+        """
+        Yields the user's notes ordered by id through a server-side cursor.
+        `after` resumes an interrupted export right after the last id received.
+        With `inline_files`, scene images stored apart (see SceneFiles) are put
+        back as data URLs so the export is self-contained.
+        """
+        query = (
+            db.select(Note.id, Note.title, Note.content, Note.type, Note.updated_at)
+            .where(Note.user_id == user_id)
+            .order_by(Note.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        if after:
+            query = query.where(Note.id > after)
+        for row in db.session.execute(query):
+            if inline_files and row.type == 'excalidraw':
+                row = ExportRow(row.id, row.title, SceneFiles.inline(user_id, row.type, row.content), row.type, row.updated_at)
+            yield row
+
+    @staticmethod
+    def ndjson_chunks(rows):
+        return _buffered(serialization.dumps(_record(row)) + '\n' for row in rows)
+
+    @staticmethod
+    def json_chunks(rows):
+        """A JSON array (the format /import accepts), emitted element by element."""
+        def pieces():
+            yield '['
+            for index, row in enumerate(rows):
+                yield (',' if index else '') + serialization.dumps(_record(row))
+            yield ']'
+        return _buffered(pieces())
+
+    @staticmethod
+    def zip_chunks(rows):
+        """A zip of .md / .excalidraw files, written to the client as each file is compressed."""
+        sink = _ZipSink()
+        with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for row in rows:
+                stamp = row.updated_at.timetuple()[:6] if row.updated_at else (1980, 1, 1, 0, 0, 0)
+                info = zipfile.ZipInfo(_filename(row), date_time=stamp)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, row.content or '')
+                if len(sink) >= FLUSH_BYTES:
+                    yield sink.drain()
+        yield sink.drain()
+
+    @staticmethod
+    def gzip_chunks(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
@@ -0,0 +1,115 @@
+import codecs
+import json
+from app.core import serialization
+
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
+
+
+class InvalidRecord:
+    """Placeholder yielded for an input record that is not valid JSON."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class ImportFormatError(ValueError):
+    """The input as a whole is malformed and parsing cannot continue."""
+
+
+def sniff_format(fileobj):
+    """Returns 'json' for a JSON array and 'ndjson' otherwise, without consuming input."""
+    head = fileobj.read(READ_SIZE)
+    fileobj.seek(0)
+    stripped = head.lstrip(b' \t\r\n\xef\xbb\xbf')
+    return 'json' if stripped.startswith(b'[') else 'ndjson'
+
+
+def iter_ndjson(fileobj):
+    """Yields one decoded object (or InvalidRecord) per non-empty line."""
+    for line_number, raw in enumerate(fileobj, start=1):
+        line = raw.strip()
+        if line_number == 1:
+            line = line.removeprefix(codecs.BOM_UTF8)
+        if not line:
+            continue
+        try:
+            yield serialization.loads(line)
+        except ValueError as err:
+            yield InvalidRecord(f'Line {line_number}: {err}')
+
+
+def iter_json_array(fileobj):
+    """
+    Yields the elements of a top-level JSON array while reading the input in
+    READ_SIZE chunks, so only the element being decoded is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    reader = _TextReader(fileobj)
+
+    if reader.next_significant() != '[':
+        raise ImportFormatError('Expected a JSON array of notes.')
+    reader.advance(1)
+
+    if reader.next_significant() == ']':
+        return
+
+    while True:
+        reader.next_significant()
+        while True:
+            try:
+                item, end = decoder.raw_decode(reader.buffer, reader.pos)
+            except ValueError as err:
+                # The element may simply be cut off at the end of the buffer;
+                # read geometrically larger chunks so huge notes aren't re-parsed O(n^2)
+                if not reader.fill(grow=True):
+                    raise ImportFormatError(f'Invalid JSON array: {err}')
+                continue
+            # A scalar ending exactly at the buffer edge may continue in the next chunk
+            if end < len(reader.buffer) or not reader.fill():
+                break
+        reader.pos = end
+        reader.read_size = READ_SIZE
+        yield item
+
+        separator = reader.next_significant()
+        reader.advance(1)
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ImportFormatError("Invalid JSON array: expected ',' or ']' between notes.")
+
+
+class _TextReader:
+    """Sliding text window over a binary file for the incremental array parser."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.buffer = ''
+        self.pos = 0
+        self.read_size = READ_SIZE
+        self._utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+
+    def fill(self, grow=False):
+        """Appends the next chunk (dropping consumed text). Returns False at EOF."""
+        if grow:
+            self.read_size *= 2
+        chunk = self.fileobj.read(self.read_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + self._utf8.decode(chunk)
+        self.pos = 0
+        return True
+
+    def next_significant(self):
+        """Skips whitespace and returns the next character ('' at EOF) without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def advance(self, count):
+        self.pos += count
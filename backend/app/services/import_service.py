@@ -0,0 +1,158 @@
+from flask import current_app
+from app.models.import_job import ImportJob
+from app.extensions import db
+from app.core.exceptions import APIException
+from app.core.sharding import shard_router
+from app.services.import_parser import ImportFormatError, iter_json_array, iter_ndjson, sniff_format
+from app.services.note_service import NoteService
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SPOOL_READ_SIZE = 64 * 1024
+SPOOL_PREFIX = 'fastnote-import-'
+# Message of jobs whose worker died before finishing them
+ABANDONED_MESSAGE = 'Import was interrupted; please upload the file again'
+# Pause between import chunks. Not 0: gevent's sleep(0) only runs greenlets that are
+# already runnable, without polling sockets, so waiting requests would never be accepted
+YIELD_SECONDS = 0.001
+
+
+def _cooperative(records, every):
+    """
+    Passes `records` through, pausing every `every` records to let other work
+    run. Under gevent the import worker is a greenlet, and parsing, validation
+    and sqlite3 calls never yield by themselves: without this a large import
+    would hold the whole worker until it finished. (time.sleep is gevent's
+    once patched; for a real thread, it just releases the GIL.)
+    """
+    for index, record in enumerate(records, start=1):
+        yield record
+        if index % every == 0:
+            time.sleep(YIELD_SECONDS)
+
+
+class ImportService:
+    """
+    Runs bulk imports as pollable jobs.
+
+    The request body is spooled to a temporary file (never held in memory),
+    then parsed incrementally and written chunk by chunk by a background
+    worker while the client polls GET /api/notes/import/<job_id>.
+    """
+
+    @staticmethod
+    def start(user_id, stream):
+        max_bytes = current_app.config.get('IMPORT_MAX_BYTES', 100 * 1024 * 1024)
+
+        spool = tempfile.NamedTemporaryFile(prefix=SPOOL_PREFIX, delete=False)
+        received = 0
+        try:
+            with spool:
+                while True:
+                    chunk = stream.read(SPOOL_READ_SIZE)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise APIException(f'Import too large. The limit is {max_bytes} bytes.', 413)
+                    spool.write(chunk)
+        except Exception:
+            os.unlink(spool.name)
+            raise
+
+        job = ImportJob(user_id=user_id, received_bytes=received)
+        db.session.add(job)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        worker = threading.Thread(target=ImportService._run, args=(app, user_id, job.id, spool.name), daemon=True)
+        worker.start()
+        logger.info('Import job %s queued for user %s (%d bytes)', job.id, user_id, received)
+        return job.to_dict()
+
+    @staticmethod
+    def get(user_id, job_id):
+        job = ImportJob.query.filter_by(id=job_id, user_id=user_id).first()
+        if not job:
+            raise APIException('Import job not found or access denied', 404)
+        return job.to_dict()
+
+    @staticmethod
+    def prune_spools(max_age_seconds):
+        """
+        Deletes upload spools older than `max_age_seconds` (left by a worker that
+        died mid-import). Returns (files deleted, bytes freed).
+        """
+        directory = tempfile.gettempdir()
+        cutoff = time.time() - max_age_seconds
+        removed = freed = 0
+        for name in os.listdir(directory):
+            if not name.startswith(SPOOL_PREFIX):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime < cutoff:
+                    os.unlink(path)
+                    removed, freed = removed + 1, freed + stat.st_size
+            except OSError:
+                continue # Finished (and removed) meanwhile
+        return removed, freed
+
+    @staticmethod
+    def fail_abandoned(created_before):
+        """
+        Marks jobs created before `created_before` that never finished as failed:
+        the worker that ran them died, and their spool is gone. Returns how many.
+        """
+        abandoned = db.session.execute(
+            db.update(ImportJob)
+            .where(ImportJob.status.in_(('pending', 'running')), ImportJob.created_at < created_before)
+            .values(status='failed', message=ABANDONED_MESSAGE, finished_at=datetime.datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return abandoned
+
+    @staticmethod
+    def _run(app, user_id, job_id, path):
+        with app.app_context():
+            shard_router.bind_tenant(user_id)
+            job = db.session.get(ImportJob, job_id)
+            job.status = 'running'
+            db.session.commit()
+
+            def on_progress(report):
+                job.processed = report['processed']
+                job.imported = report['imported']
+                job.failed = report['failed']
+                job.errors = json.dumps(report['errors'])
+
+            try:
+                with open(path, 'rb') as spool:
+                    parser = iter_json_array if sniff_format(spool) == 'json' else iter_ndjson
+                    records = _cooperative(parser(spool), current_app.config.get('IMPORT_CHUNK_SIZE', 200))
+                    NoteService.import_notes(job.user_id, records, on_progress=on_progress)
+                job.status = 'completed'
+            except ImportFormatError as err:
+                db.session.rollback()
+                # Chunks committed before the syntax error stay imported
+                job.status = 'failed'
+                job.message = str(err)[:255]
+            except Exception:
+                db.session.rollback()
+                logger.error('Import job %s crashed', job_id, exc_info=True)
+                job.status = 'failed'
+                job.message = 'Internal error while importing'
+            finally:
+                os.unlink(path)
+
+            job.finished_at = datetime.datetime.utcnow()
+            db.session.commit()
+            logger.info('Import job %s %s: %d imported, %d rejected', job_id, job.status, job.imported, job.failed)
@@ -0,0 +1,487 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from flask import current_app, g
+from sqlalchemy import delete, func, select
+from app.extensions import db
+from app.core.metrics import record_maintenance
+from app.core.sharding import CATALOG, shard_router
+from app.models.maintenance_run import MaintenanceRun
+from app.services.import_service import ImportService
+from app.services.scene_files import SceneFiles
+from app.services.search_service import SEARCH_BACKENDS, SearchService
+from app.services.shard_service import ShardService, label
+import datetime
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows: no flock, but no gunicorn workers to elect between either
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Jobs MAINTENANCE_JOBS can schedule ('full_vacuum' only runs through flask maintenance-vacuum)
+SCHEDULED_JOBS = ('checkpoint', 'vacuum', 'optimize', 'orphans')
+# Budget (seconds) of a job named on the command line but not scheduled
+DEFAULT_BUDGET = 60
+# Free pages handed back per incremental_vacuum step, FTS5 pages merged per step
+VACUUM_STEP_PAGES = 512
+FTS_MERGE_PAGES = 256
+# Rows ANALYZE samples per index: approximate statistics in bounded time
+ANALYSIS_LIMIT = 1000
+# Longest a maintenance statement waits for the write lock, and how long a TRUNCATE
+# checkpoint (which holds that lock meanwhile) waits for readers to let go of the WAL
+STEP_WAIT_MS = 1000
+TRUNCATE_WAIT_MS = 200
+# Users whose scene images are checked per query
+ORPHAN_USERS_PER_QUERY = 100
+# Upload spools (and unfinished import jobs) older than this belong to an import whose worker died
+SPOOL_MAX_AGE_SECONDS = 24 * 3600
+# Waiting out load doubles the backoff up to this many times MAINTENANCE_BACKOFF_SECONDS
+MAX_BACKOFF_FACTOR = 32
+# Pause between steps, so a gevent worker serves its requests while a job runs
+# (gevent's sleep(0) would not poll sockets; see ImportService)
+STEP_PAUSE_SECONDS = 0.001
+
+# status: 'ok', 'partial' (stopped by its budget or by load; resumes soon), 'skipped';
+# cursor: where a partial run stopped, handed to the next run of the job on that database
+JobResult = namedtuple('JobResult', 'status reclaimed detail cursor', defaults=(None,))
+
+
+def parse_jobs(value):
+    """Parses 'job=interval:budget,...' (MAINTENANCE_JOBS, seconds) into {job: (interval, budget)}."""
+    jobs = {}
+    for item in (value or '').split(','):
+        name, _, schedule = item.partition('=')
+        name = name.strip()
+        if not name:
+            continue
+        if name not in SCHEDULED_JOBS:
+            raise ValueError(f"Unknown maintenance job {name!r} (expected one of {', '.join(SCHEDULED_JOBS)})")
+        interval, _, budget = schedule.partition(':')
+        jobs[name] = (float(interval), float(budget) if budget.strip() else DEFAULT_BUDGET)
+    return jobs
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _database_file(connection):
+    # '' for in-memory databases
+    return next((row[2] for row in connection.exec_driver_sql('PRAGMA database_list') if row[1] == 'main'), '')
+
+
+@contextmanager
+def _connection(database, wait_ms=STEP_WAIT_MS):
+    """
+    An autocommit connection to one database (checkpoints and VACUUM can't run
+    in a transaction) that gives up on the write lock after `wait_ms`.
+    """
+    with shard_router.engine_for(database).connect() as connection:
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        if connection.dialect.name != 'sqlite':
+            yield connection
+            return
+        connection.exec_driver_sql(f'PRAGMA busy_timeout = {int(wait_ms)}')
+        try:
+            yield connection
+        finally:
+            # The connection goes back to the pool
+            connection.exec_driver_sql(f"PRAGMA busy_timeout = {int(current_app.config['SQLITE_BUSY_TIMEOUT_MS'])}")
+
+
+class MaintenanceService:
+    """
+    Database maintenance jobs. Each works on one database (the catalog or a
+    shard) and calls `should_stop()` between bounded steps, returning a
+    'partial' result when its time budget ran out or the host got busy.
+    """
+
+    @staticmethod
+    def checkpoint(database, should_stop, cursor=None):
+        """Copies the WAL back into the database file and, if no reader still needs it, truncates it."""
+        with _connection(database) as connection:
+            if connection.dialect.name != 'sqlite':
+                return JobResult('skipped', 0, 'the database server checkpoints by itself')
+            wal = _database_file(connection) + '-wal'
+            before = _size(wal)
+            busy, frames, copied = connection.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)').one()
+            if frames < 0:
+                return JobResult('skipped', 0, 'not in WAL mode')
+            if not busy and frames == copied and not should_stop():
+                connection.exec_driver_sql(f'PRAGMA busy_timeout = {TRUNCATE_WAIT_MS}')
+                busy, frames, copied = connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').one()
+
+            reclaimed = max(before - _size(wal), 0)
+            if busy or frames != copied:
+                return JobResult('partial', reclaimed, f'{copied} of {frames} WAL frames copied; readers still need the rest')
+            return JobResult('ok', reclaimed, f'WAL was {before} bytes')
+
+    @staticmethod
+    def vacuum(database, should_stop, cursor=None):
+        """Hands free pages (space of deleted notes and files) back to the file system, a few at a time."""
+        with _connection(database) as connection:
+            if connection.dialect.name != 'sqlite':
+                return JobResult('skipped', 0, 'autovacuum runs on the database server')
+            if connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+                return JobResult('skipped', 0, 'auto_vacuum is not INCREMENTAL (run flask maintenance-vacuum once)')
+            page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+            free = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+            freed = 0
+            while free and not should_stop():
+                # sqlite3's execute() steps a row-less statement once, and a step of
+                # incremental_vacuum frees one page: executescript() runs it to the end
+                connection.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})')
+                remaining = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+                freed += free - remaining
+                if remaining >= free:
+                    break
+                free = remaining
+            # The file shrinks at the next checkpoint
+            return JobResult('partial' if free else 'ok', freed * page_size, f'{freed} pages freed, {free} left')
+
+    @staticmethod
+    def optimize(database, should_stop, cursor=None):
+        """Refreshes the query planner's statistics and merges the search index's segments."""
+        with _connection(database) as connection:
+            if connection.dialect.name != 'sqlite':
+                connection.exec_driver_sql('ANALYZE')
+                return JobResult('ok', 0, 'analyzed')
+            connection.exec_driver_sql(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+            connection.exec_driver_sql('ANALYZE')
+
+            backend = SEARCH_BACKENDS.get('sqlite')
+            steps, more = 0, True
+            while more and not should_stop():
+                more = backend.merge(connection, FTS_MERGE_PAGES)
+                steps += 1
+            return JobResult('partial' if more else 'ok', 0, f'analyzed, {steps} search index merge steps')
+
+    @staticmethod
+    def orphans(database, should_stop, cursor=None):
+        """
+        Deletes what nothing refers to any more: search entries of deleted notes,
+        scene images no note uses (after MAINTENANCE_ORPHAN_FILE_DAYS), copies
+        left behind by interrupted shard moves, dead import spools and old run
+        history. Imports left unfinished by a dead worker are marked failed.
+        `cursor` is the last user whose images were checked.
+        """
+        config = current_app.config
+        counts = {'search entries': 0, 'images': 0, 'leftover copies': 0, 'spools': 0, 'abandoned imports': 0}
+        reclaimed = 0
+
+        def result(status, cursor=None):
+            detail = ', '.join(f'{count} {name}' for name, count in counts.items() if count) or 'nothing to delete'
+            return JobResult(status, reclaimed, detail, cursor)
+
+        with shard_router.use_shard(database):
+            counts['abandoned imports'] = ImportService.fail_abandoned(
+                _utcnow() - datetime.timedelta(seconds=SPOOL_MAX_AGE_SECONDS)
+            )
+            while True:
+                if should_stop():
+                    return result('partial', cursor)
+                pruned = SearchService.prune_orphans()
+                db.session.commit()
+                counts['search entries'] += pruned
+                if not pruned:
+                    break
+
+            created_before = _utcnow() - datetime.timedelta(days=config.get('MAINTENANCE_ORPHAN_FILE_DAYS', 7))
+            user_id = cursor or 0
+            while True:
+                owners = SceneFiles.owners_with_files(created_before, user_id, ORPHAN_USERS_PER_QUERY)
+                db.session.commit()
+                for owner in owners:
+                    if should_stop():
+                        return result('partial', user_id)
+                    deleted, freed = SceneFiles.prune_orphans(owner, created_before)
+                    counts['images'] += deleted
+                    reclaimed += freed
+                    user_id = owner
+                if len(owners) < ORPHAN_USERS_PER_QUERY:
+                    break
+
+        if shard_router.enabled:
+            for stray in ShardService.strays(database):
+                if should_stop():
+                    return result('partial')
+                ShardService.purge(stray, database)
+                counts['leftover copies'] += 1
+
+        if database == CATALOG:
+            counts['spools'], freed = ImportService.prune_spools(SPOOL_MAX_AGE_SECONDS)
+            reclaimed += freed
+            runs = MaintenanceRun.__table__
+            kept_since = _utcnow() - datetime.timedelta(days=config.get('MAINTENANCE_HISTORY_DAYS', 30))
+            db.session.execute(delete(runs).where(runs.c.started_at < kept_since))
+            db.session.commit()
+        return result('ok')
+
+    @staticmethod
+    def full_vacuum(database, should_stop=None, cursor=None):
+        """Rewrites the whole file with VACUUM, switching it to incremental auto-vacuum. Blocks writers."""
+        with _connection(database, current_app.config['SQLITE_BUSY_TIMEOUT_MS']) as connection:
+            if connection.dialect.name != 'sqlite':
+                return JobResult('skipped', 0, 'not a SQLite database')
+            path = _database_file(connection)
+            before = _size(path) + _size(path + '-wal')
+            connection.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+            connection.exec_driver_sql('VACUUM')
+            connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            after = _size(path) + _size(path + '-wal')
+            return JobResult('ok', max(before - after, 0), f'rebuilt, {after} bytes')
+
+    @staticmethod
+    def history():
+        """The last run of each job per database, with run counts and bytes reclaimed over the kept history."""
+        runs = MaintenanceRun.__table__
+        summary = (
+            select(func.max(runs.c.id).label('id'), func.count().label('runs'),
+                   func.coalesce(func.sum(runs.c.bytes_reclaimed), 0).label('reclaimed'))
+            .group_by(runs.c.job, runs.c.database).subquery()
+        )
+        rows = db.session.execute(
+            select(runs, summary.c.runs, summary.c.reclaimed)
+            .join(summary, summary.c.id == runs.c.id)
+            .order_by(runs.c.database, runs.c.job)
+        ).all()
+        return [{
+            'job': row.job,
+            'database': row.database,
+            'status': row.status,
+            'started_at': row.started_at.isoformat() + 'Z',
+            'duration_ms': row.duration_ms,
+            'bytes_reclaimed': row.bytes_reclaimed,
+            'detail': row.detail,
+            'runs': row.runs,
+            'total_reclaimed': row.reclaimed,
+        } for row in rows]
+
+
+JOBS = {
+    'checkpoint': MaintenanceService.checkpoint,
+    'vacuum': MaintenanceService.vacuum,
+    'optimize': MaintenanceService.optimize,
+    'orphans': MaintenanceService.orphans,
+    'full_vacuum': MaintenanceService.full_vacuum,
+}
+
+
+class MaintenanceScheduler:
+    """
+    Runs the maintenance jobs of MAINTENANCE_JOBS on every database, each on
+    its own interval and within its own time budget.
+
+    One process per host does the work: whichever first takes an exclusive
+    flock on MAINTENANCE_LOCK_PATH, a gunicorn worker or `flask maintenance-run
+    --loop`. The lock goes with the process, so another worker takes over
+    when the leader exits. The last run of each job is kept in
+    maintenance_runs, so a new leader carries on with the schedule.
+
+    Jobs don't start, and running ones stop at their next step, while the
+    host's load average per CPU is above MAINTENANCE_MAX_LOAD or this worker
+    serves more than MAINTENANCE_MAX_IN_FLIGHT requests; the scheduler then
+    waits, doubling the wait while the load lasts.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.lock_path = None
+        self.poll_seconds = 30
+        self.max_load = 0.75
+        self.max_in_flight = 4
+        self.backoff_seconds = 30
+        # (job, database) -> when it is next due / where its last partial run stopped
+        self._due = {}
+        self._cursors = {}
+        self._leader = False
+        self._lock_file = None # Held open for as long as this process leads
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def configure(self, config):
+        self.jobs = parse_jobs(config.get('MAINTENANCE_JOBS', ''))
+        self.lock_path = config.get('MAINTENANCE_LOCK_PATH')
+        self.poll_seconds = config.get('MAINTENANCE_POLL_SECONDS', 30)
+        self.max_load = config.get('MAINTENANCE_MAX_LOAD', 0.75)
+        self.max_in_flight = config.get('MAINTENANCE_MAX_IN_FLIGHT', 4)
+        self.backoff_seconds = config.get('MAINTENANCE_BACKOFF_SECONDS', 30)
+
+    # -- Leadership --------------------------------------------------------
+
+    def acquire_leadership(self):
+        """Takes the host-wide maintenance lock if it is free. True while this process holds it."""
+        if self._leader:
+            return True
+        if fcntl is not None:
+            handle = open(self.lock_path, 'a+')
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            handle.truncate(0)
+            handle.write(f'{os.getpid()}\n')
+            handle.flush()
+            self._lock_file = handle
+
+        runs = MaintenanceRun.__table__
+        last_runs = db.session.execute(
+            select(runs.c.job, runs.c.database, func.max(runs.c.started_at))
+            .where(runs.c.status.in_(('ok', 'skipped')))
+            .group_by(runs.c.job, runs.c.database)
+        ).all()
+        db.session.commit()
+        for job, database, started_at in last_runs:
+            if job in self.jobs:
+                self._due[(job, database)] = started_at + datetime.timedelta(seconds=self.jobs[job][0])
+        self._leader = True
+        logger.info('Database maintenance runs in process %s', os.getpid())
+        return True
+
+    # -- Load --------------------------------------------------------------
+
+    def request_started(self):
+        with self._in_flight_lock:
+            self._in_flight += 1
+        g.maintenance_counted = True
+
+    def request_finished(self, exc=None):
+        if g.pop('maintenance_counted', False):
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def busy(self):
+        """True while maintenance should leave the database to requests."""
+        if self.max_in_flight and self._in_flight > self.max_in_flight:
+            return True
+        if not self.max_load:
+            return False
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return False # No load average on this platform
+        return load > self.max_load
+
+    # -- Running -----------------------------------------------------------
+
+    def run(self, job, database, budget, force=False):
+        """Runs one job on one database and records the run. `force` ignores load."""
+        key = (job, database)
+        deadline = time.monotonic() + budget
+
+        def should_stop():
+            # Under gevent the scheduler is a greenlet and sqlite3 never yields: without
+            # this pause the worker serves nothing (and busy() can't notice) until the job ends
+            time.sleep(STEP_PAUSE_SECONDS)
+            return time.monotonic() >= deadline or (not force and self.busy())
+
+        started_at = _utcnow()
+        started = time.perf_counter()
+        try:
+            result = JOBS[job](database, should_stop, self._cursors.get(key))
+        except Exception as err:
+            db.session.rollback()
+            logger.error('Maintenance job %s on %s failed', job, label(database), exc_info=True)
+            result = JobResult('failed', 0, str(err)[:255], self._cursors.get(key))
+        seconds = time.perf_counter() - started
+
+        if result.cursor is None:
+            self._cursors.pop(key, None)
+        else:
+            self._cursors[key] = result.cursor
+        interval = self.jobs.get(job, (0,))[0]
+        delay = interval if result.status in ('ok', 'skipped') else self.backoff_seconds
+        self._due[key] = started_at + datetime.timedelta(seconds=delay)
+
+        db.session.add(MaintenanceRun(
+            job=job, database=database, status=result.status, started_at=started_at,
+            duration_ms=round(seconds * 1000), bytes_reclaimed=result.reclaimed, detail=(result.detail or '')[:255],
+        ))
+        db.session.commit()
+        record_maintenance(job, result.status, seconds, result.reclaimed)
+        logger.log(
+            logging.DEBUG if result.status == 'skipped' else logging.INFO,
+            'Maintenance job %s on %s: %s in %.0f ms, %d bytes reclaimed (%s)',
+            job, label(database), result.status, seconds * 1000, result.reclaimed, result.detail
+        )
+        return result
+
+    def run_pending(self, jobs=None, force=False, on_run=None):
+        """
+        Runs every job that is due on every database, or all of `jobs` at once
+        with `force`. Returns how many ran, or None if load made it stop early.
+        """
+        ran = 0
+        for database in shard_router.databases():
+            for job in jobs or self.jobs:
+                _, budget = self.jobs.get(job, (0, DEFAULT_BUDGET))
+                if not force and self._due.get((job, database), datetime.datetime.min) > _utcnow():
+                    continue
+                if not force and self.busy():
+                    return None
+                result = self.run(job, database, budget, force)
+                ran += 1
+                if on_run:
+                    on_run(job, database, result)
+        return ran
+
+    def serve(self, app):
+        """Runs due jobs for good once this process is the leader, backing off under load."""
+        backoff = 0
+        while True:
+            delay = self.poll_seconds
+            with app.app_context():
+                try:
+                    if self.acquire_leadership():
+                        if self.run_pending() is None:
+                            backoff = min(backoff * 2 or 1, MAX_BACKOFF_FACTOR)
+                            delay = self.backoff_seconds * backoff
+                            logger.debug('Host busy; maintenance waits %ss', delay)
+                        else:
+                            backoff = 0
+                except Exception:
+                    logger.error('Maintenance scheduler iteration failed', exc_info=True)
+                finally:
+                    db.session.remove()
+            time.sleep(delay)
+
+
+# Process-wide scheduler (only the process holding the lock runs jobs)
+maintenance = MaintenanceScheduler()
+
+_worker_lock = threading.Lock()
+_worker_pid = None
+
+
+def init_maintenance_worker(app):
+    """Applies the MAINTENANCE_* settings and starts the scheduler lazily in each serving process."""
+    maintenance.configure(app.config)
+    if not app.config.get('MAINTENANCE_WORKER_ENABLED', True) or not maintenance.jobs:
+        return
+
+    @app.before_request
+    def _ensure_maintenance_worker():
+        global _worker_pid
+        maintenance.request_started()
+        if _worker_pid == os.getpid():
+            return
+        with _worker_lock:
+            if _worker_pid == os.getpid():
+                return
+            _worker_pid = os.getpid()
+            threading.Thread(target=maintenance.serve, args=(app,), name='maintenance', daemon=True).start()
+
+    app.teardown_request(maintenance.request_finished)
@@ -1,31 +1,130 @@
+from flask import current_app
+from marshmallow import EXCLUDE, ValidationError
+from sqlalchemy.orm import load_only
 from app.models.note import Note
 from app.extensions import db
 from app.core.exceptions import APIException
-import logging
+from app.core.change_feed import change_feed
+from app.core.group_commit import write_coordinator
+from app.core.metrics import record_sync
+from app.core.pagination import encode_cursor, decode_cursor, encode_page_cursor, decode_page_cursor
+from app.schemas.note import note_schema
+from app.services.change_log import ChangeLog
+from app.services.import_parser import ImportFormatError, InvalidRecord
+from app.services.note_text import content_digest, summarize
+from app.services.patching import PatchError, apply_patch
+from app.services.scene_files import SceneFiles
+from app.services.search_service import SearchService
+from app.services.sync_engine import SyncEngine
 import datetime
+import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
+MAX_PAGE_SIZE = 100
+
 class NoteService:
     """Handles all note-related business logic."""
 
     @staticmethod
-    def get_all(user_id, page=1, per_page=20, search_term=None):
-        query = Note.query.filter_by(user_id=user_id)
+    def get_all(user_id, per_page=20, after=None, search_term=None, page=1, include_total=False, fields=None):
+        """
+        One page of the user's notes: {'notes', 'has_next', 'next_cursor'} plus
+        'total' with `include_total`, whichever way the page was found. Pass
+        `next_cursor` back as `after` for the next page.
+        """
+        per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+
+        # Ranked full-text search over title + content (when the database supports it).
+        # Ranks aren't a key to seek past, so its cursor holds a page number.
+        if search_term and SearchService.backend():
+            page = decode_page_cursor(after) if after else max(page, 1)
+            hits, total = SearchService.search(user_id, search_term, page, per_page)
+            return NoteService._search_page(user_id, page, per_page, hits, total, include_total, fields)
+
+        query = NoteService._projected(Note.query.filter_by(user_id=user_id), fields)
         
-        # If a search term exists, filter the title (case-insensitive)
+        # Fallback for databases without a search backend: title substring match
+        # (bodies are stored compressed, so they can't be matched in SQL)
         if search_term:
             query = query.filter(Note.title.ilike(f'%{search_term}%'))
-            
-        # Error_out=False prevents crashing if a user requests a page past the limit
-        pagination = query.order_by(Note.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
-        
-        return {
-            'notes': [note.to_dict() for note in pagination.items],
-            'total_pages': pagination.pages,
-            'current_page': pagination.page,
-            'has_next': pagination.has_next
+
+        total = query.count() if include_total else None
+
+        # Keyset pagination: seek past the last (updated_at, id) of the previous
+        # page on ix_notes_user_updated_id instead of counting and OFFSETting.
+        if after:
+            after_updated_at, after_id = decode_cursor(after)
+            query = query.filter(db.tuple_(Note.updated_at, Note.id) < (after_updated_at, after_id))
+
+        items = query.order_by(Note.updated_at.desc(), Note.id.desc()).limit(per_page + 1).all()
+        has_next = len(items) > per_page
+        items = items[:per_page]
+
+        result = {
+            'notes': [NoteService._serialize(note, fields) for note in items],
+            'has_next': has_next,
+            'next_cursor': encode_cursor(items[-1].updated_at, items[-1].id) if has_next else None
         }
+        if include_total:
+            result['total'] = total
+        return result
+
+    @staticmethod
+    def _projected(query, fields):
+        """Restricts the SELECT to the requested columns so `content` is never read for summaries."""
+        if fields is None:
+            return query
+        columns = set(fields) | {'id', 'updated_at'}
+        return query.options(load_only(*(getattr(Note, name) for name in columns)))
+
+    @staticmethod
+    def _serialize(note, fields):
+        return note.to_dict() if fields is None else note.to_summary_dict(fields)
+
+    @staticmethod
+    def _search_page(user_id, page, per_page, hits, total, include_total=False, fields=None):
+        notes = {}
+        if hits:
+            ids = [note_id for note_id, _, _, _ in hits]
+            query = Note.query.filter(Note.user_id == user_id, Note.id.in_(ids))
+            notes = {n.id: n for n in NoteService._projected(query, fields)}
+
+        results = []
+        for note_id, rank, title_highlight, snippet in hits:
+            note = notes.get(note_id)
+            if note:
+                results.append({
+                    **NoteService._serialize(note, fields),
+                    'rank': rank,
+                    'highlight': {'title': title_highlight, 'content': snippet}
+                })
+
+        has_next = page * per_page < total
+        result = {
+            'notes': results,
+            'has_next': has_next,
+            'next_cursor': encode_page_cursor(page + 1) if has_next else None
+        }
+        if include_total:
+            result['total'] = total
+        return result
+
+    @staticmethod
+    def _refresh_summary(note):
+        note.content_size, note.preview = summarize(note.type, note.content)
+        note.content_hash = content_digest(note.content)
+
+    @staticmethod
+    def get_version(user_id, note_id):
+        """Returns (updated_at, change_seq) without loading the note body."""
+        row = db.session.execute(
+            db.select(Note.updated_at, Note.change_seq).where(Note.user_id == user_id, Note.id == note_id)
+        ).first()
+        if not row:
+            raise APIException('Note not found or access denied', 404)
+        return row.updated_at, row.change_seq
 
     @staticmethod
     def get_by_id(user_id, note_id):
@@ -36,50 +135,167 @@ class NoteService:
 
     @staticmethod
     def create(user_id, data):
+        note = write_coordinator.run(NoteService._create, user_id, data)
+        change_feed.publish(user_id)
+        logger.info('Note created by user %s: ID %s', user_id, note['id'])
+        return note
+
+    @staticmethod
+    def _create(user_id, data):
+        note_type = data.get('type', 'markdown')
         new_note = Note(
             title=data.get('title', 'Untitled'),
-            content=data.get('content', ''),
-            type=data.get('type', 'markdown'),
-            user_id=user_id
+            content=SceneFiles.extract(user_id, note_type, data.get('content', '')),
+            type=note_type,
+            user_id=user_id,
+            change_seq=ChangeLog.allocate(user_id)
         )
+        NoteService._refresh_summary(new_note)
         db.session.add(new_note)
-        db.session.commit()
-        logger.info(f"Note created by user {user_id}: ID {new_note.id}")
+        db.session.flush()
+        SearchService.index_notes([new_note])
         return new_note.to_dict()
 
     @staticmethod
     def update(user_id, note_id, data):
+        note = write_coordinator.run(NoteService._update, user_id, note_id, data)
+        change_feed.publish(user_id)
+        return note
+
+    @staticmethod
+    def _update(user_id, note_id, data):
+        # Bumping the change sequence first takes the user's write lock, so a patch
+        # is applied to the body it was computed against and not a concurrent one
+        change_seq = ChangeLog.allocate(user_id)
         note = NoteService.get_by_id(user_id, note_id)
+        if 'patch' in data:
+            data = {**data, 'content': NoteService._apply_patch(note, data)}
+        if 'content' in data:
+            data = {**data, 'content': SceneFiles.extract(user_id, data.get('type', note.type), data['content'])}
+
+        title_changed = 'title' in data and data['title'] != note.title
+        # Identical bytes: leave the stored (compressed) body and its index entry alone
+        content_changed = 'content' in data and content_digest(data['content']) != note.content_hash
+
         note.title = data.get('title', note.title)
-        note.content = data.get('content', note.content)
-        db.session.commit()
+        if content_changed:
+            note.content = data['content']
+            NoteService._refresh_summary(note)
+        note.change_seq = change_seq
+        if title_changed or content_changed:
+            SearchService.index_notes([note])
+        # Flush for updated_at's onupdate value before serializing
+        db.session.flush()
         return note.to_dict()
 
+    @staticmethod
+    def _apply_patch(note, data):
+        if data['base_hash'] != note.content_hash:
+            raise APIException('Note has changed since the patch base. Send the full content instead.', 409)
+        try:
+            return apply_patch(data.get('type', note.type), note.content, data['patch'])
+        except PatchError as err:
+            raise APIException(f'Patch could not be applied: {err}', 409)
+
     @staticmethod
     def delete(user_id, note_id):
+        write_coordinator.run(NoteService._delete, user_id, note_id)
+        change_feed.publish(user_id)
+        logger.info('Note deleted by user %s: ID %s', user_id, note_id)
+        return {'message': 'Note deleted successfully'}
+
+    @staticmethod
+    def _delete(user_id, note_id):
         note = NoteService.get_by_id(user_id, note_id)
         db.session.delete(note)
-        db.session.commit()
-        logger.info(f"Note deleted by user {user_id}: ID {note_id}")
-        return {'message': 'Note deleted successfully'}
+        # Leave a tombstone so other devices pull the deletion
+        ChangeLog.record_deletes(user_id, [note.id], ChangeLog.allocate(user_id))
+        SearchService.remove([note.id])
 
     @staticmethod
-    def import_notes(user_id, notes_data):
-        if not isinstance(notes_data, list):
-            raise APIException('Invalid data format. Expected a list of notes.', 400)
+    def import_notes(user_id, records, on_progress=None):
+        """
+        Validates and bulk-inserts an iterable of raw note records.
+
+        Records are written in IMPORT_CHUNK_SIZE chunks, each in its own short
+        transaction, so a large import never holds the write lock for long.
+        Invalid records are skipped and reported by their position in the
+        input; `on_progress(report)` runs inside each chunk's transaction.
+        Input beyond IMPORT_MAX_ITEMS records raises ImportFormatError.
+        """
+        chunk_size = current_app.config.get('IMPORT_CHUNK_SIZE', 200)
+        max_items = current_app.config.get('IMPORT_MAX_ITEMS', 100000)
+        max_errors = current_app.config.get('IMPORT_MAX_REPORTED_ERRORS', 100)
+        report = {'processed': 0, 'imported': 0, 'failed': 0, 'errors': []}
+
+        def fail(index, errors):
+            report['failed'] += 1
+            if len(report['errors']) < max_errors:
+                report['errors'].append({'index': index, 'errors': errors})
+
+        batch = []
+        try:
+            for index, item in enumerate(records):
+                if index >= max_items:
+                    raise ImportFormatError(f'Import exceeds {max_items} notes; the remaining records were not imported.')
+                report['processed'] += 1
+                if isinstance(item, InvalidRecord):
+                    fail(index, {'_record': [item.message]})
+                    continue
+                if not isinstance(item, dict):
+                    fail(index, {'_record': ['Expected a JSON object.']})
+                    continue
+                try:
+                    # Legacy defaults first, so only genuinely bad values are rejected
+                    valid = note_schema.load({'title': 'Imported Note', 'type': 'markdown', **item}, unknown=EXCLUDE)
+                except ValidationError as err:
+                    fail(index, err.messages)
+                    continue
 
-        for item in notes_data:
-            note = Note(
-                title=item.get('title', 'Imported Note'),
-                content=item.get('content', ''),
-                type=item.get('type', 'markdown'),
-                user_id=user_id
-            )
-            db.session.add(note)
+                batch.append(valid)
+                if len(batch) >= chunk_size:
+                    NoteService._insert_imported(user_id, batch, report, on_progress)
+                    batch = []
+        except ImportFormatError:
+            # Too many records or broken input: keep the valid ones read so far
+            # (ImportService reports the job as failed with the error's message)
+            NoteService._insert_imported(user_id, batch, report, on_progress)
+            raise
 
+        NoteService._insert_imported(user_id, batch, report, on_progress)
+        logger.info('User %s imported %d notes (%d rejected).', user_id, report['imported'], report['failed'])
+        return report
+
+    @staticmethod
+    def _insert_imported(user_id, batch, report, on_progress):
+        rows = []
+        if batch:
+            first_seq = ChangeLog.allocate(user_id, len(batch))
+            now = datetime.datetime.utcnow()
+            for offset, item in enumerate(batch):
+                item['content'] = SceneFiles.extract(user_id, item['type'], item['content'])
+                content_size, preview = summarize(item['type'], item['content'])
+                rows.append({
+                    'id': str(uuid.uuid4()),
+                    'title': item['title'],
+                    'content': item['content'],
+                    'type': item['type'],
+                    'user_id': user_id,
+                    'updated_at': now,
+                    'change_seq': first_seq + offset,
+                    'content_size': content_size,
+                    'preview': preview,
+                    'content_hash': content_digest(item['content'])
+                })
+            db.session.execute(db.insert(Note), rows)
+            SearchService.index_rows(rows)
+            report['imported'] += len(rows)
+
+        if on_progress:
+            on_progress(report)
         db.session.commit()
-        logger.info(f"User {user_id} imported {len(notes_data)} notes.")
-        return {'message': f'{len(notes_data)} notes imported successfully'}
+        if rows:
+            change_feed.publish(user_id)
 
     @staticmethod
     def sync_notes(user, data): 
@@ -88,44 +304,47 @@ class NoteService:
         if user.subscription_status not in allowed_statuses:
             raise APIException(f"Sync denied. Account status: {user.subscription_status}", 403)
 
-        upserts = data.get('upserts', [])
-        deletes = data.get('deletes', [])
-
-        # 2. Process Deletions
-        if deletes:
-            Note.query.filter(Note.id.in_(deletes), Note.user_id == user.id).delete(synchronize_session=False)
-
-        # 3. Process Upserts
-        for note_data in upserts:
-            note_id = note_data.get('id')
-            client_updated_str = note_data.get('updatedAt')
-            
-            if not note_id or not client_updated_str:
-                continue
-
-            try:
-                client_updated_at = datetime.datetime.fromisoformat(client_updated_str.replace('Z', '+00:00')).replace(tzinfo=None)
-            except ValueError:
-                continue 
-
-            existing_note = Note.query.filter_by(id=note_id, user_id=user.id).first()
-
-            if existing_note:
-                if not existing_note.updated_at or client_updated_at > existing_note.updated_at:
-                    existing_note.title = note_data.get('title', existing_note.title)
-                    existing_note.content = note_data.get('content', existing_note.content)
-                    existing_note.type = note_data.get('type', existing_note.type)
-                    existing_note.updated_at = client_updated_at
-            else:
-                new_note = Note(
-                    id=note_id,
-                    title=note_data.get('title', 'Untitled'),
-                    content=note_data.get('content', ''),
-                    type=note_data.get('type', 'markdown'),
-                    user_id=user.id, 
-                    updated_at=client_updated_at
-                )
-                db.session.add(new_note)
+        # 2. Push (deletes + LWW upserts) and optional delta pull, as bulk statements
+        result = write_coordinator.run(SyncEngine.run, user, data)
+        record_sync(result)
+        if result['upserted'] or result['deleted']:
+            change_feed.publish(user.id)
+        logger.info(
+            'Sync for user %s: %d upserted, %d skipped, %d deleted',
+            user.id, result['upserted'], result['skipped'], result['deleted']
+        )
+        return {'message': 'Sync successful', **result}
 
-        db.session.commit()
-        return {'message': 'Sync successful'}
\ No newline at end of file
+    @staticmethod
+    def backfill_summaries(batch_size=500):
+        """
+        Fills content_size/preview/content_hash for notes written before they were
+        precomputed, re-encoding their bodies with the current compression codec.
+        """
+        count = 0
+        while True:
+            rows = db.session.execute(
+                db.select(Note.id, Note.type, Note.content, Note.updated_at)
+                .where(Note.content_hash.is_(None))
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            params = []
+            for row in rows:
+                # Notes without content still get a hash so they are not picked up again
+                content = row.content or ''
+                content_size, preview = summarize(row.type, content)
+                # updated_at is passed through so the column's onupdate doesn't bump LWW timestamps
+                params.append({
+                    'id': row.id,
+                    'content': content,
+                    'content_hash': content_digest(content),
+                    'content_size': content_size,
+                    'preview': preview,
+                    'updated_at': row.updated_at
+                })
+            db.session.execute(db.update(Note), params)
+            db.session.commit()
+            count += len(rows)
+        return count
\ No newline at end of file
@@ -0,0 +1,48 @@
+import hashlib
+import re
+from app.core import serialization
+
+PREVIEW_LENGTH = 160
+# Markdown punctuation that only adds noise to a one-line excerpt
+MARKDOWN_NOISE_RE = re.compile(r'[#>*_`~|\[\]]+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def extract_text(note_type, content):
+    """Returns the human-readable text of a note. Excalidraw scenes only contribute their text elements."""
+    if not content:
+        return ''
+    if note_type != 'excalidraw':
+        return content
+
+    try:
+        scene = serialization.loads(content)
+    except (TypeError, ValueError):
+        return ''
+
+    elements = scene.get('elements', []) if isinstance(scene, dict) else []
+    texts = [
+        element.get('originalText') or element.get('text') or ''
+        for element in elements
+        if isinstance(element, dict) and element.get('type') == 'text' and not element.get('isDeleted')
+    ]
+    return '\n'.join(t for t in texts if t)
+
+
+def summarize(note_type, content):
+    """Returns (content_size, preview): the body size in bytes and a short plain-text excerpt."""
+    if content is None:
+        return None, None
+
+    text = extract_text(note_type, content)
+    text = WHITESPACE_RE.sub(' ', MARKDOWN_NOISE_RE.sub(' ', text)).strip()
+    if len(text) > PREVIEW_LENGTH:
+        text = text[:PREVIEW_LENGTH - 1].rstrip() + '…'
+    return len(content.encode('utf-8')), text
+
+
+def content_digest(content):
+    """SHA-256 of the body, used to skip rewriting content a client sent unchanged."""
+    if content is None:
+        return None
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
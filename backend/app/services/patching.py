@@ -0,0 +1,106 @@
+from app.core import serialization
+
+
+class PatchError(ValueError):
+    """A patch is malformed or cannot be applied to the base content."""
+
+
+def apply_text_patch(base, ops):
+    """
+    Applies splice operations to a text body.
+
+    `ops` is a list of {"pos": int, "delete": int, "insert": str} applied in
+    order, each against the text produced by the previous one. Positions count
+    Unicode code points.
+    """
+    if not isinstance(ops, list):
+        raise PatchError('Text patch must be a list of operations.')
+
+    text = base or ''
+    for index, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise PatchError(f'Operation {index} must be an object.')
+        pos, delete, insert = op.get('pos'), op.get('delete', 0), op.get('insert', '')
+        if (not isinstance(pos, int) or not isinstance(delete, int) or not isinstance(insert, str)
+                or isinstance(pos, bool) or isinstance(delete, bool)):
+            raise PatchError(f"Operation {index} needs integer 'pos'/'delete' and string 'insert'.")
+        if pos < 0 or delete < 0 or pos + delete > len(text):
+            raise PatchError(f'Operation {index} is out of range.')
+        text = text[:pos] + insert + text[pos + delete:]
+    return text
+
+
+def _element_version(element):
+    version = element.get('version', 0)
+    return version if isinstance(version, int) else 0
+
+
+def apply_scene_patch(base, patch):
+    """
+    Applies an element-level patch to an Excalidraw scene (JSON text).
+
+    `patch` may contain:
+      - "elements": changed elements; each replaces the stored element with the
+        same id unless the stored one has a higher `version`
+      - "deleted": ids of elements to drop
+      - "appState": keys merged into the scene's appState
+      - "files": file entries to add or replace (null removes one)
+    Element order is preserved; new elements are appended.
+    """
+    if not isinstance(patch, dict):
+        raise PatchError('Excalidraw patch must be an object.')
+
+    try:
+        scene = serialization.loads(base) if base else {}
+    except ValueError:
+        raise PatchError('Stored scene is not valid JSON; send the full content instead.')
+    if not isinstance(scene, dict):
+        raise PatchError('Stored scene is not an object; send the full content instead.')
+
+    elements = [e for e in scene.get('elements', []) if isinstance(e, dict)]
+    # Stored elements without a string id can't be patched, only kept as they are
+    positions = {element['id']: index for index, element in enumerate(elements) if isinstance(element.get('id'), str)}
+
+    changed = patch.get('elements', [])
+    if not isinstance(changed, list):
+        raise PatchError("'elements' must be a list.")
+    for element in changed:
+        if not isinstance(element, dict) or not isinstance(element.get('id'), str):
+            raise PatchError("Every patched element needs a string 'id'.")
+        index = positions.get(element['id'])
+        if index is None:
+            positions[element['id']] = len(elements)
+            elements.append(element)
+        elif _element_version(element) >= _element_version(elements[index]):
+            elements[index] = element
+
+    deleted = patch.get('deleted', [])
+    if not isinstance(deleted, list) or not all(isinstance(element_id, str) for element_id in deleted):
+        raise PatchError("'deleted' must be a list of element ids.")
+    if deleted:
+        dropped = set(deleted)
+        elements = [e for e in elements if not isinstance(e.get('id'), str) or e['id'] not in dropped]
+    scene['elements'] = elements
+
+    for key in ('appState', 'files'):
+        updates = patch.get(key)
+        if updates is None:
+            continue
+        if not isinstance(updates, dict):
+            raise PatchError(f"'{key}' must be an object.")
+        merged = scene.get(key) if isinstance(scene.get(key), dict) else {}
+        for name, value in updates.items():
+            if value is None and key == 'files':
+                merged.pop(name, None)
+            else:
+                merged[name] = value
+        scene[key] = merged
+
+    return serialization.dumps(scene)
+
+
+def apply_patch(note_type, base, patch):
+    """Dispatches to the patch format of the note type."""
+    if note_type == 'excalidraw':
+        return apply_scene_patch(base, patch)
+    return apply_text_patch(base, patch)
@@ -0,0 +1,194 @@
+import base64
+import binascii
+import hashlib
+import re
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+from app.extensions import db
+from app.core.exceptions import APIException
+from app.core import serialization
+from app.models.note import Note
+from app.models.note_file import NoteFile
+from app.services.change_log import ChangeLog
+
+# Where a stored file is served; also the `dataURL` of a reference, so a
+# client that hands the scene straight to Excalidraw still gets an <img> URL
+FILE_URL_PREFIX = '/api/notes/files/'
+DATA_URL_RE = re.compile(r'^data:(image/[\w.+-]+);base64,(.*)$', re.DOTALL)
+FILE_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+FILE_REFERENCE_RE = re.compile(re.escape(FILE_URL_PREFIX) + r'([0-9a-f]{64})')
+# Hashes per DELETE when pruning files
+PRUNE_BATCH_SIZE = 500
+# Dialects that support INSERT ... ON CONFLICT DO NOTHING
+INSERT_IGNORE_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _load_scene(content):
+    try:
+        scene = serialization.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(scene, dict) or not isinstance(scene.get('files'), dict):
+        return None
+    return scene
+
+
+def _dump_scene(scene):
+    return serialization.dumps(scene)
+
+
+class SceneFiles:
+    """
+    Keeps the images of Excalidraw scenes out of note bodies.
+
+    Excalidraw embeds pasted images in the scene's `files` map as base64 data
+    URLs. On write, each one is decoded into the content-addressed note_files
+    table and replaced by a reference:
+
+        {"id": ..., "mimeType": "image/png", "dataURL": "/api/notes/files/<sha256>",
+         "fileHash": "<sha256>", "size": 48213, ...}
+
+    Scenes then stay small in every listing, sync and patch, and a client
+    downloads each image once (GET /api/notes/files/<hash> is immutable).
+    References a client sends back are kept as they are.
+    """
+
+    @staticmethod
+    def extract(user_id, note_type, content):
+        """Returns `content` with its embedded images stored and replaced by references."""
+        if (note_type != 'excalidraw' or not content or 'data:image/' not in content
+                or not current_app.config.get('EXTRACT_SCENE_FILES', True)):
+            return content
+        scene = _load_scene(content)
+        if scene is None:
+            return content
+
+        blobs = {}
+        for entry in scene['files'].values():
+            if not isinstance(entry, dict) or not isinstance(entry.get('dataURL'), str):
+                continue
+            match = DATA_URL_RE.match(entry['dataURL'])
+            if not match:
+                continue
+            try:
+                data = base64.b64decode(match.group(2), validate=True)
+            except (binascii.Error, ValueError):
+                continue # Left inline, as received
+            file_hash = hashlib.sha256(data).hexdigest()
+            blobs[file_hash] = (match.group(1), data)
+            entry.update({'dataURL': FILE_URL_PREFIX + file_hash, 'fileHash': file_hash, 'size': len(data)})
+
+        if not blobs:
+            return content
+        SceneFiles._store(user_id, blobs)
+        return _dump_scene(scene)
+
+    @staticmethod
+    def _store(user_id, blobs):
+        rows = [
+            {'user_id': user_id, 'hash': file_hash, 'mime_type': mime_type, 'size': len(data), 'data': data}
+            for file_hash, (mime_type, data) in blobs.items()
+        ]
+        dialect_insert = INSERT_IGNORE_DIALECTS.get(db.session.get_bind().dialect.name)
+        if dialect_insert is not None:
+            # Already stored (same bytes, same hash) is the common case, not an error
+            db.session.execute(dialect_insert(NoteFile).on_conflict_do_nothing(), rows)
+            return
+        stored = set(db.session.execute(
+            db.select(NoteFile.hash).where(NoteFile.user_id == user_id, NoteFile.hash.in_(list(blobs)))
+        ).scalars())
+        missing = [row for row in rows if row['hash'] not in stored]
+        if missing:
+            db.session.execute(db.insert(NoteFile), missing)
+
+    @staticmethod
+    def inline(user_id, note_type, content):
+        """The reverse of extract(): a self-contained scene with data URLs (for exports)."""
+        if note_type != 'excalidraw' or not content or FILE_URL_PREFIX not in content:
+            return content
+        scene = _load_scene(content)
+        if scene is None:
+            return content
+
+        entries = [
+            entry for entry in scene['files'].values()
+            if isinstance(entry, dict) and isinstance(entry.get('fileHash'), str)
+            and entry.get('dataURL') == FILE_URL_PREFIX + entry['fileHash']
+        ]
+        if not entries:
+            return content
+        stored = {
+            row.hash: row for row in db.session.execute(
+                db.select(NoteFile.hash, NoteFile.mime_type, NoteFile.data)
+                .where(NoteFile.user_id == user_id, NoteFile.hash.in_(list({entry['fileHash'] for entry in entries})))
+            )
+        }
+        for entry in entries:
+            row = stored.get(entry['fileHash'])
+            if row is None:
+                continue # Dangling reference: keep it
+            entry['dataURL'] = f"data:{row.mime_type};base64,{base64.b64encode(row.data).decode('ascii')}"
+            del entry['fileHash']
+            entry.pop('size', None)
+        return _dump_scene(scene)
+
+    @staticmethod
+    def owners_with_files(created_before, after_user_id=0, limit=100):
+        """Ids of users (above `after_user_id`, ascending) with files stored before `created_before`."""
+        return db.session.execute(
+            db.select(NoteFile.user_id).distinct()
+            .where(NoteFile.created_at < created_before, NoteFile.user_id > after_user_id)
+            .order_by(NoteFile.user_id).limit(limit)
+        ).scalars().all()
+
+    @staticmethod
+    def prune_orphans(user_id, created_before):
+        """
+        Deletes the user's files stored before `created_before` that none of their
+        notes references any more (the scene was deleted or the image removed).
+        Returns (files deleted, bytes freed).
+        """
+        candidates = dict(db.session.execute(
+            db.select(NoteFile.hash, NoteFile.size)
+            .where(NoteFile.user_id == user_id, NoteFile.created_at < created_before)
+        ).all())
+        if not candidates:
+            return 0, 0
+        seen_seq = ChangeLog.current(user_id)
+        scenes = db.session.execute(
+            db.select(Note.content).where(Note.user_id == user_id, Note.type == 'excalidraw')
+            .execution_options(yield_per=100)
+        ).scalars()
+        for content in scenes:
+            if content and FILE_URL_PREFIX in content:
+                for file_hash in FILE_REFERENCE_RE.findall(content):
+                    candidates.pop(file_hash, None)
+            if not candidates:
+                break
+        db.session.commit()
+        if not candidates:
+            return 0, 0
+
+        # A write since the scan may have referenced one of them again: leave it for the next run
+        if ChangeLog.lock(user_id) != seen_seq:
+            db.session.rollback()
+            return 0, 0
+        hashes = list(candidates)
+        for start in range(0, len(hashes), PRUNE_BATCH_SIZE):
+            db.session.execute(db.delete(NoteFile).where(
+                NoteFile.user_id == user_id, NoteFile.hash.in_(hashes[start:start + PRUNE_BATCH_SIZE])
+            ))
+        db.session.commit()
+        return len(candidates), sum(candidates.values())
+
+    @staticmethod
+    def get(user_id, file_hash):
+        note_file = None
+        if FILE_HASH_RE.match(file_hash):
+            note_file = db.session.get(NoteFile, (user_id, file_hash))
+        if not note_file:
+            raise APIException('File not found', 404)
+        return note_file
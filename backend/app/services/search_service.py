@@ -0,0 +1,344 @@
+from sqlalchemy import bindparam, event, text
+from app.models.note import Note
+from app.extensions import db
+from app.services.note_text import extract_text
+import html
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Words (including unicode letters/digits) the user typed; everything else is dropped
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_QUERY_TERMS = 8
+CHUNK_SIZE = 500
+# Backends delimit matches with these (private-use characters); the text is
+# HTML-escaped before they become <mark> tags, so note text is never markup
+MATCH_START, MATCH_END = '\ue000', '\ue001'
+
+
+def _query_terms(search_term):
+    return TOKEN_RE.findall(search_term or '')[:MAX_QUERY_TERMS]
+
+
+def _highlighted(value):
+    """Escapes highlighted note text for HTML and turns the match delimiters into <mark> tags."""
+    if value is None:
+        return None
+    return html.escape(value).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SqliteFtsBackend:
+    """
+    SQLite FTS5 index. note_search_docs maps each note id to the integer
+    rowid of its FTS row, and the `owner` column scopes MATCH to one user.
+    """
+
+    @staticmethod
+    def create_schema(connection):
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS note_search_docs ("
+            "docid INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "note_id VARCHAR(36) NOT NULL UNIQUE, "
+            "user_id INTEGER NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+            "owner, title, body, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+    @staticmethod
+    def index(docs):
+        for chunk in _chunks(docs, CHUNK_SIZE):
+            note_ids = [doc['note_id'] for doc in chunk]
+            db.session.execute(
+                text("INSERT OR IGNORE INTO note_search_docs (note_id, user_id) VALUES (:note_id, :user_id)"),
+                [{'note_id': doc['note_id'], 'user_id': doc['user_id']} for doc in chunk],
+            )
+            docids = dict(db.session.execute(
+                text("SELECT note_id, docid FROM note_search_docs WHERE note_id IN :ids")
+                .bindparams(bindparam('ids', expanding=True)),
+                {'ids': note_ids},
+            ).all())
+            db.session.execute(
+                text("DELETE FROM notes_fts WHERE rowid IN :docids").bindparams(bindparam('docids', expanding=True)),
+                {'docids': list(docids.values())},
+            )
+            db.session.execute(
+                text("INSERT INTO notes_fts (rowid, owner, title, body) VALUES (:docid, :owner, :title, :body)"),
+                [{
+                    'docid': docids[doc['note_id']],
+                    'owner': f"u{doc['user_id']}",
+                    'title': doc['title'],
+                    'body': doc['body'],
+                } for doc in chunk],
+            )
+
+    @staticmethod
+    def remove(note_ids):
+        for chunk in _chunks(list(note_ids), CHUNK_SIZE):
+            docids = db.session.execute(
+                text("SELECT docid FROM note_search_docs WHERE note_id IN :ids")
+                .bindparams(bindparam('ids', expanding=True)),
+                {'ids': chunk},
+            ).scalars().all()
+            if not docids:
+                continue
+            for table, column in (('notes_fts', 'rowid'), ('note_search_docs', 'docid')):
+                db.session.execute(
+                    text(f"DELETE FROM {table} WHERE {column} IN :docids")
+                    .bindparams(bindparam('docids', expanding=True)),
+                    {'docids': docids},
+                )
+
+    @staticmethod
+    def remove_user(user_id):
+        db.session.execute(
+            text("DELETE FROM notes_fts WHERE rowid IN (SELECT docid FROM note_search_docs WHERE user_id = :user_id)"),
+            {'user_id': user_id},
+        )
+        db.session.execute(text("DELETE FROM note_search_docs WHERE user_id = :user_id"), {'user_id': user_id})
+
+    @staticmethod
+    def prune_orphans(limit):
+        docids = db.session.execute(text(
+            "SELECT docid FROM note_search_docs d WHERE NOT EXISTS (SELECT 1 FROM notes n WHERE n.id = d.note_id) "
+            "LIMIT :limit"
+        ), {'limit': limit}).scalars().all()
+        for table, column in (('notes_fts', 'rowid'), ('note_search_docs', 'docid')):
+            db.session.execute(
+                text(f"DELETE FROM {table} WHERE {column} IN :docids").bindparams(bindparam('docids', expanding=True)),
+                {'docids': docids},
+            )
+        return len(docids)
+
+    @staticmethod
+    def merge(connection, pages):
+        """
+        One step of FTS5's incremental segment merge (about `pages` pages of work).
+        Returns False once the index has nothing left to merge.
+        """
+        before = connection.exec_driver_sql("SELECT total_changes()").scalar()
+        connection.exec_driver_sql(f"INSERT INTO notes_fts (notes_fts, rank) VALUES ('merge', {int(pages)})")
+        # FTS5 reports a merge that did no work as fewer than two changes
+        return connection.exec_driver_sql("SELECT total_changes()").scalar() - before >= 2
+
+    @staticmethod
+    def search(user_id, terms, limit, offset):
+        # Every term is quoted (no FTS syntax injection) and prefix-matched
+        phrases = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        match = f'owner:"u{int(user_id)}" AND {{title body}}: ({phrases})'
+
+        total = db.session.execute(
+            text("SELECT count(*) FROM notes_fts WHERE notes_fts MATCH :match"), {'match': match}
+        ).scalar()
+        rows = db.session.execute(text(
+            "SELECT d.note_id, bm25(notes_fts, 0.0, 10.0, 1.0) AS rank, "
+            "highlight(notes_fts, 1, :start, :end) AS title_highlight, "
+            "snippet(notes_fts, 2, :start, :end, '…', 16) AS snippet "
+            "FROM notes_fts JOIN note_search_docs d ON d.docid = notes_fts.rowid "
+            "WHERE notes_fts MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), {'match': match, 'limit': limit, 'offset': offset, 'start': MATCH_START, 'end': MATCH_END}).all()
+
+        # bm25() is "lower is better"; flip it so clients can sort descending
+        return [(row.note_id, -row.rank, row.title_highlight, row.snippet) for row in rows], total
+
+
+class PostgresSearchBackend:
+    """Postgres tsvector index with a GIN index, weighted title (A) over body (B)."""
+
+    @staticmethod
+    def create_schema(connection):
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS note_search_docs ("
+            "note_id VARCHAR(36) PRIMARY KEY, "
+            "user_id INTEGER NOT NULL, "
+            "title TEXT NOT NULL, "
+            "body TEXT NOT NULL, "
+            "document TSVECTOR NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_note_search_docs_document ON note_search_docs USING GIN (document)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_note_search_docs_user_id ON note_search_docs (user_id)"
+        ))
+
+    @staticmethod
+    def index(docs):
+        stmt = text(
+            "INSERT INTO note_search_docs (note_id, user_id, title, body, document) "
+            "VALUES (:note_id, :user_id, :title, :body, "
+            "setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :body), 'B')) "
+            "ON CONFLICT (note_id) DO UPDATE SET user_id = excluded.user_id, title = excluded.title, "
+            "body = excluded.body, document = excluded.document"
+        )
+        for chunk in _chunks(docs, CHUNK_SIZE):
+            db.session.execute(stmt, chunk)
+
+    @staticmethod
+    def remove(note_ids):
+        stmt = text("DELETE FROM note_search_docs WHERE note_id IN :ids").bindparams(bindparam('ids', expanding=True))
+        for chunk in _chunks(list(note_ids), CHUNK_SIZE):
+            db.session.execute(stmt, {'ids': chunk})
+
+    @staticmethod
+    def remove_user(user_id):
+        db.session.execute(text("DELETE FROM note_search_docs WHERE user_id = :user_id"), {'user_id': user_id})
+
+    @staticmethod
+    def prune_orphans(limit):
+        return db.session.execute(text(
+            "DELETE FROM note_search_docs WHERE note_id IN (SELECT d.note_id FROM note_search_docs d "
+            "WHERE NOT EXISTS (SELECT 1 FROM notes n WHERE n.id = d.note_id) LIMIT :limit)"
+        ), {'limit': limit}).rowcount
+
+    @staticmethod
+    def search(user_id, terms, limit, offset):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        params = {
+            'user_id': user_id, 'tsquery': tsquery, 'limit': limit, 'offset': offset,
+            'title_options': f'StartSel={MATCH_START}, StopSel={MATCH_END}, HighlightAll=true',
+            'snippet_options': f'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords=24, MinWords=8',
+        }
+
+        total = db.session.execute(text(
+            "SELECT count(*) FROM note_search_docs "
+            "WHERE user_id = :user_id AND document @@ to_tsquery('simple', :tsquery)"
+        ), params).scalar()
+        rows = db.session.execute(text(
+            "SELECT note_id, ts_rank_cd(document, q) AS rank, "
+            "ts_headline('simple', title, q, :title_options) AS title_highlight, "
+            "ts_headline('simple', body, q, :snippet_options) AS snippet "
+            "FROM note_search_docs, to_tsquery('simple', :tsquery) q "
+            "WHERE user_id = :user_id AND document @@ q "
+            "ORDER BY rank DESC LIMIT :limit OFFSET :offset"
+        ), params).all()
+        return [(row.note_id, row.rank, row.title_highlight, row.snippet) for row in rows], total
+
+
+# Pluggable backends, selected by the dialect of the configured database
+SEARCH_BACKENDS = {
+    'sqlite': SqliteFtsBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_schema(target, connection, **kw):
+    backend = SEARCH_BACKENDS.get(connection.dialect.name)
+    if backend:
+        backend.create_schema(connection)
+
+
+class SearchService:
+    """Keeps the full-text index in step with note writes and runs ranked searches."""
+
+    @staticmethod
+    def backend():
+        return SEARCH_BACKENDS.get(db.session.get_bind().dialect.name)
+
+    @staticmethod
+    def _document(note):
+        return {
+            'note_id': note.id,
+            'user_id': note.user_id,
+            'title': note.title or '',
+            'body': extract_text(note.type, note.content),
+        }
+
+    @staticmethod
+    def index_notes(notes):
+        """Indexes (or re-indexes) already flushed Note objects."""
+        backend = SearchService.backend()
+        if backend and notes:
+            backend.index([SearchService._document(note) for note in notes])
+
+    @staticmethod
+    def index_rows(rows):
+        """Indexes notes given as column dicts (as written by bulk INSERTs)."""
+        backend = SearchService.backend()
+        if backend and rows:
+            backend.index([{
+                'note_id': row['id'],
+                'user_id': row['user_id'],
+                'title': row['title'] or '',
+                'body': extract_text(row['type'], row['content']),
+            } for row in rows])
+
+    @staticmethod
+    def reindex_ids(user_id, note_ids):
+        """Re-reads the given notes (inside the current transaction) and re-indexes them."""
+        backend = SearchService.backend()
+        if not backend or not note_ids:
+            return
+        for chunk in _chunks(list(note_ids), CHUNK_SIZE):
+            rows = db.session.execute(
+                db.select(Note.id, Note.user_id, Note.title, Note.type, Note.content)
+                .where(Note.user_id == user_id, Note.id.in_(chunk))
+            ).all()
+            backend.index([SearchService._document(row) for row in rows])
+
+    @staticmethod
+    def remove(note_ids):
+        backend = SearchService.backend()
+        if backend and note_ids:
+            backend.remove(note_ids)
+
+    @staticmethod
+    def remove_user(user_id):
+        """Drops a user's whole index (their notes moved to another shard)."""
+        backend = SearchService.backend()
+        if backend:
+            backend.remove_user(user_id)
+
+    @staticmethod
+    def prune_orphans(limit=CHUNK_SIZE):
+        """Drops up to `limit` index entries whose note no longer exists. Returns how many."""
+        backend = SearchService.backend()
+        return backend.prune_orphans(limit) if backend else 0
+
+    @staticmethod
+    def rebuild():
+        """Re-indexes every note. Used to backfill databases created before the index existed."""
+        backend = SearchService.backend()
+        if not backend:
+            return 0
+        backend.create_schema(db.session.connection())
+
+        count = 0
+        query = db.select(Note.id, Note.user_id, Note.title, Note.type, Note.content).order_by(Note.id)
+        batch = []
+        for row in db.session.execute(query.execution_options(yield_per=CHUNK_SIZE)):
+            batch.append(SearchService._document(row))
+            if len(batch) >= CHUNK_SIZE:
+                backend.index(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            backend.index(batch)
+            count += len(batch)
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def search(user_id, search_term, page, per_page):
+        """
+        Returns ([(note_id, rank, title_highlight, snippet)], total) for the user's
+        notes matching every term (as a prefix), best match first. The highlights
+        are HTML: escaped note text with matches in <mark> tags.
+        Returns None when no index backend is available for this database.
+        """
+        backend = SearchService.backend()
+        if not backend:
+            return None
+        terms = _query_terms(search_term)
+        if not terms:
+            return [], 0
+        rows, total = backend.search(user_id, terms, per_page, (page - 1) * per_page)
+        return [(note_id, rank, _highlighted(title), _highlighted(snippet)) for note_id, rank, title, snippet in rows], total
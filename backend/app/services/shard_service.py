@@ -0,0 +1,185 @@
+import logging
+import os
+import time
+from sqlalchemy import delete, func, insert, select
+from app.extensions import db
+from app.core.sharding import CATALOG, shard_router
+from app.models.import_job import ImportJob
+from app.models.note import Note
+from app.models.note_file import NoteFile
+from app.models.tenant_shard import TenantShard
+from app.models.tombstone import NoteTombstone
+from app.models.user import User
+from app.services.change_log import ChangeLog
+from app.services.search_service import SearchService
+
+logger = logging.getLogger(__name__)
+
+# Tables copied when a user moves (the search index is rebuilt from the notes,
+# the change sequence is carried over by ChangeLog.restore)
+MOVED_TABLES = (Note.__table__, NoteTombstone.__table__, NoteFile.__table__, ImportJob.__table__)
+# Rows per INSERT / commit while copying, so other users of the target shard are not locked out for long
+COPY_BATCH_SIZE = 500
+FILE_COPY_BATCH_SIZE = 20 # note_files rows carry whole images
+
+
+def label(shard):
+    return '(catalog)' if shard == CATALOG else shard
+
+
+class ShardService:
+    """
+    Moves users' notes between shards and reports where they are.
+
+    A move marks the user 'moving' in the directory (their requests get a 503
+    and clients retry), waits until no worker can still route to the old
+    shard from its cached directory entry, copies the rows in batches,
+    switches the directory and then drops the old copy. An interrupted move
+    is resumed by running it again: the target's partial copy is cleared first.
+    """
+
+    @staticmethod
+    def status():
+        directory = TenantShard.__table__
+        users = User.__table__
+        placed = dict(db.session.execute(
+            select(directory.c.shard, func.count()).group_by(directory.c.shard)
+        ).all())
+        moving = db.session.execute(
+            select(directory.c.user_id, directory.c.previous_shard, directory.c.shard)
+            .where(directory.c.state != 'active')
+        ).all()
+        # Users who wrote before sharding and were not seen since: still in the catalog
+        unplaced = db.session.execute(
+            select(func.count()).select_from(users.outerjoin(directory, directory.c.user_id == users.c.id))
+            .where(directory.c.user_id.is_(None), users.c.change_seq > 0)
+        ).scalar()
+
+        shards = []
+        for name in sorted(set(placed) | set(shard_router.shards())):
+            path = shard_router.path(name) if name != CATALOG else None
+            shards.append({
+                'shard': name,
+                'users': placed.get(name, 0) + (unplaced if name == CATALOG else 0),
+                'bytes': os.path.getsize(path) if path and os.path.exists(path) else None,
+            })
+        return {
+            'mode': shard_router.mode,
+            'shards': shards,
+            'moving': [(row.user_id, row.previous_shard, row.shard) for row in moving],
+        }
+
+    @staticmethod
+    def plan():
+        """
+        The moves that bring every unpinned user to the shard the placement policy
+        gives them (e.g. out of the catalog, or after SHARD_COUNT changed), plus
+        interrupted moves to resume: [(user_id, source, target, cached)].
+        `cached` is whether workers may hold a directory entry for the user.
+        """
+        directory = TenantShard.__table__
+        users = User.__table__
+        rows = db.session.execute(
+            select(users.c.id, users.c.change_seq, directory.c.shard, directory.c.state,
+                   directory.c.previous_shard, directory.c.pinned)
+            .select_from(users.outerjoin(directory, directory.c.user_id == users.c.id))
+            .order_by(users.c.id)
+        ).all()
+
+        moves = []
+        for row in rows:
+            if row.state == 'moving':
+                moves.append((row.id, row.previous_shard, row.shard, True))
+            elif row.shard is None:
+                # Never placed: nothing to move unless they wrote before sharding
+                if row.change_seq:
+                    moves.append((row.id, CATALOG, shard_router.placement(row.id), False))
+            elif not row.pinned and row.shard != shard_router.placement(row.id):
+                moves.append((row.id, row.shard, shard_router.placement(row.id), True))
+        return moves
+
+    @staticmethod
+    def move(moves, grace_seconds=5, pin=None, on_moved=None):
+        """
+        Carries out [(user_id, source, target, cached)] moves as one batch.
+        `pin` True/False (re)sets the users' pinned flag; None keeps it.
+        """
+        pinned = {} if pin is None else {'pinned': pin}
+        for user_id, source, target, _ in moves:
+            if target != CATALOG:
+                shard_router.ensure_sequence(target, user_id)
+            shard_router.set_directory(user_id, shard=target, previous_shard=source, state='moving', **pinned)
+
+        if any(cached for *_, cached in moves):
+            # Workers trust cached placements for SHARD_DIRECTORY_TTL; let those and in-flight requests drain
+            time.sleep(shard_router.directory_cache.ttl + grace_seconds)
+
+        for user_id, source, target, _ in moves:
+            copied = ShardService._copy(user_id, source, target)
+            shard_router.set_directory(user_id, shard=target, previous_shard=None, state='active')
+            ShardService.purge(user_id, source)
+            logger.info('Moved user %s from %s to %s (%d rows)', user_id, label(source), label(target), copied)
+            if on_moved:
+                on_moved(user_id, source, target, copied)
+
+    @staticmethod
+    def _copy(user_id, source, target):
+        ShardService.purge(user_id, target)
+        with shard_router.use_shard(source):
+            change_seq = ChangeLog.current(user_id)
+            db.session.commit()
+
+        copied = 0
+        with shard_router.engine_for(source).connect() as connection:
+            for table in MOVED_TABLES:
+                batch_size = FILE_COPY_BATCH_SIZE if table is NoteFile.__table__ else COPY_BATCH_SIZE
+                result = connection.execution_options(yield_per=batch_size).execute(
+                    select(table).where(table.c.user_id == user_id)
+                )
+                for rows in result.partitions():
+                    batch = [dict(row._mapping) for row in rows]
+                    with shard_router.use_shard(target):
+                        db.session.execute(insert(table), batch)
+                        if table is Note.__table__:
+                            SearchService.reindex_ids(user_id, [row['id'] for row in batch])
+                        db.session.commit()
+                    copied += len(batch)
+
+        with shard_router.use_shard(target):
+            ChangeLog.restore(user_id, change_seq)
+            db.session.commit()
+        return copied
+
+    @staticmethod
+    def strays(shard):
+        """
+        Users with rows left in `shard` although the directory has them active
+        elsewhere: a move that stopped after the switch, before dropping the old copy.
+        """
+        directory = TenantShard.__table__
+        with shard_router.use_shard(shard):
+            present = set()
+            for table in MOVED_TABLES:
+                present.update(db.session.execute(select(table.c.user_id).distinct()).scalars())
+            db.session.commit()
+
+        user_ids = sorted(present)
+        strays = []
+        for start in range(0, len(user_ids), COPY_BATCH_SIZE):
+            strays.extend(db.session.execute(
+                select(directory.c.user_id).where(
+                    directory.c.user_id.in_(user_ids[start:start + COPY_BATCH_SIZE]),
+                    directory.c.shard != shard, directory.c.state == 'active',
+                )
+            ).scalars())
+        db.session.commit()
+        return strays
+
+    @staticmethod
+    def purge(user_id, shard):
+        """Deletes a user's rows (and search index) from one shard."""
+        with shard_router.use_shard(shard):
+            SearchService.remove_user(user_id)
+            for table in reversed(MOVED_TABLES):
+                db.session.execute(delete(table).where(table.c.user_id == user_id))
+            db.session.commit()
@@ -0,0 +1,365 @@
+import logging
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.note import Note
+from app.extensions import db
+from app.core.exceptions import APIException
+from app.services.change_log import ChangeLog
+from app.services.note_text import content_digest, summarize
+from app.services.patching import PatchError, apply_patch
+from app.services.scene_files import SceneFiles
+from app.services.search_service import SearchService
+import datetime
+
+logger = logging.getLogger(__name__)
+
+# Dialects that support INSERT ... ON CONFLICT DO UPDATE ... WHERE
+UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _parse_timestamp(value):
+    """Parses a client ISO-8601 timestamp into a naive UTC datetime (or None)."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SyncEngine:
+    """
+    Set-based implementation of the /sync protocol.
+
+    The whole payload is validated once, existing rows are loaded with one
+    IN query per chunk, Last-Write-Wins is decided in memory and the winners
+    are written with a single bulk upsert. The number of round-trips is
+    bounded by the chunk count, not by the number of notes.
+
+    When the client sends a `since` cursor, the response also carries the
+    changes made by other devices after it (see ChangeLog).
+
+    An upsert may carry a `patch` against the body with hash `baseHash`
+    instead of the full `content` (see app.services.patching). Patches whose
+    base is no longer current are returned in `conflicts` so the client can
+    resend those notes in full, as are notes whose id another user's note
+    already has (the client must pick a new id). `written` carries the new content_hash of
+    every note written: the base of its next patch.
+    """
+
+    @staticmethod
+    def parse_payload(data):
+        """Validates the raw request body and returns (upserts, deletes)."""
+        if not isinstance(data, dict):
+            raise APIException('Invalid sync payload. Expected an object.', 400)
+
+        raw_upserts = data.get('upserts') or []
+        raw_deletes = data.get('deletes') or []
+        if not isinstance(raw_upserts, list) or not isinstance(raw_deletes, list):
+            raise APIException("Invalid sync payload. 'upserts' and 'deletes' must be lists.", 400)
+
+        max_items = current_app.config.get('SYNC_MAX_ITEMS', 5000)
+        if len(raw_upserts) + len(raw_deletes) > max_items:
+            raise APIException(f'Too many changes in one sync. Send at most {max_items} per request.', 413)
+
+        deletes = list({note_id for note_id in raw_deletes if isinstance(note_id, str) and note_id})
+
+        # Keep only the newest version of each note if the client sent duplicates
+        upserts = {}
+        for item in raw_upserts:
+            if not isinstance(item, dict):
+                continue
+            note_id = item.get('id')
+            client_updated_at = _parse_timestamp(item.get('updatedAt'))
+            if not isinstance(note_id, str) or not note_id or client_updated_at is None:
+                continue
+
+            current = upserts.get(note_id)
+            if current is None or client_updated_at > current['updated_at']:
+                upserts[note_id] = {
+                    'id': note_id,
+                    'title': item.get('title'),
+                    'content': item.get('content'),
+                    'type': item.get('type'),
+                    'updated_at': client_updated_at,
+                }
+                if item.get('patch') is not None:
+                    upserts[note_id]['patch'] = item['patch']
+                    upserts[note_id]['base_hash'] = item.get('baseHash')
+
+        return list(upserts.values()), deletes
+
+    @staticmethod
+    def load_existing(user_id, note_ids, chunk_size):
+        """
+        Loads the LWW-relevant columns of the user's existing notes, keyed by id.
+        Returns (existing, foreign_ids): ids taken by another user's note can't be
+        written (the guarded upsert would skip them), so they are reported instead.
+        """
+        existing, foreign = {}, set()
+        for chunk in _chunks(note_ids, chunk_size):
+            rows = db.session.execute(
+                db.select(Note.id, Note.user_id, Note.title, Note.type, Note.updated_at, Note.content_hash)
+                .where(Note.id.in_(chunk))
+            )
+            for row in rows:
+                if row.user_id == user_id:
+                    existing[row.id] = row
+                else:
+                    foreign.add(row.id)
+        return existing, foreign
+
+    @staticmethod
+    def apply_patches(user_id, upserts, existing, chunk_size):
+        """
+        Turns patched upserts that would win LWW into full-content upserts.
+        Only the bodies being patched are read. Returns (upserts, conflicting_ids).
+        """
+        patched = {}
+        for item in upserts:
+            if 'patch' not in item:
+                continue
+            current = existing.get(item['id'])
+            if current is not None and current.updated_at is not None and item['updated_at'] <= current.updated_at:
+                continue  # Loses LWW anyway; resolve() counts it as skipped
+            patched[item['id']] = item
+        if not patched:
+            return upserts, []
+
+        conflicts = set()
+        for note_id, item in patched.items():
+            current = existing.get(note_id)
+            if current is None or item['base_hash'] != current.content_hash:
+                conflicts.add(note_id)
+
+        pending = [note_id for note_id in patched if note_id not in conflicts]
+        for chunk in _chunks(pending, chunk_size):
+            rows = db.session.execute(
+                db.select(Note.id, Note.type, Note.content).where(Note.user_id == user_id, Note.id.in_(chunk))
+            )
+            for row in rows:
+                item = patched[row.id]
+                try:
+                    item['content'] = apply_patch(item['type'] or row.type, row.content, item['patch'])
+                except PatchError:
+                    conflicts.add(row.id)
+
+        return [item for item in upserts if item['id'] not in conflicts], sorted(conflicts)
+
+    @staticmethod
+    def resolve(user_id, upserts, existing):
+        """
+        Applies Last-Write-Wins in memory.
+        Returns (inserts, updates, skipped_count, ids_whose_text_changed).
+        """
+        inserts, updates = [], []
+        skipped = 0
+        changed = set()
+        for item in upserts:
+            current = existing.get(item['id'])
+
+            if current is None:
+                note_type = item['type'] or 'markdown'
+                content = SceneFiles.extract(user_id, note_type, item['content'] if item['content'] is not None else '')
+                content_size, preview = summarize(note_type, content)
+                inserts.append({
+                    'id': item['id'],
+                    'title': item['title'] or 'Untitled',
+                    'content': content,
+                    'type': note_type,
+                    'user_id': user_id,
+                    'updated_at': item['updated_at'],
+                    'content_size': content_size,
+                    'preview': preview,
+                    'content_hash': content_digest(content),
+                })
+                changed.add(item['id'])
+                logger.debug('Sync item %s: inserted', item['id'])
+            elif current.updated_at is None or item['updated_at'] > current.updated_at:
+                # Missing fields keep their stored value (content and its summary via COALESCE
+                # on write). So do bodies the client resent unchanged: no blob rewrite at all.
+                note_type = item['type'] or current.type
+                content = SceneFiles.extract(user_id, note_type, item['content'])
+                content_hash = content_digest(content)
+                if content_hash is not None and content_hash == current.content_hash:
+                    content = content_hash = None
+
+                title = item['title'] or current.title
+                content_size, preview = summarize(note_type, content)
+                updates.append({
+                    'id': item['id'],
+                    'title': title,
+                    'content': content,
+                    'type': note_type,
+                    'user_id': user_id,
+                    'updated_at': item['updated_at'],
+                    'content_size': content_size,
+                    'preview': preview,
+                    'content_hash': content_hash,
+                })
+                if content is not None or title != current.title or note_type != current.type:
+                    changed.add(item['id'])
+                logger.debug('Sync item %s: updated (body %s)', item['id'], 'unchanged' if content is None else 'rewritten')
+            else:
+                skipped += 1
+                logger.debug('Sync item %s: skipped, the stored copy is newer', item['id'])
+        return inserts, updates, skipped, changed
+
+    @staticmethod
+    def write(inserts, updates, chunk_size):
+        """Writes the resolved rows with a guarded bulk upsert."""
+        rows = inserts + updates
+        if not rows:
+            return
+
+        dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+        if dialect_insert is None:
+            SyncEngine._write_generic(inserts, updates, chunk_size)
+            return
+
+        table = Note.__table__
+        stmt = dialect_insert(table)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={
+                'title': excluded.title,
+                'content': func.coalesce(excluded.content, table.c.content),
+                'type': excluded.type,
+                'updated_at': excluded.updated_at,
+                'change_seq': excluded.change_seq,
+                'content_size': func.coalesce(excluded.content_size, table.c.content_size),
+                'preview': func.coalesce(excluded.preview, table.c.preview),
+                'content_hash': func.coalesce(excluded.content_hash, table.c.content_hash),
+            },
+            # Re-check LWW in SQL so a concurrent writer is never overwritten
+            # by an older version, and another user's note is never touched.
+            where=(table.c.user_id == excluded.user_id) & or_(
+                table.c.updated_at.is_(None),
+                excluded.updated_at > table.c.updated_at,
+            ),
+        )
+        for chunk in _chunks(rows, chunk_size):
+            db.session.execute(stmt, chunk)
+
+    @staticmethod
+    def _write_generic(inserts, updates, chunk_size):
+        """Fallback for dialects without ON CONFLICT: executemany INSERT plus UPDATE."""
+        table = Note.__table__
+        for chunk in _chunks(inserts, chunk_size):
+            db.session.execute(insert(table), chunk)
+
+        stmt = (
+            update(table)
+            .where(
+                table.c.id == bindparam('b_id'),
+                table.c.user_id == bindparam('b_user_id'),
+                or_(table.c.updated_at.is_(None), table.c.updated_at < bindparam('b_updated_at')),
+            )
+            .values(
+                title=bindparam('b_title'),
+                content=func.coalesce(bindparam('b_content', type_=table.c.content.type), table.c.content),
+                type=bindparam('b_type'),
+                updated_at=bindparam('b_updated_at'),
+                change_seq=bindparam('b_change_seq'),
+                content_size=func.coalesce(bindparam('b_content_size'), table.c.content_size),
+                preview=func.coalesce(bindparam('b_preview'), table.c.preview),
+                content_hash=func.coalesce(bindparam('b_content_hash'), table.c.content_hash),
+            )
+        )
+        params = [{f'b_{key}': value for key, value in row.items()} for row in updates]
+        for chunk in _chunks(params, chunk_size):
+            db.session.execute(stmt, chunk)
+
+    @staticmethod
+    def versions(inserts, updates, existing):
+        """
+        The new version of every row written, as PUT returns it. The stored body
+        may differ from the one the client sent (embedded images are extracted,
+        scenes re-serialized), so the next patch must be based on this hash.
+        """
+        versions = []
+        for row in inserts + updates:
+            content_hash = row['content_hash']
+            if content_hash is None:
+                content_hash = existing[row['id']].content_hash # Body unchanged
+            versions.append({
+                'id': row['id'],
+                'content_hash': content_hash,
+                'updated_at': row['updated_at'].isoformat() + 'Z',
+                'change_seq': row['change_seq'],
+            })
+        return versions
+
+    @staticmethod
+    def delete(user_id, note_ids, first_seq, chunk_size):
+        """Hard-deletes the user's notes and leaves a tombstone for each one."""
+        deleted = 0
+        for chunk in _chunks(note_ids, chunk_size):
+            owned = db.session.execute(
+                db.select(Note.id).where(Note.user_id == user_id, Note.id.in_(chunk))
+            ).scalars().all()
+            if not owned:
+                continue
+            db.session.execute(db.delete(Note).where(Note.user_id == user_id, Note.id.in_(owned)))
+            ChangeLog.record_deletes(user_id, owned, first_seq + deleted)
+            SearchService.remove(owned)
+            deleted += len(owned)
+        return deleted
+
+    @staticmethod
+    def run(user, data):
+        """Applies one /sync payload; the caller commits (see NoteService.sync_notes)."""
+        chunk_size = current_app.config.get('SYNC_BATCH_SIZE', 500)
+        upserts, deletes = SyncEngine.parse_payload(data)
+        since = ChangeLog.parse_cursor(data['since']) if data.get('since') is not None else None
+
+        inserts, updates, skipped, deleted, conflicts, written = [], [], 0, 0, [], []
+        if upserts or deletes:
+            # Reserve one sequence number per pushed item (gaps are harmless)
+            first_seq = ChangeLog.allocate(user.id, len(upserts) + len(deletes))
+
+            deleted = SyncEngine.delete(user.id, deletes, first_seq, chunk_size)
+
+            existing, foreign = SyncEngine.load_existing(user.id, [item['id'] for item in upserts], chunk_size)
+            if foreign:
+                logger.warning('Sync for user %s: %d note ids belong to another user', user.id, len(foreign))
+                upserts = [item for item in upserts if item['id'] not in foreign]
+            upserts, conflicts = SyncEngine.apply_patches(user.id, upserts, existing, chunk_size)
+            conflicts = sorted(foreign.union(conflicts))
+            inserts, updates, skipped, changed = SyncEngine.resolve(user.id, upserts, existing)
+            for offset, row in enumerate(inserts + updates, start=len(deletes)):
+                row['change_seq'] = first_seq + offset
+
+            for chunk in _chunks([row['id'] for row in inserts], chunk_size):
+                ChangeLog.clear_tombstones(user.id, chunk)
+            SyncEngine.write(inserts, updates, chunk_size)
+            SearchService.reindex_ids(user.id, list(changed))
+            written = SyncEngine.versions(inserts, updates, existing)
+
+        result = {
+            'upserted': len(inserts) + len(updates),
+            'skipped': skipped,
+            'deleted': deleted,
+            'conflicts': conflicts,
+            'written': written,
+        }
+
+        # Pull half: everything stamped after the client's cursor, minus what it just pushed
+        if since is not None:
+            pushed_ids = {row['id'] for row in inserts + updates}.union(deletes)
+            limit = current_app.config.get('SYNC_PULL_LIMIT', 500)
+            result.update(ChangeLog.changes_since(user.id, since, limit, exclude_ids=pushed_ids))
+        return result
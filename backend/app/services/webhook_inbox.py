@@ -0,0 +1,223 @@
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from app.models.user import User
+from app.models.webhook_event import WebhookEvent
+from app.extensions import db
+from app.core.security import invalidate_principal
+import datetime
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Subscription status each provider event moves the user to
+SUBSCRIPTION_TRANSITIONS = {
+    'subscription.trial_started': 'trialing',
+    'subscription.active': 'active',
+    'subscription.trial_expired': 'expired',
+    'subscription.past_due': 'expired',
+    'subscription.canceled': 'canceled',
+}
+
+# Background worker state (one thread per process, restarted after a fork)
+_worker_lock = threading.Lock()
+_worker_pid = None
+_wakeup = threading.Event()
+# Processing lag (received -> applied) of the last event this process handled
+_last_lag_seconds = None
+
+
+def _event_time(payload, header_timestamp):
+    """The provider's event timestamp, else the delivery timestamp header, as naive UTC."""
+    value = payload.get('timestamp') if isinstance(payload, dict) else None
+    if isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            return parsed
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.utcfromtimestamp(int(header_timestamp))
+    except (TypeError, ValueError):
+        return datetime.datetime.utcnow()
+
+
+class WebhookInbox:
+    """
+    Durable, idempotent inbox for payment webhooks.
+
+    The HTTP handler only stores the verified event (a redelivered
+    `webhook-id` is a no-op) and answers 200. A per-process worker applies
+    pending events oldest first; claiming an event and applying it happen in
+    one transaction, so concurrent workers never apply the same event twice.
+    """
+
+    @staticmethod
+    def receive(webhook_id, body, header_timestamp=None):
+        """Stores a verified event. Returns False if this webhook-id was already received."""
+        payload = json.loads(body)
+        event = WebhookEvent(
+            webhook_id=webhook_id,
+            event_type=str(payload.get('type', ''))[:100],
+            payload=body,
+            event_at=_event_time(payload, header_timestamp),
+        )
+        db.session.add(event)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            logger.info('Duplicate webhook %s ignored', webhook_id)
+            return False
+        _wakeup.set()
+        return True
+
+    @staticmethod
+    def process_pending(limit=50):
+        """Applies up to `limit` due events in event order. Returns how many were handled."""
+        global _last_lag_seconds
+        max_attempts = current_app.config.get('WEBHOOK_MAX_ATTEMPTS', 8)
+        now = datetime.datetime.utcnow()
+        due = db.session.execute(
+            db.select(WebhookEvent.webhook_id)
+            .where(WebhookEvent.status == 'pending', WebhookEvent.next_attempt_at <= now)
+            .order_by(WebhookEvent.event_at, WebhookEvent.received_at)
+            .limit(limit)
+        ).scalars().all()
+        db.session.commit()
+
+        handled = 0
+        for webhook_id in due:
+            # Claiming takes the row's write lock until the commit below
+            claimed = db.session.execute(
+                update(WebhookEvent)
+                .where(WebhookEvent.webhook_id == webhook_id, WebhookEvent.status == 'pending')
+                .values(attempts=WebhookEvent.attempts + 1)
+            ).rowcount
+            if not claimed:
+                db.session.rollback()
+                continue
+
+            event = db.session.get(WebhookEvent, webhook_id)
+            try:
+                user_id = WebhookInbox._apply(event)
+                event.processed_at = datetime.datetime.utcnow()
+                db.session.commit()
+            except Exception as err:
+                db.session.rollback()
+                WebhookInbox._record_failure(webhook_id, err, max_attempts)
+                continue
+
+            if user_id is not None:
+                invalidate_principal(user_id)
+            _last_lag_seconds = (event.processed_at - event.received_at).total_seconds()
+            handled += 1
+        return handled
+
+    @staticmethod
+    def _apply(event):
+        """Applies one claimed event. Returns the id of the user it changed, if any."""
+        payload = json.loads(event.payload)
+        data = payload.get('data') or {}
+        metadata = data.get('metadata') or {}
+        status = SUBSCRIPTION_TRANSITIONS.get(event.event_type)
+
+        try:
+            user_id = int(metadata.get('user_id'))
+        except (TypeError, ValueError):
+            user_id = None # Ignore events without our metadata
+
+        user = db.session.get(User, user_id, with_for_update=True) if status and user_id else None
+        if user is None:
+            event.status = 'ignored'
+            return None
+        if user.subscription_event_at and event.event_at < user.subscription_event_at:
+            # A late retry of an older event must not undo a newer transition
+            event.status = 'ignored'
+            logger.info("Webhook %s (%s) is older than user %s's last event", event.webhook_id, event.event_type, user.id)
+            return None
+
+        user.subscription_status = status
+        if event.event_type == 'subscription.trial_started':
+            user.subscription_id = data.get('subscription_id')
+            user.dodo_customer_id = data.get('customer_id')
+        user.subscription_event_at = event.event_at
+        event.status = 'processed'
+        logger.info('Webhook %s: user %s is now %s', event.webhook_id, user.id, status)
+        return user.id
+
+    @staticmethod
+    def _record_failure(webhook_id, err, max_attempts):
+        # The claim's attempt count was rolled back with the failed transaction
+        event = db.session.get(WebhookEvent, webhook_id)
+        event.attempts += 1
+        if event.attempts >= max_attempts:
+            event.status = 'failed'
+            logger.error('Webhook %s failed permanently after %d attempts: %s', webhook_id, event.attempts, err)
+        else:
+            # Exponential backoff: 2s, 4s, 8s, ... capped at 10 minutes
+            delay = min(2 ** event.attempts, 600)
+            event.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+            logger.warning('Webhook %s failed (attempt %d), retrying in %ss: %s', webhook_id, event.attempts, delay, err)
+        event.last_error = str(err)[:255]
+        db.session.commit()
+
+    @staticmethod
+    def stats():
+        """Queue depth and processing lag of the inbox."""
+        now = datetime.datetime.utcnow()
+        counts = dict(db.session.execute(
+            db.select(WebhookEvent.status, func.count()).group_by(WebhookEvent.status)
+        ).all())
+        oldest_pending = db.session.execute(
+            db.select(func.min(WebhookEvent.received_at)).where(WebhookEvent.status == 'pending')
+        ).scalar()
+        last_processed = db.session.execute(db.select(func.max(WebhookEvent.processed_at))).scalar()
+        return {
+            'queue_depth': counts.get('pending', 0),
+            'failed': counts.get('failed', 0),
+            'processed': counts.get('processed', 0),
+            'ignored': counts.get('ignored', 0),
+            'oldest_pending_age_seconds': (now - oldest_pending).total_seconds() if oldest_pending else 0,
+            'last_processed_at': last_processed.isoformat() + 'Z' if last_processed else None,
+            'last_lag_seconds': _last_lag_seconds,
+        }
+
+
+def _work(app):
+    poll_seconds = app.config.get('WEBHOOK_POLL_SECONDS', 5)
+    batch_size = app.config.get('WEBHOOK_BATCH_SIZE', 50)
+    while True:
+        # Woken at once for events received by this worker; polls for everything else
+        _wakeup.wait(poll_seconds)
+        _wakeup.clear()
+        with app.app_context():
+            try:
+                while WebhookInbox.process_pending(batch_size) == batch_size:
+                    pass
+            except Exception:
+                logger.error("Webhook worker iteration failed", exc_info=True)
+            finally:
+                db.session.remove()
+
+
+def init_webhook_worker(app):
+    """Starts the inbox worker lazily in each serving process (not in a --preload master)."""
+    if not app.config.get('WEBHOOK_WORKER_ENABLED', True):
+        return
+
+    @app.before_request
+    def _ensure_webhook_worker():
+        global _worker_pid
+        if _worker_pid == os.getpid():
+            return
+        with _worker_lock:
+            if _worker_pid == os.getpid():
+                return
+            _worker_pid = os.getpid()
+            threading.Thread(target=_work, args=(app,), name='webhook-inbox', daemon=True).start()
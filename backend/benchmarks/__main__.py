@@ -0,0 +1,120 @@
+"""
+Benchmark runner (from backend/):
+
+    python -m benchmarks run --profile quick --output results.json
+    python -m benchmarks run --baseline baseline.json --threshold 0.2
+    python -m benchmarks load --clients 2000 --interval 10 --duration 60
+    python -m benchmarks load --concurrency 64 --set GROUP_COMMIT_ENABLED=true --set MAX_CONCURRENT_WRITES=64
+    python -m benchmarks compare baseline.json results.json
+
+Every command prints its results as JSON (or writes them to --output). Given
+a --baseline, run/load also compare against it and exit with status 1 when
+any scenario regressed by more than --threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from benchmarks.compare import DEFAULT_METRIC, compare, format_report
+
+
+def _write(result, output):
+    text = json.dumps(result, indent=2)
+    if output:
+        with open(output, 'w') as handle:
+            handle.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+def _load(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _check(baseline_path, result, threshold, metric):
+    if not baseline_path:
+        return 0
+    try:
+        report = compare(_load(baseline_path), result, threshold, metric)
+    except ValueError as e:
+        sys.exit(str(e))
+    sys.stderr.write(format_report(report) + '\n')
+    return 1 if report['regressions'] else 0
+
+
+def _setting(value):
+    """KEY=VALUE for --set; the value is parsed as JSON when it can be (true, 5, 0.5)."""
+    key, sep, raw = value.partition('=')
+    if not sep or not key:
+        raise argparse.ArgumentTypeError('expected KEY=VALUE')
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+def _add_comparison_args(parser):
+    parser.add_argument('--set', type=_setting, action='append', default=[], metavar='KEY=VALUE',
+                        help='override an app config setting (repeatable)')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown as a fraction (0.2 = 20%%)')
+    parser.add_argument('--metric', default=DEFAULT_METRIC, help='statistic to compare (e.g. p50_ms, p95_ms, mean_ms)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='request-level micro-benchmarks')
+    run.add_argument('--profile', choices=['quick', 'default', 'large'], default='default')
+    run.add_argument('--sync-batch', type=int, default=100, help='upserts/deletes per sync push')
+    run.add_argument('--import-batch', type=int, default=500, help='records per import')
+    run.add_argument('--seed', type=int, default=1234)
+    _add_comparison_args(run)
+
+    load = commands.add_parser('load', help='many clients running the background sync loop')
+    load.add_argument('--clients', type=int, default=1000)
+    load.add_argument('--interval', type=float, default=10.0, help='seconds between a client\'s syncs')
+    load.add_argument('--duration', type=float, default=60.0, help='seconds to run')
+    load.add_argument('--concurrency', type=int, default=32, help='requests in flight at most')
+    load.add_argument('--edit-probability', type=float, default=0.2, help='chance a wake-up has edits to push')
+    load.add_argument('--pull', action='store_true', help='also pull changes on every wake-up')
+    load.add_argument('--notes-per-client', type=int, default=5)
+    load.add_argument('--seed', type=int, default=1234)
+    _add_comparison_args(load)
+
+    diff = commands.add_parser('compare', help='compare two saved results')
+    diff.add_argument('baseline')
+    diff.add_argument('current')
+    diff.add_argument('--threshold', type=float, default=0.2)
+    diff.add_argument('--metric', default=DEFAULT_METRIC)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        return _check(args.baseline, _load(args.current), args.threshold, args.metric)
+
+    started = time.time()
+    if args.command == 'run':
+        from benchmarks.suite import run_suite
+        result = run_suite(args.profile, args.sync_batch, args.import_batch, args.seed, dict(args.set))
+    else:
+        from benchmarks.load import run_load
+        result = run_load(
+            args.clients, args.interval, args.duration, args.concurrency,
+            args.edit_probability, args.pull, args.notes_per_client, args.seed, dict(args.set)
+        )
+    result['environment'] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started)),
+    }
+    _write(result, args.output)
+    return _check(args.baseline, result, args.threshold, args.metric)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Compares a benchmark run against a saved baseline and flags regressions."""
+
+DEFAULT_METRIC = 'p95_ms'
+
+
+def compare(baseline, current, threshold=0.2, metric=DEFAULT_METRIC):
+    """
+    Compares `metric` of every scenario present in both runs.
+
+    A scenario regresses when it got more than `threshold` (a fraction: 0.2 is
+    20%) slower than the baseline. Scenarios only in one of the runs are listed
+    but never fail the comparison.
+    """
+    if baseline.get('suite') != current.get('suite'):
+        raise ValueError(f"Cannot compare a '{current.get('suite')}' run with a '{baseline.get('suite')}' baseline")
+
+    before, after = baseline.get('results', {}), current.get('results', {})
+    rows, regressions = [], []
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name].get(metric), after[name].get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        row = {'scenario': name, 'baseline': old, 'current': new, 'change': round(change, 3)}
+        rows.append(row)
+        if change > threshold:
+            regressions.append(name)
+
+    return {
+        'metric': metric,
+        'threshold': threshold,
+        'scenarios': rows,
+        'missing': sorted(set(before) - set(after)),
+        'new': sorted(set(after) - set(before)),
+        'regressions': regressions,
+    }
+
+
+def format_report(report):
+    lines = [f"{'scenario':<32} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for row in report['scenarios']:
+        flag = '  REGRESSION' if row['scenario'] in report['regressions'] else ''
+        lines.append(
+            f"{row['scenario']:<32} {row['baseline']:>10.2f} {row['current']:>10.2f} {row['change']:>+8.1%}{flag}"
+        )
+    for name in report['missing']:
+        lines.append(f'{name:<32} missing from the current run')
+    lines.append(
+        f"{len(report['regressions'])} regression(s) in {report['metric']} "
+        f"(threshold {report['threshold']:.0%})"
+    )
+    return '\n'.join(lines)
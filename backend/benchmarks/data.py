@@ -0,0 +1,80 @@
+"""Deterministic synthetic notes: markdown documents and large Excalidraw scenes."""
+import json
+import random
+import uuid
+
+WORDS = (
+    'note sync draft idea meeting plan budget design review launch sketch diagram roadmap '
+    'server client cache index query latency release backlog retro customer feature bug '
+    'fix deploy metric alert schema migration invoice summary agenda research outline'
+).split()
+
+
+class NoteFactory:
+    """Generates reproducible note records (seeded RNG) in the /import and /sync shapes."""
+
+    def __init__(self, seed=1234):
+        self.random = random.Random(seed)
+
+    def uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def sentence(self, words=12):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    def markdown(self, paragraphs=8):
+        parts = [f'# {self.sentence(4)}']
+        for index in range(paragraphs):
+            if index % 3 == 0:
+                parts.append(f'## {self.sentence(3)}')
+            parts.append(' '.join(self.sentence() for _ in range(5)))
+            if index % 4 == 1:
+                parts.append('\n'.join(f'- {self.sentence(6)}' for _ in range(4)))
+        return '\n\n'.join(parts)
+
+    def scene(self, elements=1500):
+        """An Excalidraw scene of rectangles and text labels (~300 bytes per element)."""
+        shapes = []
+        for index in range(elements):
+            element = {
+                'id': f'el-{index}-{self.random.getrandbits(32):08x}',
+                'type': 'text' if index % 3 == 0 else 'rectangle',
+                'x': self.random.uniform(-5000, 5000),
+                'y': self.random.uniform(-5000, 5000),
+                'width': self.random.uniform(20, 400),
+                'height': self.random.uniform(20, 300),
+                'angle': 0,
+                'strokeColor': '#1e1e1e',
+                'backgroundColor': 'transparent',
+                'seed': self.random.getrandbits(31),
+                'version': self.random.randint(1, 40),
+                'versionNonce': self.random.getrandbits(31),
+                'isDeleted': False,
+            }
+            if element['type'] == 'text':
+                element['text'] = self.sentence(5)
+            shapes.append(element)
+        return json.dumps({
+            'type': 'excalidraw',
+            'version': 2,
+            'elements': shapes,
+            'appState': {'viewBackgroundColor': '#ffffff', 'gridSize': None},
+            'files': {},
+        })
+
+    def records(self, markdown=100, excalidraw=0, scene_elements=1500):
+        """Import records: `markdown` documents followed by `excalidraw` scenes."""
+        for _ in range(markdown):
+            yield {'title': self.sentence(4)[:-1], 'type': 'markdown', 'content': self.markdown()}
+        for _ in range(excalidraw):
+            yield {'title': self.sentence(3)[:-1], 'type': 'excalidraw', 'content': self.scene(scene_elements)}
+
+    def sync_upsert(self, note_id, updated_at, note_type='markdown'):
+        """One /sync upsert item, as the frontend sends it."""
+        return {
+            'id': note_id,
+            'title': self.sentence(4)[:-1],
+            'type': note_type,
+            'content': self.markdown(3),
+            'updatedAt': updated_at,
+        }
@@ -0,0 +1,140 @@
+"""Builds a throwaway app + SQLite database and signs benchmark clients in."""
+import os
+import shutil
+import tempfile
+import time
+
+BENCH_PASSWORD = 'benchmark password'
+
+
+def percentiles(samples):
+    """Summary statistics (milliseconds) of a list of durations in seconds."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000, 3)
+
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(total / len(ordered) * 1000, 3),
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'ops_per_sec': round(len(ordered) / total, 1) if total else None,
+    }
+
+
+class Harness:
+    """
+    An app created with create_app() against a temporary SQLite database.
+
+    Benchmarks talk to it through Flask test clients, so they measure the
+    whole request path (routing, auth, validation, services, SQL) without
+    network noise. Use as a context manager to remove the database afterwards.
+    """
+
+    def __init__(self, **config):
+        self.tmpdir = tempfile.mkdtemp(prefix='fastnote-bench-')
+        # app.main builds a default app at import time; point it at the temp database too
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(self.tmpdir, 'bench.db')}"
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+        from app.core.config import Config, _engine_options
+        from app.database import create_schema
+        from app.main import create_app
+
+        overrides = {
+            'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL'],
+            'SQLALCHEMY_ENGINE_OPTIONS': _engine_options(os.environ['DATABASE_URL']),
+            'CHANGE_FEED_SOCKET_DIR': os.path.join(self.tmpdir, 'feed'),
+            'RATE_LIMIT_SQLITE_PATH': os.path.join(self.tmpdir, 'ratelimit.db'),
+            'SHARD_DIR': os.path.join(self.tmpdir, 'shards'),
+            'MAINTENANCE_LOCK_PATH': os.path.join(self.tmpdir, 'maintenance.lock'),
+            # Measure the code paths, not the limits in front of them (override to include them)
+            'RATE_LIMIT_ENABLED': False,
+            'WEBHOOK_WORKER_ENABLED': False,
+            'MAINTENANCE_WORKER_ENABLED': False,
+            'LOG_LEVEL': os.environ['LOG_LEVEL'],
+        }
+        overrides.update(config)
+        bench_config = type('BenchConfig', (Config,), overrides)
+
+        self.app = create_app(bench_config)
+        create_schema(self.app)
+        self._password_hash = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        from app.extensions import db
+        with self.app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def create_users(self, count, status='active', prefix='bench'):
+        """Bulk-creates users (all sharing one password hash) and returns their ids."""
+        from app.extensions import db
+        from app.models.user import User
+
+        with self.app.app_context():
+            if self._password_hash is None:
+                self._password_hash = _hash(BENCH_PASSWORD)
+            start = db.session.execute(db.select(db.func.count(User.id))).scalar()
+            rows = [
+                {
+                    'username': f'{prefix}{start + index}',
+                    'password_hash': self._password_hash,
+                    'subscription_status': status,
+                    'change_seq': 0,
+                }
+                for index in range(count)
+            ]
+            db.session.execute(db.insert(User), rows)
+            db.session.commit()
+            return db.session.execute(
+                db.select(User.id).where(User.username.in_([row['username'] for row in rows])).order_by(User.id)
+            ).scalars().all()
+
+    def seed_notes(self, user_id, records):
+        """Writes note records through the bulk import path (summaries, hashes and search index)."""
+        from app.core.sharding import shard_router
+        from app.services.note_service import NoteService
+        with self.app.app_context():
+            shard_router.bind_tenant(user_id)
+            return NoteService.import_notes(user_id, records)
+
+    def client(self, user_id):
+        """A test client carrying the user's auth cookie."""
+        from app.core.security import generate_token
+        from app.extensions import db
+        from app.models.user import User
+
+        with self.app.app_context():
+            user = db.session.get(User, user_id)
+            with self.app.test_request_context():
+                token = generate_token(user.id, user.username)
+        client = self.app.test_client()
+        client.set_cookie('access_token', token)
+        return client
+
+
+def _hash(password):
+    from app.core.passwords import password_hasher
+    return password_hasher.hash(password)
+
+
+def timed(func, *args, **kwargs):
+    """Runs func once and returns (elapsed_seconds, result)."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
@@ -0,0 +1,145 @@
+"""
+Multi-client load driver: the frontend's background sync loop at scale.
+
+Every simulated client is its own user and wakes up every `interval` seconds
+(HomePage.js syncs every 10 s), staggered randomly like real sign-ins. On a
+wake-up it has pending edits with probability `edit_probability` and pushes
+them to /api/notes/sync (a few upserts, sometimes a delete); otherwise it
+sends nothing, as the frontend does -- unless `pull` is set, in which case
+it asks for changes since its last sequence number instead.
+
+A scheduler thread hands due wake-ups to a pool of `concurrency` workers.
+Besides request latency the report includes schedule lag (how late each
+wake-up started): when the server can't keep up, lag grows without bound
+and the achieved rate falls below the target.
+"""
+import datetime
+import heapq
+import queue
+import threading
+import time
+from collections import Counter
+from benchmarks.data import NoteFactory
+from benchmarks.harness import Harness, percentiles
+
+
+class _Client:
+    def __init__(self, user_id, http):
+        self.user_id = user_id
+        self.http = http
+        self.note_ids = []
+        self.since = 0
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+
+
+def run_load(clients=1000, interval=10.0, duration=60.0, concurrency=32, edit_probability=0.2,
+             pull=False, notes_per_client=5, seed=1234, config=None):
+    factory = NoteFactory(seed)
+    lock = threading.Lock()
+    latencies, lags, statuses = [], [], Counter()
+    counts = Counter()
+
+    with Harness(**(config or {})) as harness:
+        user_ids = harness.create_users(clients, prefix='load')
+        started_seed = time.perf_counter()
+        population = [_Client(user_id, harness.client(user_id)) for user_id in user_ids]
+        for client in population:
+            harness.seed_notes(client.user_id, factory.records(notes_per_client))
+        for client in population:
+            listing = client.http.get('/api/notes/?view=summary&per_page=100').get_json()
+            client.note_ids = [note['id'] for note in listing['notes']]
+        seed_seconds = time.perf_counter() - started_seed
+
+        def tick(client):
+            with lock:
+                edits = factory.random.random() < edit_probability
+                if edits:
+                    upserts = [factory.sync_upsert(factory.uuid(), _now()) for _ in range(factory.random.randint(1, 3))]
+                    if client.note_ids and factory.random.random() < 0.5:
+                        upserts.append(factory.sync_upsert(factory.random.choice(client.note_ids), _now()))
+                    deletes = []
+                    if len(client.note_ids) > notes_per_client and factory.random.random() < 0.3:
+                        deletes.append(client.note_ids.pop(0))
+            if edits:
+                payload, kind = {'upserts': upserts, 'deletes': deletes}, 'push'
+            elif pull:
+                payload, kind = {'upserts': [], 'deletes': []}, 'pull'
+            else:
+                return None
+            if pull:
+                payload['since'] = client.since
+            started = time.perf_counter()
+            response = client.http.post('/api/notes/sync', json=payload)
+            elapsed = time.perf_counter() - started
+            if response.status_code == 200:
+                client.since = response.get_json().get('cursor', client.since)
+                if kind == 'push':
+                    client.note_ids.extend(item['id'] for item in upserts if item['id'] not in client.note_ids)
+            return kind, response.status_code, elapsed
+
+        due = queue.Queue(maxsize=concurrency * 4)
+
+        def worker():
+            while True:
+                item = due.get()
+                if item is None:
+                    return
+                scheduled, client = item
+                lag = time.perf_counter() - scheduled
+                outcome = tick(client)
+                with lock:
+                    lags.append(lag)
+                    counts['wakeups'] += 1
+                    if outcome is not None:
+                        kind, status, elapsed = outcome
+                        latencies.append(elapsed)
+                        statuses[status] += 1
+                        counts[kind] += 1
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in workers:
+            thread.start()
+
+        begin = time.perf_counter()
+        schedule = [(begin + factory.random.uniform(0, interval), index) for index in range(clients)]
+        heapq.heapify(schedule)
+        end = begin + duration
+        while schedule:
+            when, index = schedule[0]
+            if when >= end:
+                break
+            now = time.perf_counter()
+            if when > now:
+                time.sleep(min(when - now, 0.05))
+                continue
+            heapq.heapreplace(schedule, (when + interval, index))
+            # Blocks when the workers are saturated, which shows up as lag
+            due.put((when, population[index]))
+        for _ in workers:
+            due.put(None)
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - begin
+
+    requests = counts['push'] + counts['pull']
+    errors = {str(status): count for status, count in statuses.items() if status != 200}
+    return {
+        'suite': 'load',
+        'config': {
+            'clients': clients, 'interval': interval, 'duration': duration, 'concurrency': concurrency,
+            'edit_probability': edit_probability, 'pull': pull, 'notes_per_client': notes_per_client,
+            'app_config': config or {},
+        },
+        'seed_seconds': round(seed_seconds, 3),
+        'target_wakeups_per_sec': round(clients / interval, 1),
+        'achieved_wakeups_per_sec': round(counts['wakeups'] / elapsed, 1),
+        'requests': {'push': counts['push'], 'pull': counts['pull'], 'per_sec': round(requests / elapsed, 1)},
+        'errors': errors,
+        'results': {
+            'sync_request': percentiles(latencies),
+            'schedule_lag': percentiles(lags),
+        },
+    }
@@ -0,0 +1,139 @@
+"""
+Login microbenchmark: inline hashing vs. the password hasher's thread pool.
+
+Runs concurrent logins against a throwaway SQLite database and reports login
+throughput, latency percentiles and -- the point of the pool -- how long a
+cheap concurrent task was kept waiting ("loop stall") while hashes ran.
+
+    python -m benchmarks.password_hashing --clients 16 --logins 200
+
+With gevent installed the clients are greenlets on a monkey-patched worker,
+like production. Without it they are plain threads, where inline hashing
+does not block other threads and the comparison is much less dramatic.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+try:
+    from gevent import monkey
+    monkey.patch_all()
+    import gevent
+except ImportError:
+    gevent = None
+
+import threading
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+def _spawn(func, count):
+    if gevent is not None:
+        gevent.joinall([gevent.spawn(func) for _ in range(count)])
+        return
+    threads = [threading.Thread(target=func) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_mode(app, workers, clients, logins, password):
+    from app.core.passwords import init_password_hasher
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    init_password_hasher(app)
+
+    latencies, stalls = [], []
+    remaining = [logins]
+    running = [True]
+    lock = threading.Lock()
+
+    def client():
+        test_client = app.test_client()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            response = test_client.post('/api/auth/login', json={'username': 'bench', 'password': password})
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+    def ticker():
+        # Wants to run every millisecond; any extra delay is time it was starved
+        while running[0]:
+            started = time.perf_counter()
+            time.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    tick = threading.Thread(target=ticker)
+    tick.start()
+    started = time.perf_counter()
+    _spawn(client, clients)
+    elapsed = time.perf_counter() - started
+    running[0] = False
+    tick.join()
+
+    return {
+        'mode': f'pool({workers})' if workers else 'inline',
+        'logins_per_second': round(logins / elapsed, 1),
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.50) * 1000, 1),
+            'p95': round(_percentile(latencies, 0.95) * 1000, 1),
+            'p99': round(_percentile(latencies, 0.99) * 1000, 1),
+        },
+        'loop_stall_ms': {
+            'p99': round(_percentile(stalls, 0.99) * 1000, 1),
+            'max': round(max(stalls, default=0) * 1000, 1),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16, help='concurrent login clients')
+    parser.add_argument('--logins', type=int, default=200, help='logins per mode')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help='pool sizes to compare with inline')
+    parser.add_argument('--method', default=None, help='PASSWORD_HASH_METHOD to benchmark')
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix='fastnote-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+    if args.method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.method
+    os.environ['LOG_LEVEL'] = 'WARNING'
+
+    from app.main import create_app
+    from app.database import create_schema
+    from app.extensions import db
+    from app.models.user import User
+
+    app = create_app()
+    password = 'correct horse battery staple'
+    with app.app_context():
+        create_schema(app)
+        user = User(username='bench')
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+
+    results = [run_mode(app, 0, args.clients, args.logins, password)]
+    results += [run_mode(app, workers, args.clients, args.logins, password) for workers in args.workers]
+    json.dump({
+        'runtime': 'gevent' if gevent is not None else 'threads',
+        'method': app.config['PASSWORD_HASH_METHOD'],
+        'clients': args.clients,
+        'results': results,
+    }, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Startup benchmark: what it costs to bring up the app and its gunicorn workers.
+
+    python -m benchmarks.startup --runs 5 --workers 4 --importtime 15
+
+Every measurement runs in fresh interpreters against a throwaway SQLite
+database, and the results are printed as JSON:
+
+- cold_start: a new process importing app.main (what every `flask` command
+  and every worker without --preload pays), its RSS and module count, and
+  the first requests it then serves -- a plain one and a payment webhook,
+  which loads the payments SDK
+- schema_bootstrap: the entrypoint's schema step, as a process of its own
+- workers: workers forked from a --preload master, as gunicorn does, after
+  each served a request: RSS, the memory only that worker holds (USS) and
+  its share of everything (PSS), from /proc/<pid>/smaps_rollup
+- slowest_imports: modules by cumulative import time (python -X importtime)
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Shared by the probes below (they run as `python -c` in a fresh interpreter)
+MEMORY = r'''
+import json, os, resource, sys, time
+
+def memory():
+    """RSS, PSS and USS (private pages) of this process, in KiB."""
+    try:
+        with open('/proc/self/smaps_rollup') as handle:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in handle if line.split()[-1] == 'kB'}
+        return {'rss_kb': fields['Rss'], 'pss_kb': fields['Pss'],
+                'uss_kb': fields['Private_Clean'] + fields['Private_Dirty']}
+    except (OSError, KeyError):
+        # ru_maxrss: peak RSS, in KiB on Linux (bytes on macOS)
+        return {'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return round((time.perf_counter() - started) * 1000, 1)
+'''
+
+COLD_START = MEMORY + r'''
+started = time.perf_counter()
+import app.main
+result = {'import_ms': round((time.perf_counter() - started) * 1000, 1), 'modules': len(sys.modules)}
+result.update(memory())
+client = app.main.app.test_client()
+result['first_request_ms'] = timed(lambda: client.get('/api/notes/'))
+result['first_payment_request_ms'] = timed(lambda: client.post('/api/payments/webhook', data=b'{}'))
+result['rss_after_requests_kb'] = memory()['rss_kb']
+print('RESULT ' + json.dumps(result))
+'''
+
+PRELOADED_WORKERS = MEMORY + r'''
+import app.main
+count = int(sys.argv[1])
+master = memory()
+go_read, go_write = os.pipe()
+children = []
+for _ in range(count):
+    ready_read, ready_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(go_write)
+        client = app.main.app.test_client()
+        result = {'first_request_ms': timed(lambda: client.get('/api/notes/'))}
+        os.write(ready_write, b'r')
+        os.read(go_read, 1) # Measured once every worker is up, so shared pages are split between them all
+        result.update(memory())
+        os.write(ready_write, json.dumps(result).encode())
+        os._exit(0)
+    os.close(ready_write)
+    children.append((pid, ready_read))
+
+for _, ready_read in children:
+    os.read(ready_read, 1)
+os.close(go_write)
+workers = []
+for pid, ready_read in children:
+    chunks = []
+    while True:
+        chunk = os.read(ready_read, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.waitpid(pid, 0)
+    workers.append(json.loads(b''.join(chunks)))
+print('RESULT ' + json.dumps({'master': master, 'workers': workers}))
+'''
+
+
+def _environment(tmpdir):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(tmpdir, 'startup.db')}",
+        'CHANGE_FEED_SOCKET_DIR': os.path.join(tmpdir, 'feed'),
+        'RATE_LIMIT_SQLITE_PATH': os.path.join(tmpdir, 'ratelimit.db'),
+        'MAINTENANCE_LOCK_PATH': os.path.join(tmpdir, 'maintenance.lock'),
+        'SHARD_DIR': os.path.join(tmpdir, 'shards'),
+        'LOG_LEVEL': 'CRITICAL',
+        'DODO_PAYMENTS_API_KEY': 'benchmark',
+    })
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    return env
+
+
+def _run(command, tmpdir):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        command, cwd=BACKEND_DIR, env=_environment(tmpdir), capture_output=True, text=True, check=False
+    )
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{completed.stderr[-2000:]}")
+    return elapsed_ms, completed
+
+
+def _probe(code, tmpdir, *args):
+    elapsed_ms, completed = _run([sys.executable, '-c', code, *args], tmpdir)
+    line = next(line for line in completed.stdout.splitlines() if line.startswith('RESULT '))
+    result = json.loads(line[len('RESULT '):])
+    result['process_ms'] = elapsed_ms
+    return result
+
+
+def _summary(samples):
+    """Median (and min) of every numeric field over the runs."""
+    keys = [key for key, value in samples[0].items() if isinstance(value, (int, float))]
+    return {key: {'median': statistics.median(s[key] for s in samples), 'min': min(s[key] for s in samples)}
+            for key in keys}
+
+
+def cold_start(runs):
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix='fastnote-startup-') as tmpdir:
+            samples.append(_probe(COLD_START, tmpdir))
+    return _summary(samples)
+
+
+def schema_bootstrap(runs):
+    commands = {'flask init-db': [sys.executable, '-m', 'flask', '--app', 'app.main:app', 'init-db']}
+    if importlib.util.find_spec('app.bootstrap') is not None:
+        commands['python -m app.bootstrap'] = [sys.executable, '-m', 'app.bootstrap']
+    results = {}
+    for name, command in commands.items():
+        samples = []
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory(prefix='fastnote-startup-') as tmpdir:
+                samples.append(_run(command, tmpdir)[0])
+        results[name] = {'median_ms': statistics.median(samples), 'min_ms': min(samples)}
+    return results
+
+
+def preloaded_workers(count):
+    if not hasattr(os, 'fork'):
+        return None
+    with tempfile.TemporaryDirectory(prefix='fastnote-startup-') as tmpdir:
+        result = _probe(PRELOADED_WORKERS, tmpdir, str(count))
+    workers = result['workers']
+    result['per_worker'] = _summary(workers)
+    return result
+
+
+def slowest_imports(count):
+    with tempfile.TemporaryDirectory(prefix='fastnote-startup-') as tmpdir:
+        _, completed = _run([sys.executable, '-X', 'importtime', '-c', 'import app.main'], tmpdir)
+    imports = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        imports[name] = {'module': name, 'cumulative_ms': int(cumulative_us) / 1000, 'self_ms': int(self_us) / 1000}
+    return sorted(imports.values(), key=lambda entry: entry['cumulative_ms'], reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per measurement')
+    parser.add_argument('--workers', type=int, default=4, help='workers to fork from the preloaded master')
+    parser.add_argument('--importtime', type=int, default=15, help='slowest imports to list (0 = skip)')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    result = {
+        'cold_start': cold_start(args.runs),
+        'schema_bootstrap': schema_bootstrap(args.runs),
+        'workers': preloaded_workers(args.workers),
+    }
+    if args.importtime:
+        result['slowest_imports'] = slowest_imports(args.importtime)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
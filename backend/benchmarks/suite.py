@@ -0,0 +1,161 @@
+"""
+Request-level micro-benchmarks of the notes API.
+
+Each scenario runs `repeat` timed iterations (after `warmup` untimed ones)
+against a seeded library and reports latency percentiles in milliseconds.
+"""
+import datetime
+import json
+import time
+from benchmarks.data import NoteFactory
+from benchmarks.harness import Harness, percentiles
+
+# Library sizes per profile: markdown notes, excalidraw scenes, elements per scene
+PROFILES = {
+    'quick': {'markdown': 300, 'excalidraw': 5, 'scene_elements': 1000, 'repeat': 20},
+    'default': {'markdown': 2000, 'excalidraw': 20, 'scene_elements': 2000, 'repeat': 50},
+    'large': {'markdown': 20000, 'excalidraw': 100, 'scene_elements': 4000, 'repeat': 100},
+}
+# Whole words, multi-term and prefix queries
+SEARCH_TERMS = ('sync', 'roadmap', 'cache query', 'lau', 'design review')
+# What a browser sends; the server picks its preferred encoding among them
+ACCEPT_ENCODING = {'Accept-Encoding': 'gzip, deflate, br, zstd'}
+
+
+def _ok(response, expected=200):
+    if response.status_code != expected:
+        raise RuntimeError(f'{response.request.method} {response.request.path} -> {response.status_code}: '
+                           f'{response.get_data(as_text=True)[:200]}')
+    return response
+
+
+def _measure(run, repeat, warmup=2):
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def _timestamp(offset_seconds):
+    moment = datetime.datetime(2030, 1, 1) + datetime.timedelta(seconds=offset_seconds)
+    return moment.isoformat() + 'Z'
+
+
+def run_suite(profile='default', sync_batch=100, import_batch=500, seed=1234, config=None):
+    settings = PROFILES[profile]
+    repeat = settings['repeat']
+    factory = NoteFactory(seed)
+    results = {}
+
+    with Harness(**(config or {})) as harness:
+        user_id = harness.create_users(1)[0]
+        started = time.perf_counter()
+        harness.seed_notes(user_id, factory.records(
+            settings['markdown'], settings['excalidraw'], settings['scene_elements']
+        ))
+        seed_seconds = time.perf_counter() - started
+        client = harness.client(user_id)
+
+        listing = _ok(client.get('/api/notes/?view=summary&per_page=100')).get_json()
+        note_ids = [note['id'] for note in listing['notes'] if note['type'] == 'markdown']
+        scene_ids = [note['id'] for note in listing['notes'] if note['type'] == 'excalidraw']
+
+        results['list_summary'] = _measure(lambda: _ok(client.get('/api/notes/?view=summary&per_page=20')), repeat)
+        results['list_full'] = _measure(lambda: _ok(client.get('/api/notes/?per_page=20')), repeat)
+        after = listing['next_cursor']
+        results['list_keyset_page'] = _measure(
+            lambda: _ok(client.get(f'/api/notes/?view=summary&per_page=20&after={after}')), repeat
+        )
+
+        results['search'] = _measure(lambda: _ok(client.get('/api/notes/', query_string={
+            'search': factory.random.choice(SEARCH_TERMS), 'per_page': 20
+        })), repeat)
+
+        results['get_markdown'] = _measure(
+            lambda: _ok(client.get(f'/api/notes/{factory.random.choice(note_ids)}')), repeat
+        )
+        if scene_ids:
+            results['get_excalidraw'] = _measure(lambda: _ok(client.get(f'/api/notes/{scene_ids[0]}')), repeat)
+
+        # Same reads with response compression negotiated (RESPONSE_COMPRESSION)
+        results['list_full_compressed'] = _measure(
+            lambda: _ok(client.get('/api/notes/?per_page=20', headers=ACCEPT_ENCODING)), repeat
+        )
+        if scene_ids:
+            results['get_excalidraw_compressed'] = _measure(
+                lambda: _ok(client.get(f'/api/notes/{scene_ids[0]}', headers=ACCEPT_ENCODING)), repeat
+            )
+        transfer = {}
+        for name, path in (('list_full', '/api/notes/?per_page=20'),
+                           ('get_excalidraw', f'/api/notes/{scene_ids[0]}' if scene_ids else None)):
+            if path is None:
+                continue
+            plain = _ok(client.get(path))
+            negotiated = _ok(client.get(path, headers=ACCEPT_ENCODING))
+            transfer[name] = {
+                'identity_bytes': len(plain.get_data()),
+                'encoding': negotiated.headers.get('Content-Encoding', 'identity'),
+                'encoded_bytes': len(negotiated.get_data()),
+            }
+
+        etag = _ok(client.get(f'/api/notes/{note_ids[0]}')).headers['ETag']
+        results['get_not_modified'] = _measure(
+            lambda: _ok(client.get(f'/api/notes/{note_ids[0]}', headers={'If-None-Match': etag}), 304), repeat
+        )
+
+        # Sync: each push upserts `sync_batch` new notes and deletes the previous push's notes
+        pushed, clock = [], [0]
+
+        def sync_push():
+            clock[0] += 1
+            fresh = [factory.uuid() for _ in range(sync_batch)]
+            payload = {
+                'upserts': [factory.sync_upsert(note_id, _timestamp(clock[0])) for note_id in fresh],
+                'deletes': pushed[:],
+            }
+            _ok(client.post('/api/notes/sync', json=payload))
+            pushed[:] = fresh
+
+        results[f'sync_{sync_batch}_upserts_deletes'] = _measure(sync_push, max(repeat // 2, 5))
+
+        update_ids = note_ids[:sync_batch]
+
+        def sync_update():
+            clock[0] += 1
+            payload = {'upserts': [factory.sync_upsert(note_id, _timestamp(clock[0])) for note_id in update_ids]}
+            _ok(client.post('/api/notes/sync', json=payload))
+
+        results[f'sync_{sync_batch}_updates'] = _measure(sync_update, max(repeat // 2, 5))
+        # A client catching up from scratch: the first page of the change log
+        results['sync_full_pull'] = _measure(
+            lambda: _ok(client.post('/api/notes/sync', json={'upserts': [], 'deletes': [], 'since': 0})), repeat
+        )
+
+        body = '\n'.join(json.dumps(record) for record in factory.records(import_batch))
+
+        def import_run():
+            job = _ok(client.post('/api/notes/import', data=body, content_type='application/x-ndjson'), 202).get_json()
+            while job['status'] in ('pending', 'running'):
+                time.sleep(0.005)
+                job = _ok(client.get(f"/api/notes/import/{job['id']}")).get_json()
+            if job['status'] != 'completed':
+                raise RuntimeError(f'Import failed: {job}')
+
+        results[f'import_{import_batch}'] = _measure(import_run, 5, warmup=1)
+
+        results['export_ndjson'] = _measure(lambda: _ok(client.get('/api/notes/export')).get_data(), 5, warmup=1)
+        results['export_zip'] = _measure(lambda: _ok(client.get('/api/notes/export?format=zip')).get_data(), 5, warmup=1)
+
+    return {
+        'suite': 'api',
+        'profile': profile,
+        'app_config': config or {},
+        'library': {key: settings[key] for key in ('markdown', 'excalidraw', 'scene_elements')},
+        'seed_seconds': round(seed_seconds, 3),
+        'results': results,
+        'transfer': transfer,
+    }
@@ -1,13 +1,19 @@
 #!/bin/bash
 set -e
 
-echo "Ensuring database tables are created..."
+echo "Upgrading the database schema..."
 # Run database initialization synchronously before workers spawn
-python -c "from app.main import app; from app.extensions import db; \
-app.app_context().push(); \
-db.create_all()"
+# (applies migrations/ like `flask db upgrade`, then creates missing tables + search index;
+# SQLite PRAGMAs/WAL come from app.database).
+# app.bootstrap loads only the models and database setup, not the whole app.
+python -m app.bootstrap
+
+# Per-worker metric files are summed by /metrics; start every boot from a clean directory
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/fastnote-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
 echo "Starting Gunicorn server..."
 # The 'exec' command replaces the shell process with Gunicorn, 
 # ensuring OS signals (like SIGTERM) are passed directly to Gunicorn.
-exec gunicorn --bind 0.0.0.0:5000 -k gevent --preload --workers 4 app.main:app
\ No newline at end of file
+exec gunicorn --config gunicorn.conf.py --bind 0.0.0.0:5000 -k gevent --preload --workers 4 app.main:app
\ No newline at end of file
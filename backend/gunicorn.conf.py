@@ -0,0 +1,6 @@
+# Server hooks for gunicorn (bind address, worker class and count are set in entrypoint.sh)
+
+def child_exit(server, worker):
+    # Drop a dead worker's live gauges (e.g. in-flight requests) from /metrics
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,58 @@
+"""Baseline schema: users and notes as they were before migrations existed
+
+Databases created by `create_all` before this revision already have these
+tables, so each is only created when missing.
+
+Revision ID: 3f1c2a9b7d40
+Revises:
+Create Date: 2026-10-18 05:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('password_hash', sa.String(length=256), nullable=False),
+            sa.Column('subscription_status', sa.String(length=20), nullable=True),
+            sa.Column('dodo_customer_id', sa.String(length=100), nullable=True),
+            sa.Column('subscription_id', sa.String(length=100), nullable=True),
+            sa.Column('trial_ends_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_users_username', 'users', ['username'], unique=True)
+
+    if not _has_table('notes'):
+        op.create_table(
+            'notes',
+            sa.Column('id', sa.String(length=36), nullable=False),
+            sa.Column('title', sa.String(length=255), nullable=False),
+            sa.Column('content', sa.Text(), nullable=True),
+            sa.Column('type', sa.String(length=50), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    op.drop_table('notes')
+    op.drop_index('ix_users_username', table_name='users')
+    op.drop_table('users')
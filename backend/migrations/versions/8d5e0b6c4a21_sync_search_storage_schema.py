@@ -0,0 +1,189 @@
+"""Sync, search, import, webhook, sharding and maintenance schema
+
+Adds the columns the backlog series added to users and notes, their
+indexes, and the tables introduced alongside them. A database that
+`create_all` already brought up to date (no alembic_version table yet)
+passes through unchanged: every column, index and table is only added
+when missing.
+
+Run `flask notes-backfill-summaries` and `flask search-reindex` once
+afterwards to fill the summaries and the search index of existing notes.
+
+Revision ID: 8d5e0b6c4a21
+Revises: 3f1c2a9b7d40
+Create Date: 2026-10-18 05:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d5e0b6c4a21'
+down_revision = '3f1c2a9b7d40'
+branch_labels = None
+depends_on = None
+
+NEW_COLUMNS = {
+    'users': [
+        sa.Column('subscription_event_at', sa.DateTime(), nullable=True),
+        sa.Column('change_seq', sa.Integer(), nullable=False, server_default='0'),
+    ],
+    'notes': [
+        sa.Column('change_seq', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('content_size', sa.Integer(), nullable=True),
+        sa.Column('preview', sa.String(length=200), nullable=True),
+        sa.Column('content_hash', sa.String(length=64), nullable=True),
+    ],
+}
+
+NEW_INDEXES = [
+    ('ix_notes_user_change_seq', 'notes', ['user_id', 'change_seq']),
+    ('ix_notes_user_updated_id', 'notes', ['user_id', 'updated_at', 'id']),
+    ('ix_notes_user_id', 'notes', ['user_id', 'id']),
+]
+
+
+def _new_tables():
+    return {
+        'note_tombstones': (
+            [
+                sa.Column('note_id', sa.String(length=36), nullable=False),
+                sa.Column('user_id', sa.Integer(), nullable=False),
+                sa.Column('change_seq', sa.Integer(), nullable=False),
+                sa.Column('deleted_at', sa.DateTime(), nullable=True),
+                sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+                sa.PrimaryKeyConstraint('note_id'),
+            ],
+            [('ix_note_tombstones_user_change_seq', ['user_id', 'change_seq'])],
+        ),
+        'import_jobs': (
+            [
+                sa.Column('id', sa.String(length=36), nullable=False),
+                sa.Column('user_id', sa.Integer(), nullable=False),
+                sa.Column('status', sa.String(length=20), nullable=False),
+                sa.Column('received_bytes', sa.Integer(), nullable=False),
+                sa.Column('processed', sa.Integer(), nullable=False),
+                sa.Column('imported', sa.Integer(), nullable=False),
+                sa.Column('failed', sa.Integer(), nullable=False),
+                sa.Column('errors', sa.Text(), nullable=True),
+                sa.Column('message', sa.String(length=255), nullable=True),
+                sa.Column('created_at', sa.DateTime(), nullable=True),
+                sa.Column('finished_at', sa.DateTime(), nullable=True),
+                sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+                sa.PrimaryKeyConstraint('id'),
+            ],
+            [('ix_import_jobs_user_id', ['user_id'])],
+        ),
+        'webhook_events': (
+            [
+                sa.Column('webhook_id', sa.String(length=255), nullable=False),
+                sa.Column('event_type', sa.String(length=100), nullable=False),
+                sa.Column('payload', sa.Text(), nullable=False),
+                sa.Column('status', sa.String(length=20), nullable=False),
+                sa.Column('attempts', sa.Integer(), nullable=False),
+                sa.Column('last_error', sa.String(length=255), nullable=True),
+                sa.Column('event_at', sa.DateTime(), nullable=False),
+                sa.Column('received_at', sa.DateTime(), nullable=False),
+                sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+                sa.Column('processed_at', sa.DateTime(), nullable=True),
+                sa.PrimaryKeyConstraint('webhook_id'),
+            ],
+            [('ix_webhook_events_status_event_at', ['status', 'event_at'])],
+        ),
+        'note_files': (
+            [
+                sa.Column('user_id', sa.Integer(), nullable=False),
+                sa.Column('hash', sa.String(length=64), nullable=False),
+                sa.Column('mime_type', sa.String(length=100), nullable=False),
+                sa.Column('size', sa.Integer(), nullable=False),
+                sa.Column('data', sa.LargeBinary(), nullable=False),
+                sa.Column('created_at', sa.DateTime(), nullable=False),
+                sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+                sa.PrimaryKeyConstraint('user_id', 'hash'),
+            ],
+            [],
+        ),
+        'note_sequences': (
+            [
+                sa.Column('user_id', sa.Integer(), nullable=False),
+                sa.Column('change_seq', sa.Integer(), nullable=False),
+                sa.PrimaryKeyConstraint('user_id'),
+            ],
+            [],
+        ),
+        'tenant_shards': (
+            [
+                sa.Column('user_id', sa.Integer(), nullable=False),
+                sa.Column('shard', sa.String(length=64), nullable=False),
+                sa.Column('state', sa.String(length=10), nullable=False),
+                sa.Column('previous_shard', sa.String(length=64), nullable=True),
+                sa.Column('pinned', sa.Boolean(), nullable=False),
+                sa.Column('updated_at', sa.DateTime(), nullable=False),
+                sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+                sa.PrimaryKeyConstraint('user_id'),
+            ],
+            [],
+        ),
+        'maintenance_runs': (
+            [
+                sa.Column('id', sa.Integer(), nullable=False),
+                sa.Column('job', sa.String(length=20), nullable=False),
+                sa.Column('database', sa.String(length=64), nullable=False),
+                sa.Column('status', sa.String(length=10), nullable=False),
+                sa.Column('started_at', sa.DateTime(), nullable=False),
+                sa.Column('duration_ms', sa.Integer(), nullable=False),
+                sa.Column('bytes_reclaimed', sa.BigInteger(), nullable=False),
+                sa.Column('detail', sa.String(length=255), nullable=True),
+                sa.PrimaryKeyConstraint('id'),
+            ],
+            [('ix_maintenance_runs_job_database_started', ['job', 'database', 'started_at'])],
+        ),
+    }
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for table, columns in NEW_COLUMNS.items():
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        for column in columns:
+            if column.name not in existing:
+                op.add_column(table, column)
+
+    # Note bodies became binary (codec byte + payload, see app/models/types.py). SQLite
+    # stores either in the same column and old TEXT rows are read as they are; Postgres
+    # needs the column converted, each old body becoming a raw (0x00) payload.
+    if op.get_bind().dialect.name == 'postgresql':
+        content = next(column for column in inspector.get_columns('notes') if column['name'] == 'content')
+        if not isinstance(content['type'], sa.LargeBinary):
+            op.execute(
+                "ALTER TABLE notes ALTER COLUMN content TYPE BYTEA "
+                "USING CASE WHEN content IS NULL THEN NULL ELSE '\\x00'::bytea || convert_to(content, 'UTF8') END"
+            )
+
+    existing_indexes = {index['name'] for index in inspector.get_indexes('notes')}
+    for name, table, columns in NEW_INDEXES:
+        if name not in existing_indexes:
+            op.create_index(name, table, columns)
+
+    for table, (columns, indexes) in _new_tables().items():
+        if inspector.has_table(table):
+            continue
+        op.create_table(table, *columns)
+        for name, index_columns in indexes:
+            op.create_index(name, table, index_columns)
+
+
+def downgrade():
+    for table in reversed(list(_new_tables())):
+        op.drop_table(table)
+    for name, table, _ in NEW_INDEXES:
+        op.drop_index(name, table_name=table)
+    if op.get_bind().dialect.name == 'postgresql':
+        # Only raw bodies convert back: with compressed ones left, convert_from fails and nothing changes
+        op.execute("ALTER TABLE notes ALTER COLUMN content TYPE TEXT USING convert_from(substring(content from 2), 'UTF8')")
+    for table, columns in NEW_COLUMNS.items():
+        with op.batch_alter_table(table) as batch:
+            for column in columns:
+                batch.drop_column(column.name)